@@ -2,6 +2,12 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from fastapi import Depends
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from services.query_planner import listing_planner
+from services.tracing import TRACING_ENABLED, mongo_command_tracer
+from services.engagement import ENGAGEMENT_HOURLY_RETENTION_DAYS
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
@@ -9,13 +15,52 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[mongo_command_tracer] if TRACING_ENABLED else [])
 db = client[os.environ['DB_NAME']]
 
 def get_database():
     """Dependency to get database connection"""
     return db
 
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+def read_options(endpoint: str) -> dict:
+    """Read preference for an endpoint group, from READ_PREFERENCE[_<ENDPOINT>].
+
+    Anything but primary also gets a max staleness (READ_MAX_STALENESS_SECONDS
+    [_<ENDPOINT>], at least 90; -1 for none) and majority read concern, so a
+    lagging secondary is skipped and causal sessions survive failover.
+    """
+    suffix = endpoint.upper()
+    mode = os.environ.get(f"READ_PREFERENCE_{suffix}", os.environ.get("READ_PREFERENCE", "primary"))
+    if mode not in READ_PREFERENCE_MODES:
+        raise ValueError(f"Unknown read preference {mode!r} for {endpoint}")
+    if mode == "primary":
+        return {}
+
+    max_staleness = int(os.environ.get(
+        f"READ_MAX_STALENESS_SECONDS_{suffix}", os.environ.get("READ_MAX_STALENESS_SECONDS", "90")
+    ))
+    return {
+        "read_preference": READ_PREFERENCE_MODES[mode](max_staleness=max_staleness),
+        "read_concern": ReadConcern("majority")
+    }
+
+def read_database(endpoint: str):
+    """Dependency factory: the database handle an endpoint group reads from"""
+    options = read_options(endpoint)
+
+    def get_read_database(database=Depends(get_database)):
+        return database.with_options(**options) if options else database
+
+    return get_read_database
+
 async def init_database():
     """Initialize database with indexes and seed data"""
     try:
@@ -24,20 +69,58 @@ async def init_database():
         # Businesses collection indexes
         await db.businesses.create_index([("category", 1), ("is_active", 1)])
         await db.businesses.create_index([("address.city", 1), ("is_active", 1)])
+        await db.businesses.create_index([
+            ("address.city_key", 1),
+            ("address.neighborhood_key", 1),
+            ("is_active", 1)
+        ])
         await db.businesses.create_index([("rating_average", -1), ("total_reviews", -1)])
+        # One per supported listing filter and sort, see services/query_planner.py
+        await listing_planner.ensure_indexes(db.businesses)
         await db.businesses.create_index([("featured_position", 1)])
+        await db.businesses.create_index([("updated_at", 1)])
         await db.businesses.create_index([("name", "text"), ("description", "text")])
+        await db.businesses.create_index([
+            ("address.coordinates.lat", 1),
+            ("address.coordinates.lng", 1),
+            ("is_active", 1)
+        ])
         
         # Categories collection indexes
         await db.categories.create_index([("slug", 1)], unique=True)
         await db.categories.create_index([("is_active", 1)])
         
+        # Precomputed similar businesses, refreshed per category
+        await db.business_similar.create_index([("category", 1)])
+        await db.business_similar.create_index([("neighbors.id", 1)])
+        
+        # Materialized leaderboards
+        await db.leaderboards.create_index([("scope", 1), ("city_key", 1), ("neighborhood_key", 1), ("category", 1)])
+        await db.leaderboards.create_index([("entries.id", 1)])
+        
+        # Locations collection indexes
+        await db.locations.create_index([("kind", 1), ("city_key", 1)])
+        
         # Reviews collection indexes
         await db.reviews.create_index([("business_id", 1)])
         await db.reviews.create_index([("created_at", -1)])
         
+        # Engagement counter buckets; hourly ones expire, daily ones are kept
+        await db.engagement_hourly.create_index([("business_id", 1), ("bucket", 1)], unique=True)
+        await db.engagement_hourly.create_index(
+            [("bucket", 1)], expireAfterSeconds=ENGAGEMENT_HOURLY_RETENTION_DAYS * 24 * 3600
+        )
+        await db.engagement_daily.create_index([("business_id", 1), ("bucket", 1)], unique=True)
+        
+        # Scheduler run history, kept for two weeks
+        await db.scheduler_runs.create_index([("job", 1), ("started_at", -1)])
+        await db.scheduler_runs.create_index([("started_at", 1)], expireAfterSeconds=14 * 24 * 3600)
+        
         print("✅ Database indexes created successfully")
         
+        # Businesses written before edit versioning start at version 1
+        await db.businesses.update_many({"version": {"$exists": False}}, {"$set": {"version": 1}})
+        
     except Exception as e:
         print(f"❌ Error initializing database: {e}")
 
@@ -0,0 +1,220 @@
+import json
+import math
+import os
+import re
+import time
+from typing import Dict, List, Optional, Pattern, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit for one group of routes.
+
+    Every request that completes under the latency target grows the limit by
+    ``1 / limit`` (roughly +1 per window of requests); a slow or failed
+    request shrinks it multiplicatively, at most once per latency target so a
+    single burst of slow responses does not collapse the limit to the floor.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        priority: int,
+        target_latency: float,
+        initial_limit: int = 20,
+        min_limit: int = 2,
+        max_limit: int = 200,
+        decrease_factor: float = 0.7
+    ):
+        self.name = name
+        self.priority = priority
+        self.target_latency = target_latency
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.latency_ewma = target_latency / 2
+        self._last_decrease = 0.0
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def acquire(self):
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self, latency: float, failed: bool):
+        self.in_flight -= 1
+        self.latency_ewma = 0.9 * self.latency_ewma + 0.1 * latency
+
+        now = time.monotonic()
+        if failed or latency > self.target_latency:
+            if now - self._last_decrease >= self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def retry_after(self) -> int:
+        """Seconds a shed client should wait, based on observed latency"""
+        return max(1, math.ceil(self.latency_ewma * 2))
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "priority": self.priority,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1),
+            "target_latency_ms": round(self.target_latency * 1000, 1),
+        }
+
+class AdmissionController:
+    """Per-route-group admission control in front of MongoDB.
+
+    Requests are classified into groups; each group has its own adaptive
+    limit, and all groups share a global in-flight budget. Groups with a
+    higher ``priority`` number are more expensive and are shed earlier as the
+    global budget fills up, so cheap point reads keep working while search,
+    map and ``$lookup`` listings are being rejected.
+    """
+
+    def __init__(
+        self,
+        groups: List[AdaptiveLimiter],
+        rules: List[tuple],
+        global_limit: int,
+        shed_thresholds: Dict[int, float]
+    ):
+        self.groups = {group.name: group for group in groups}
+        # (method, path regex, group[, query parameter that must be present])
+        self.rules: List[Tuple[str, Pattern, str, Optional[bytes]]] = []
+        for method, pattern, group, *query_param in rules:
+            param = f"{query_param[0]}=".encode() if query_param else None
+            self.rules.append((method, re.compile(pattern), group, param))
+        self.global_limit = global_limit
+        self.shed_thresholds = shed_thresholds
+
+    @property
+    def in_flight(self) -> int:
+        return sum(group.in_flight for group in self.groups.values())
+
+    def classify(self, method: str, path: str, query_string: bytes) -> Optional[AdaptiveLimiter]:
+        for rule_method, pattern, group, param in self.rules:
+            if rule_method not in ("*", method) or not pattern.fullmatch(path):
+                continue
+            if param and not (query_string.startswith(param) or b"&" + param in query_string):
+                continue
+            return self.groups[group] if group != "exempt" else None
+        return None
+
+    def admit(self, group: AdaptiveLimiter) -> bool:
+        threshold = self.shed_thresholds.get(group.priority, 1.0)
+        if self.in_flight >= self.global_limit * threshold or not group.has_capacity():
+            group.shed += 1
+            return False
+        group.acquire()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "global_limit": self.global_limit,
+            "in_flight": self.in_flight,
+            "groups": [group.stats() for group in self.groups.values()],
+        }
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+# Point reads are the cheapest (priority 0); search, map, stats, home and the
+# category listings with their $lookup are the most expensive (priority 2)
+admission_controller = AdmissionController(
+    groups=[
+        AdaptiveLimiter("point", 0, target_latency=_env_float("ADMISSION_POINT_TARGET_MS", 50) / 1000, initial_limit=50),
+        AdaptiveLimiter("write", 1, target_latency=_env_float("ADMISSION_WRITE_TARGET_MS", 150) / 1000, initial_limit=20),
+        AdaptiveLimiter("list", 1, target_latency=_env_float("ADMISSION_LIST_TARGET_MS", 150) / 1000, initial_limit=30),
+        AdaptiveLimiter("expensive", 2, target_latency=_env_float("ADMISSION_EXPENSIVE_TARGET_MS", 400) / 1000, initial_limit=10),
+    ],
+    rules=[
+        ("GET", r"/api/stats/(rating-queue|cache|single-flight|admission|engagement)", "exempt"),
+        ("GET", r"/api/?", "exempt"),
+        ("*", r"/api/admin/.*", "exempt"),
+        ("GET", r"/api/businesses/?", "expensive", "search"),
+        ("GET", r"/api/map/.*", "expensive"),
+        ("GET", r"/api/home/?", "expensive"),
+        ("GET", r"/api/stats/?", "expensive"),
+        ("GET", r"/api/categories/?", "expensive"),
+        ("GET", r"/api/categories/popular/?", "expensive"),
+        ("GET", r"/api/businesses/((featured|trending)/?)?", "list"),
+        ("GET", r"/api/categories/[^/]+/businesses/?", "list"),
+        ("GET", r"/api/businesses/[^/]+/?", "point"),
+        ("GET", r"/api/businesses/[^/]+/similar/?", "point"),
+        ("GET", r"/api/media/.*", "point"),
+        ("GET", r"/api/categories/[^/]+/?", "point"),
+        ("GET", r"/api/.*", "list"),
+        # Ingestion only touches the in-memory buffer
+        ("POST", r"/api/events/?", "point"),
+        ("*", r"/api/.*", "write"),
+    ],
+    global_limit=int(os.environ.get("ADMISSION_GLOBAL_LIMIT", "100")),
+    shed_thresholds={
+        2: _env_float("ADMISSION_SHED_EXPENSIVE_AT", 0.6),
+        1: _env_float("ADMISSION_SHED_LIST_AT", 0.85),
+        0: 1.0,
+    }
+)
+
+class AdmissionControlMiddleware:
+    """ASGI middleware that sheds excess load with fast 503 + Retry-After"""
+
+    def __init__(self, app, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        group = self.controller.classify(scope["method"], scope["path"], scope.get("query_string", b""))
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not self.controller.admit(group):
+            await self._reject(send, group)
+            return
+
+        status = 500
+        started = time.monotonic()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            group.release(time.monotonic() - started, failed=status >= 500)
+
+    async def _reject(self, send, group: AdaptiveLimiter):
+        body = json.dumps({"detail": "Server is busy, please retry shortly"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(group.retry_after()).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
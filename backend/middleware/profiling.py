@@ -0,0 +1,66 @@
+import asyncio
+import os
+from urllib.parse import parse_qs
+from routes.admin import is_admin_token
+from services.profiler import ProfileStore, TaskProfiler, profile_store
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_PARAM = "_profile"
+PROFILE_MAX_CONCURRENT = int(os.environ.get("PROFILE_MAX_CONCURRENT", "4"))
+
+def profile_requested(headers: dict, query_string: bytes) -> bool:
+    if headers.get(PROFILE_HEADER, b"").lower() in (b"1", b"true"):
+        return True
+    values = parse_qs(query_string.decode("latin-1")).get(PROFILE_QUERY_PARAM, [])
+    return any(value.lower() in ("1", "true") for value in values)
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling single requests on demand.
+
+    A request with ``X-Profile: 1`` (or ``?_profile=1``) and a valid
+    X-Admin-Token is sampled from start to end of its response. The profile
+    is written to PROFILE_DIR and its file name returned in
+    ``X-Profile-File``. Anyone else's flag is ignored.
+    """
+
+    def __init__(self, app, store: ProfileStore = profile_store, max_concurrent: int = PROFILE_MAX_CONCURRENT):
+        self.app = app
+        self.store = store
+        self.max_concurrent = max_concurrent
+        self.active = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        if not profile_requested(headers, scope.get("query_string", b"")):
+            await self.app(scope, receive, send)
+            return
+        if not is_admin_token(headers.get(b"x-admin-token", b"").decode("latin-1")):
+            await self.app(scope, receive, send)
+            return
+        if self.active >= self.max_concurrent:
+            logger.warning(f"Not profiling {scope['path']}: {self.active} profiles already running")
+            await self.app(scope, receive, send)
+            return
+
+        name = self.store.new_name("request", f"{scope['method']} {scope['path']}")
+        profiler = TaskProfiler(asyncio.current_task(), name, self.store)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-file", name.encode())]}
+            await send(message)
+
+        self.active += 1
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            self.active -= 1
@@ -0,0 +1,56 @@
+import time
+from services.tracing import TRACING_ENABLED, current_span, start_request_span
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TracingMiddleware:
+    """ASGI middleware opening a server span per request.
+
+    Continues the caller's W3C ``traceparent`` and returns the request's
+    own context in ``traceresponse``. The span is renamed to the matched
+    route template once routing is done, and records the status code and
+    the time until response headers were sent.
+    """
+
+    def __init__(self, app, enabled: bool = TRACING_ENABLED):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        request_span = start_request_span(
+            f"{scope['method']} {scope['path']}",
+            headers.get(b"traceparent", b"").decode("latin-1"),
+            {"http.method": scope["method"], "http.target": scope["path"]}
+        )
+        token = current_span.set(request_span)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                request_span.set_attribute("http.status_code", message["status"])
+                request_span.set_attribute("http.headers_sent_ms", round(
+                    (time.time_ns() - request_span.start_ns) / 1e6, 3
+                ))
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(b"traceresponse", request_span.traceparent.encode())]
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            request_span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                request_span.name = f"{scope['method']} {route.path}"
+                request_span.set_attribute("http.route", route.path)
+            current_span.reset(token)
+            request_span.end()
@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
+import os
 
 class PyObjectId(ObjectId):
     @classmethod
@@ -62,12 +63,17 @@ class Business(BaseModel):
     # Ratings & Reviews
     rating_average: float = Field(default=0.0)
     total_reviews: int = Field(default=0)
+    bayesian_score: float = Field(default=0.0)  # rating shrunk toward the category mean
     
     # Status
     is_active: bool = Field(default=True)
     is_verified: bool = Field(default=False)
     featured_position: Optional[int] = None
     
+    # Incremented by every edit; clients send it back as expected_version
+    # for optimistic concurrency
+    version: int = Field(default=1)
+    
     # Timestamps
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -104,6 +110,18 @@ class BusinessUpdate(BaseModel):
     price_range: Optional[str] = None
     services: Optional[List[str]] = None
     is_active: Optional[bool] = None
+    featured_position: Optional[int] = None  # explicit null removes it from the featured list
+    expected_version: Optional[int] = None  # reject the edit if the business changed since
+
+# Images uploaded to the media store have a fixed-size "card" variant
+MEDIA_URL_PREFIX = os.environ.get("MEDIA_URL_PREFIX", "/api/media")
+
+def card_image_url(images: List[str]) -> Optional[str]:
+    """Thumbnail for list cards: the card variant of a stored image, else the first image"""
+    for image in images or []:
+        if image.startswith(MEDIA_URL_PREFIX + "/") and "/" not in image[len(MEDIA_URL_PREFIX) + 1:]:
+            return f"{image}/card"
+    return images[0] if images else None
 
 class BusinessResponse(BaseModel):
     id: str
@@ -117,6 +135,7 @@ class BusinessResponse(BaseModel):
     website: str
     address: Address
     images: List[str]
+    card_image: Optional[str] = None
     price_range: str
     services: List[str]
     rating_average: float
@@ -124,12 +143,45 @@ class BusinessResponse(BaseModel):
     is_active: bool
     is_verified: bool
     featured_position: Optional[int]
+    version: int = 1
     created_at: datetime
+    updated_at: Optional[datetime] = None
     
     @classmethod
     def from_mongo(cls, business_doc):
         """Convert MongoDB document to BusinessResponse"""
         if business_doc:
             business_doc["id"] = str(business_doc["_id"])
+            business_doc["card_image"] = card_image_url(business_doc.get("images"))
             return cls(**business_doc)
-        return None
\ No newline at end of file
+        return None
+
+class BusinessBulkUpdateItem(BusinessUpdate):
+    id: str
+
+class BusinessBulkUpdate(BaseModel):
+    items: List[BusinessBulkUpdateItem]
+
+class BusinessBulkUpdateResult(BaseModel):
+    id: str
+    status: str  # updated, invalid, not_found, conflict, failed
+    error: Optional[str] = None
+    business: Optional[BusinessResponse] = None
+
+class BusinessBulkUpdateResponse(BaseModel):
+    updated: int
+    failed: int
+    results: List[BusinessBulkUpdateResult]
+
+class SimilarBusinessResponse(BaseModel):
+    id: str
+    name: str
+    category: str
+    subcategory: str
+    neighborhood: str
+    city: str
+    price_range: str
+    rating_average: float
+    total_reviews: int
+    card_image: Optional[str] = None
+    score: float
@@ -0,0 +1,21 @@
+from pydantic import BaseModel
+from typing import Dict, List
+from datetime import datetime
+
+class EngagementEvent(BaseModel):
+    business_id: str
+    type: str  # view, phone_tap, whatsapp_click
+
+class EngagementBatch(BaseModel):
+    events: List[EngagementEvent]
+
+class EngagementBucket(BaseModel):
+    bucket: datetime
+    counts: Dict[str, int]
+
+class EngagementReport(BaseModel):
+    business_id: str
+    granularity: str  # hour, day
+    since: datetime
+    totals: Dict[str, int]
+    buckets: List[EngagementBucket]
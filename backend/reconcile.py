@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+import json
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from pathlib import Path
+from services.reconciliation import ReconciliationService
+
+# Load environment variables
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# MongoDB connection
+mongo_url = os.environ['MONGO_URL']
+client = AsyncIOMotorClient(mongo_url)
+db = client[os.environ['DB_NAME']]
+
+async def reconcile(only: str, dry_run: bool):
+    """Recompute denormalized counters and print the drift found"""
+    try:
+        print("🔎 Reconciling denormalized counters" + (" (dry run)" if dry_run else "") + "...")
+        service = ReconciliationService(db, dry_run=dry_run)
+        
+        if only == "categories":
+            report = {"categories": await service.reconcile_category_counts()}
+        elif only == "ratings":
+            report = {"business_ratings": await service.reconcile_business_ratings()}
+        else:
+            report = await service.reconcile_all()
+        
+        for name, result in report.items():
+            verb = "would fix" if dry_run else "fixed"
+            print(f"✅ {name}: checked {result['checked']}, {verb} {result['changed']} in {result['duration_seconds']}s")
+        print(json.dumps(report, indent=2, default=str))
+        
+    except Exception as e:
+        print(f"❌ Error reconciling counters: {e}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile denormalized counters with their source collections")
+    parser.add_argument("--only", choices=["categories", "ratings"], help="reconcile a single counter family")
+    parser.add_argument("--dry-run", action="store_true", help="report drift without writing")
+    args = parser.parse_args()
+    asyncio.run(reconcile(args.only, args.dry_run))
@@ -0,0 +1,63 @@
+import os
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from database import get_database
+from services.scheduler import scheduler
+from services.profiler import profile_store, continuous_profiler
+from services.tracing import exporter as trace_exporter
+from services.file_response import RangeFileResponse
+import logging
+
+logger = logging.getLogger(__name__)
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+def is_admin_token(token: Optional[str]) -> bool:
+    # Without a configured token the admin API is disabled
+    return bool(ADMIN_TOKEN and token and secrets.compare_digest(token, ADMIN_TOKEN))
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow the request only with the configured X-Admin-Token"""
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+@router.get("/jobs")
+async def get_jobs(
+    history: int = Query(10, ge=1, le=100),
+    db=Depends(get_database)
+):
+    """Get schedule, lease owner and recent runs of every background job"""
+    try:
+        return {
+            "worker_id": scheduler.worker_id,
+            "scheduler_running": scheduler.running,
+            "jobs": await scheduler.status(db, history)
+        }
+    except Exception as e:
+        logger.error(f"Error getting job status: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/profiles")
+async def get_profiles():
+    """List stored request and continuous profiles, newest first"""
+    return {
+        "directory": str(profile_store.directory),
+        "continuous": {"running": continuous_profiler.running, "hz": continuous_profiler.hz},
+        "profiles": profile_store.list()
+    }
+
+@router.get("/profiles/{name}")
+async def get_profile(name: str, request: Request):
+    """Download a profile in collapsed-stack format (open it in speedscope)"""
+    path = profile_store.path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return RangeFileResponse(request, str(path), "text/plain", etag=f'"{name}"')
+
+@router.get("/tracing")
+async def get_tracing():
+    """Get trace sampling and export counters"""
+    return trace_exporter.stats()
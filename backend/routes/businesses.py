@@ -1,91 +1,289 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from bson import ObjectId
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from typing import List, Optional
-from services.business_service import BusinessService
+from services.business_service import BusinessService, VersionConflict
 from services.category_service import CategoryService
-from models.business import BusinessCreate, BusinessUpdate, BusinessResponse
-from database import get_database
+from services.cache import TTLCache, CACHE_TTL_SECONDS, CACHE_FALLBACK_TTL_SECONDS
+from services.version_service import VersionService
+from services.similarity import SimilarityService, TOP_K
+from services.engagement import EngagementService
+from services.causal import causal_session, issue_causal_token
+from services.query_planner import listing_planner, UnsupportedQuery, SORTS, DEFAULT_SORT
+from services.response_cache import (
+    CachedPayload, payload_response, serve_cached_json, list_validators, make_etag,
+    validator_headers, is_not_modified, not_modified_response
+)
+from models.business import (
+    BusinessCreate, BusinessUpdate, BusinessResponse,
+    BusinessBulkUpdate, BusinessBulkUpdateResponse, SimilarBusinessResponse
+)
+from models.engagement import EngagementReport
+from database import get_database, read_database
+import os
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/businesses", tags=["businesses"])
 
+BULK_UPDATE_MAX_ITEMS = int(os.environ.get("BULK_UPDATE_MAX_ITEMS", "500"))
+
+# Serialized (and lazily precompressed) business listings
+listing_cache = TTLCache(
+    "business_listings",
+    ttl=CACHE_TTL_SECONDS,
+    fallback_ttl=CACHE_FALLBACK_TTL_SECONDS,
+    depends_on={"businesses": None},
+    maxsize=512
+)
+
 def get_business_service(db=Depends(get_database)):
     return BusinessService(db)
 
+def get_business_reader(db=Depends(read_database("businesses")), session=Depends(causal_session)):
+    return BusinessService(db, session)
+
 def get_category_service(db=Depends(get_database)):
     return CategoryService(db)
 
+def get_version_reader(db=Depends(read_database("businesses")), session=Depends(causal_session)):
+    return VersionService(db, session)
+
+def get_similarity_service(db=Depends(get_database)):
+    return SimilarityService(db)
+
+def get_engagement_service(db=Depends(read_database("businesses"))):
+    return EngagementService(db)
+
 @router.get("/", response_model=List[BusinessResponse])
 async def get_businesses(
+    request: Request,
     category: Optional[str] = Query(None, description="Filter by category"),
     city: Optional[str] = Query(None, description="Filter by city"),
+    neighborhood: Optional[str] = Query(None, description="Filter by neighborhood (requires city)"),
+    price_range: Optional[List[str]] = Query(None, description="Price ranges to include, e.g. $$"),
+    services: Optional[List[str]] = Query(None, description="Services offered"),
+    services_mode: str = Query("all", pattern="^(all|any)$", description="Match all or any of the services"),
+    is_verified: Optional[bool] = Query(None, description="Only verified (or unverified) businesses"),
+    min_rating: Optional[float] = Query(None, ge=0, le=5, description="Minimum average rating"),
     search: Optional[str] = Query(None, description="Search in business names and descriptions"),
+    sort: str = Query(DEFAULT_SORT, description=f"Sort order: {', '.join(SORTS)}"),
     limit: int = Query(20, ge=1, le=100, description="Number of results to return"),
     skip: int = Query(0, ge=0, description="Number of results to skip"),
-    business_service: BusinessService = Depends(get_business_service)
+    business_service: BusinessService = Depends(get_business_reader),
+    version_service: VersionService = Depends(get_version_reader)
 ):
-    """Get businesses with optional filtering and pagination"""
+    """Get businesses with optional filtering, sorting and pagination"""
     try:
-        businesses = await business_service.get_businesses(
+        plan = listing_planner.plan(
             category=category,
-            city=city, 
+            city=city,
+            neighborhood=neighborhood,
+            price_range=price_range,
+            services=services,
+            services_mode=services_mode,
+            is_verified=is_verified,
+            min_rating=min_rating,
             search=search,
-            limit=limit,
-            skip=skip
+            sort=sort
+        )
+    except UnsupportedQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        params = (
+            category, city, neighborhood, tuple(sorted(price_range or ())), tuple(sorted(services or ())),
+            services_mode, is_verified, min_rating, search, sort, limit, skip
+        )
+        versions = await version_service.get_versions("businesses")
+        headers, fresh = list_validators(request, "businesses", versions, params)
+        headers["X-Query-Plan"] = plan.index_name
+        if plan.warnings:
+            headers["X-Query-Warning"] = "; ".join(plan.warnings)
+        if fresh:
+            return not_modified_response(headers)
+
+        return await serve_cached_json(
+            request,
+            listing_cache,
+            params,
+            lambda: business_service.get_businesses(plan, limit=limit, skip=skip),
+            headers
         )
-        return businesses
     except Exception as e:
         logger.error(f"Error getting businesses: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/featured", response_model=List[BusinessResponse])
 async def get_featured_businesses(
+    request: Request,
     limit: int = Query(10, ge=1, le=50, description="Number of featured businesses to return"),
-    business_service: BusinessService = Depends(get_business_service)
+    business_service: BusinessService = Depends(get_business_reader),
+    version_service: VersionService = Depends(get_version_reader)
 ):
     """Get featured businesses for homepage"""
     try:
+        versions = await version_service.get_versions("businesses")
+        headers, fresh = list_validators(request, "featured", versions, (limit,))
+        if fresh:
+            return not_modified_response(headers)
+
         businesses = await business_service.get_featured_businesses(limit=limit)
-        return businesses
+        return payload_response(request, CachedPayload.from_data(businesses), headers)
     except Exception as e:
         logger.error(f"Error getting featured businesses: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.get("/trending", response_model=List[BusinessResponse])
+async def get_trending_businesses(
+    request: Request,
+    category: Optional[str] = Query(None, description="Filter by category"),
+    city: Optional[str] = Query(None, description="Filter by city"),
+    limit: int = Query(10, ge=1, le=50, description="Number of trending businesses to return"),
+    business_service: BusinessService = Depends(get_business_reader),
+    version_service: VersionService = Depends(get_version_reader)
+):
+    """Get businesses with the most recent, best-rated reviews (time-decayed)"""
+    # Served by a trend_score index for every category/city combination
+    plan = listing_planner.plan(category=category, city=city, sort="trending")
+
+    try:
+        versions = await version_service.get_versions("businesses")
+        headers, fresh = list_validators(request, "trending", versions, (category, city, limit))
+        headers["X-Query-Plan"] = plan.index_name
+        if fresh:
+            return not_modified_response(headers)
+
+        return await serve_cached_json(
+            request,
+            listing_cache,
+            ("trending", category, city, limit),
+            lambda: business_service.get_businesses(plan, limit=limit),
+            headers
+        )
+    except Exception as e:
+        logger.error(f"Error getting trending businesses: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.get("/{business_id}", response_model=BusinessResponse)
 async def get_business(
     business_id: str,
-    business_service: BusinessService = Depends(get_business_service)
+    request: Request,
+    response: Response,
+    business_service: BusinessService = Depends(get_business_reader)
 ):
     """Get single business by ID"""
     try:
-        business = await business_service.get_business_by_id(business_id)
-        if not business:
+        record = business_service.get_business_record(business_id)
+        if record is not None:
+            etag = make_etag("business", ObjectId(record.id), record.last_modified)
+            headers = validator_headers(etag, record.last_modified)
+            if is_not_modified(request, etag, record.last_modified):
+                return not_modified_response(headers)
+            return payload_response(request, CachedPayload(record.json), headers)
+
+        business_doc = await business_service.get_business_document(business_id)
+        if not business_doc:
             raise HTTPException(status_code=404, detail="Business not found")
-        return business
+
+        # Validators come from the raw document, so a 304 skips building the model
+        last_modified = business_doc.get("updated_at") or business_doc.get("created_at")
+        etag = make_etag("business", business_doc["_id"], last_modified)
+        headers = validator_headers(etag, last_modified)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(headers)
+
+        response.headers.update(headers)
+        return BusinessResponse.from_mongo(business_doc)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error getting business {business_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.get("/{business_id}/similar", response_model=List[SimilarBusinessResponse])
+async def get_similar_businesses(
+    business_id: str,
+    limit: int = Query(TOP_K, ge=1, le=TOP_K, description="Number of similar businesses to return"),
+    similarity_service: SimilarityService = Depends(get_similarity_service)
+):
+    """Get businesses similar to this one, precomputed per category"""
+    try:
+        similar = await similarity_service.get_similar(business_id, limit)
+        if similar is None:
+            raise HTTPException(status_code=404, detail="Business not found")
+        return similar
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting similar businesses for {business_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/{business_id}/engagement", response_model=EngagementReport)
+async def get_business_engagement(
+    business_id: str,
+    granularity: str = Query("day", pattern="^(hour|day)$", description="Bucket size: hour or day"),
+    days: int = Query(30, ge=1, le=366, description="How many days back to report"),
+    engagement_service: EngagementService = Depends(get_engagement_service)
+):
+    """Get views, phone taps and WhatsApp clicks per hour or day"""
+    if not ObjectId.is_valid(business_id):
+        raise HTTPException(status_code=404, detail="Business not found")
+    try:
+        since = datetime.utcnow() - timedelta(days=days)
+        report = await engagement_service.get_report(business_id, granularity, since)
+        if report is None:
+            raise HTTPException(status_code=404, detail="Business not found")
+        return report
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting engagement for business {business_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.post("/", response_model=BusinessResponse)
 async def create_business(
     business_data: BusinessCreate,
+    response: Response,
     business_service: BusinessService = Depends(get_business_service)
 ):
     """Create a new business"""
     try:
         business = await business_service.create_business(business_data)
+        await issue_causal_token(business_service.db, response)
         return business
     except Exception as e:
         logger.error(f"Error creating business: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.post("/bulk-update", response_model=BusinessBulkUpdateResponse)
+async def bulk_update_businesses(
+    bulk_data: BusinessBulkUpdate,
+    response: Response,
+    business_service: BusinessService = Depends(get_business_service)
+):
+    """Apply many business patches (e.g. featured reorders) in one write"""
+    if not bulk_data.items:
+        raise HTTPException(status_code=400, detail="No items to update")
+    if len(bulk_data.items) > BULK_UPDATE_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_UPDATE_MAX_ITEMS} items per request")
+
+    try:
+        results = await business_service.bulk_update_businesses(bulk_data.items)
+        updated = sum(1 for result in results if result.status == "updated")
+        if updated:
+            await issue_causal_token(business_service.db, response)
+        return BusinessBulkUpdateResponse(updated=updated, failed=len(results) - updated, results=results)
+    except Exception as e:
+        logger.error(f"Error bulk updating businesses: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.put("/{business_id}", response_model=BusinessResponse)
 async def update_business(
     business_id: str,
     update_data: BusinessUpdate,
+    response: Response,
     business_service: BusinessService = Depends(get_business_service)
 ):
     """Update business information"""
@@ -93,7 +291,10 @@ async def update_business(
         business = await business_service.update_business(business_id, update_data)
         if not business:
             raise HTTPException(status_code=404, detail="Business not found")
+        await issue_causal_token(business_service.db, response)
         return business
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
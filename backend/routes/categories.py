@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from typing import List
 from services.category_service import CategoryService
 from services.business_service import BusinessService
+from services.category_service import categories_cache
+from services.version_service import VersionService
+from services.causal import causal_session, issue_causal_token
+from services.response_cache import (
+    CachedPayload, payload_response, serve_cached_json, list_validators, not_modified_response
+)
 from models.category import CategoryCreate, CategoryResponse
 from models.business import BusinessResponse
-from database import get_database
+from database import get_database, read_database
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,29 +20,56 @@ router = APIRouter(prefix="/categories", tags=["categories"])
 def get_category_service(db=Depends(get_database)):
     return CategoryService(db)
 
-def get_business_service(db=Depends(get_database)):
-    return BusinessService(db)
+def get_category_reader(db=Depends(read_database("categories")), session=Depends(causal_session)):
+    return CategoryService(db, session)
+
+def get_business_reader(db=Depends(read_database("categories")), session=Depends(causal_session)):
+    return BusinessService(db, session)
+
+def get_version_reader(db=Depends(read_database("categories")), session=Depends(causal_session)):
+    return VersionService(db, session)
 
 @router.get("/", response_model=List[CategoryResponse])
 async def get_categories(
-    category_service: CategoryService = Depends(get_category_service)
+    request: Request,
+    category_service: CategoryService = Depends(get_category_reader),
+    version_service: VersionService = Depends(get_version_reader)
 ):
     """Get all categories with business counts"""
     try:
-        categories = await category_service.get_all_categories()
-        return categories
+        versions = await version_service.get_versions("categories", "businesses")
+        headers, fresh = list_validators(request, "categories", versions)
+        if fresh:
+            return not_modified_response(headers)
+
+        return await serve_cached_json(
+            request,
+            categories_cache,
+            "all:payload",
+            category_service.get_all_categories,
+            headers
+        )
     except Exception as e:
         logger.error(f"Error getting categories: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/popular", response_model=List[CategoryResponse])
 async def get_popular_categories(
+    request: Request,
+    response: Response,
     limit: int = Query(10, ge=1, le=20, description="Number of popular categories to return"),
-    category_service: CategoryService = Depends(get_category_service)
+    category_service: CategoryService = Depends(get_category_reader),
+    version_service: VersionService = Depends(get_version_reader)
 ):
     """Get most popular categories by business count"""
     try:
+        versions = await version_service.get_versions("categories", "businesses")
+        headers, fresh = list_validators(request, "popular_categories", versions, (limit,))
+        if fresh:
+            return not_modified_response(headers)
+
         categories = await category_service.get_popular_categories(limit=limit)
+        response.headers.update(headers)
         return categories
     except Exception as e:
         logger.error(f"Error getting popular categories: {e}")
@@ -45,13 +78,24 @@ async def get_popular_categories(
 @router.get("/{category_slug}", response_model=CategoryResponse)
 async def get_category(
     category_slug: str,
-    category_service: CategoryService = Depends(get_category_service)
+    request: Request,
+    response: Response,
+    category_service: CategoryService = Depends(get_category_reader),
+    version_service: VersionService = Depends(get_version_reader)
 ):
     """Get category by slug"""
     try:
+        # Categories carry no per-document timestamp, so the collection
+        # version validates single categories too
+        versions = await version_service.get_versions("categories")
+        headers, fresh = list_validators(request, f"category:{category_slug}", versions)
+        if fresh:
+            return not_modified_response(headers)
+
         category = await category_service.get_category_by_slug(category_slug)
         if not category:
             raise HTTPException(status_code=404, detail="Category not found")
+        response.headers.update(headers)
         return category
     except HTTPException:
         raise
@@ -62,13 +106,20 @@ async def get_category(
 @router.get("/{category_slug}/businesses", response_model=List[BusinessResponse])
 async def get_businesses_by_category(
     category_slug: str,
+    request: Request,
     limit: int = Query(20, ge=1, le=100, description="Number of businesses to return"),
-    business_service: BusinessService = Depends(get_business_service)
+    business_service: BusinessService = Depends(get_business_reader),
+    version_service: VersionService = Depends(get_version_reader)
 ):
     """Get businesses in a specific category"""
     try:
+        versions = await version_service.get_versions("businesses")
+        headers, fresh = list_validators(request, f"category_businesses:{category_slug}", versions, (limit,))
+        if fresh:
+            return not_modified_response(headers)
+
         businesses = await business_service.get_businesses_by_category(category_slug, limit=limit)
-        return businesses
+        return payload_response(request, CachedPayload.from_data(businesses), headers)
     except Exception as e:
         logger.error(f"Error getting businesses for category {category_slug}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -76,11 +127,13 @@ async def get_businesses_by_category(
 @router.post("/", response_model=CategoryResponse)
 async def create_category(
     category_data: CategoryCreate,
+    response: Response,
     category_service: CategoryService = Depends(get_category_service)
 ):
     """Create a new category"""
     try:
         category = await category_service.create_category(category_data)
+        await issue_causal_token(category_service.db, response)
         return category
     except Exception as e:
         logger.error(f"Error creating category: {e}")
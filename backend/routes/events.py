@@ -0,0 +1,45 @@
+import math
+import os
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from services.engagement import EVENT_TYPES, active_business_ids, engagement_buffer
+from models.engagement import EngagementBatch
+from database import get_database
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+EVENTS_MAX_PER_REQUEST = int(os.environ.get("EVENTS_MAX_PER_REQUEST", "100"))
+
+@router.post("/", status_code=202)
+async def ingest_events(batch: EngagementBatch, db=Depends(get_database)):
+    """Buffer engagement events (views, phone taps, WhatsApp clicks) for aggregation"""
+    if not batch.events:
+        raise HTTPException(status_code=400, detail="No events")
+    if len(batch.events) > EVENTS_MAX_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"At most {EVENTS_MAX_PER_REQUEST} events per request")
+    for event in batch.events:
+        if event.type not in EVENT_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unknown event type {event.type!r}")
+        if not ObjectId.is_valid(event.business_id):
+            raise HTTPException(status_code=400, detail=f"Invalid business id {event.business_id!r}")
+
+    try:
+        active = await active_business_ids(db, (ObjectId(event.business_id) for event in batch.events))
+    except Exception as e:
+        logger.error(f"Error checking event businesses: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    # Unknown or inactive businesses would create buckets nobody can read
+    known = [event for event in batch.events if ObjectId(event.business_id) in active]
+
+    if not engagement_buffer.record((event.business_id, event.type) for event in known):
+        # Buffer full (or not flushing): shed instead of growing without bound
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Event buffer is full, please retry shortly"},
+            headers={"Retry-After": str(math.ceil(engagement_buffer.flush_seconds))}
+        )
+    return {"accepted": len(known), "ignored": len(batch.events) - len(known)}
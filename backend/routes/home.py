@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, Query
+import asyncio
+from services.business_service import BusinessService
+from services.category_service import CategoryService
+from services.stats_service import StatsService
+from database import get_database
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/home", tags=["home"])
+
+SECTION_TIMEOUT_SECONDS = float(os.environ.get("HOME_SECTION_TIMEOUT_SECONDS", "2.0"))
+
+async def _load_section(name: str, coro, timeout: float):
+    try:
+        return name, await asyncio.wait_for(coro, timeout), None
+    except asyncio.TimeoutError:
+        logger.warning(f"Home section '{name}' timed out after {timeout}s")
+        return name, None, "timeout"
+    except Exception as e:
+        logger.error(f"Error loading home section '{name}': {e}")
+        return name, None, "error"
+
+@router.get("/")
+async def get_home(
+    categories_limit: int = Query(10, ge=1, le=20, description="Number of popular categories"),
+    featured_limit: int = Query(10, ge=1, le=50, description="Number of featured businesses"),
+    timeout: float = Query(SECTION_TIMEOUT_SECONDS, gt=0, le=10, description="Per-section timeout in seconds"),
+    db=Depends(get_database)
+):
+    """Get everything the landing page needs in one request.
+
+    Sections are loaded concurrently, each with its own timeout; a section that
+    fails or times out is returned as null and listed in ``errors``.
+    """
+    business_service = BusinessService(db)
+    category_service = CategoryService(db)
+    stats_service = StatsService(db)
+
+    results = await asyncio.gather(
+        _load_section("categories", category_service.get_popular_categories(limit=categories_limit), timeout),
+        _load_section("featured", business_service.get_featured_businesses(limit=featured_limit), timeout),
+        _load_section("stats", stats_service.get_platform_stats(), timeout),
+        _load_section("pins", business_service.get_map_pins(), timeout)
+    )
+
+    response = {"errors": {}}
+    for name, value, error in results:
+        response[name] = value
+        if error:
+            response["errors"][name] = error
+    response["partial"] = bool(response["errors"])
+
+    return response
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from services.leaderboard_service import LeaderboardService
+from database import get_database
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/leaderboards", tags=["leaderboards"])
+
+def get_leaderboard_service(db=Depends(get_database)):
+    return LeaderboardService(db)
+
+@router.get("/")
+async def get_leaderboards(
+    category: Optional[str] = Query(None, description="Only this category's leaderboard"),
+    city: Optional[str] = Query(None, description="Rank within a city"),
+    neighborhood: Optional[str] = Query(None, description="Rank within a neighborhood of the city"),
+    leaderboard_service: LeaderboardService = Depends(get_leaderboard_service)
+):
+    """Get top businesses per category by Bayesian score, with medals for the top 3"""
+    if neighborhood and not city:
+        raise HTTPException(status_code=400, detail="neighborhood requires city")
+    try:
+        return await leaderboard_service.get_leaderboards(category, city, neighborhood)
+    except Exception as e:
+        logger.error(f"Error getting leaderboards: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
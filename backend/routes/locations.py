@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from services.location_service import LocationService
+from database import get_database
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/locations", tags=["locations"])
+
+def get_location_service(db=Depends(get_database)):
+    return LocationService(db)
+
+@router.get("/")
+async def get_locations(
+    city: Optional[str] = Query(None, description="Only this city"),
+    location_service: LocationService = Depends(get_location_service)
+):
+    """Get cities and their neighborhoods with business counts per category"""
+    try:
+        return await location_service.get_locations(city=city)
+    except Exception as e:
+        logger.error(f"Error getting locations: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
@@ -1,26 +1,129 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
 from typing import List, Optional
 from services.business_service import BusinessService
-from database import get_database
+from services.causal import causal_session
+from services.map_tiles import MapTileService, MAX_ZOOM
+from services.pin_snapshot import pin_snapshot
+from services.heatmap import heatmap_service
+from services.response_cache import is_not_modified, not_modified_response
+from services.cache import TTLCache, CACHE_TTL_SECONDS, CACHE_FALLBACK_TTL_SECONDS
+from services.response_cache import serve_cached_json
+from database import get_database, read_database
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/map", tags=["map"])
 
-def get_business_service(db=Depends(get_database)):
-    return BusinessService(db)
+pins_cache = TTLCache(
+    "map_pins",
+    ttl=CACHE_TTL_SECONDS,
+    fallback_ttl=CACHE_FALLBACK_TTL_SECONDS,
+    depends_on={"businesses": ["category", "address", "is_active"]},
+    maxsize=128
+)
+
+def get_business_reader(db=Depends(read_database("map")), session=Depends(causal_session)):
+    return BusinessService(db, session)
+
+def get_map_tile_service(db=Depends(get_database)):
+    return MapTileService(db)
 
 @router.get("/pins")
 async def get_map_pins(
+    request: Request,
     category: Optional[str] = Query(None, description="Filter by category"),
     city: Optional[str] = Query(None, description="Filter by city"),
-    business_service: BusinessService = Depends(get_business_service)
+    neighborhood: Optional[str] = Query(None, description="Filter by neighborhood"),
+    business_service: BusinessService = Depends(get_business_reader)
 ):
     """Get aggregated map pins data for visualization"""
     try:
-        pins = await business_service.get_map_pins(category=category, city=city)
-        return pins
+        return await serve_cached_json(
+            request,
+            pins_cache,
+            (category, city, neighborhood),
+            lambda: business_service.get_map_pins(category=category, city=city, neighborhood=neighborhood)
+        )
     except Exception as e:
         logger.error(f"Error getting map pins: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/tiles/{z}/{x}/{y}")
+async def get_map_tile(
+    request: Request,
+    z: int = Path(..., ge=0, le=MAX_ZOOM, description="Zoom level"),
+    x: int = Path(..., ge=0, description="Tile column"),
+    y: int = Path(..., ge=0, description="Tile row"),
+    category: Optional[str] = Query(None, description="Filter by category"),
+    map_tile_service: MapTileService = Depends(get_map_tile_service)
+):
+    """Get the businesses (or clusters) inside one slippy-map tile, packed as binary"""
+    if x >= 2 ** z or y >= 2 ** z:
+        raise HTTPException(status_code=404, detail="Tile out of range")
+
+    try:
+        body, etag = await map_tile_service.get_tile(z, x, y, category)
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+        if is_not_modified(request, etag):
+            return not_modified_response(headers)
+        return Response(content=body, media_type="application/vnd.asteria.tile", headers=headers)
+    except Exception as e:
+        logger.error(f"Error getting map tile {z}/{x}/{y}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+def _snapshot_response(body: bytes) -> Response:
+    return Response(
+        content=body,
+        media_type="application/vnd.asteria.snapshot",
+        headers={"X-Snapshot-Version": pin_snapshot.version_token, "Cache-Control": "no-cache"}
+    )
+
+@router.get("/snapshot")
+async def get_map_snapshot(db=Depends(get_database)):
+    """Get every active business location as a columnar binary snapshot"""
+    try:
+        await pin_snapshot.ensure_loaded(db)
+        return _snapshot_response(pin_snapshot.full_payload())
+    except Exception as e:
+        logger.error(f"Error getting map snapshot: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/snapshot/delta")
+async def get_map_snapshot_delta(
+    since: str = Query(..., description="X-Snapshot-Version the client already has"),
+    db=Depends(get_database)
+):
+    """Get the rows changed since a snapshot version (full snapshot if too old)"""
+    try:
+        await pin_snapshot.ensure_loaded(db)
+        body = pin_snapshot.delta_payload(since)
+        return _snapshot_response(body if body is not None else pin_snapshot.full_payload())
+    except Exception as e:
+        logger.error(f"Error getting map snapshot delta: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/heatmap")
+async def get_map_heatmap(
+    category: Optional[str] = Query(None, description="Filter by category"),
+    bbox: Optional[str] = Query(None, description="west,south,east,north (defaults to the metro area)"),
+    resolution: int = Query(64, ge=8, le=256, description="Grid cells per side"),
+    db=Depends(get_database)
+):
+    """Get a business density grid for the heatmap overlay"""
+    bounds = None
+    if bbox:
+        try:
+            bounds = tuple(float(value) for value in bbox.split(","))
+        except ValueError:
+            bounds = ()
+        if len(bounds) != 4 or bounds[0] >= bounds[2] or bounds[1] >= bounds[3]:
+            raise HTTPException(status_code=400, detail="bbox must be west,south,east,north")
+
+    try:
+        await pin_snapshot.ensure_loaded(db)
+        return heatmap_service.get_grid(category, resolution, bounds).to_dict()
+    except Exception as e:
+        logger.error(f"Error getting heatmap: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
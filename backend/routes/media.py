@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
+from services.media_store import MediaService, InvalidImage, VARIANTS, is_media_id, original_path, variant_path
+from services.file_response import RangeFileResponse
+from database import get_database
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+def get_media_service(db=Depends(get_database)):
+    return MediaService(db)
+
+@router.post("/")
+async def upload_media(
+    file: UploadFile = File(...),
+    media_service: MediaService = Depends(get_media_service)
+):
+    """Upload an image; returns its URL and thumbnail URLs"""
+    try:
+        return await media_service.store_upload(file)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error storing upload: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/{media_id}")
+async def get_media(
+    media_id: str,
+    request: Request,
+    media_service: MediaService = Depends(get_media_service)
+):
+    """Serve an original image (supports range requests)"""
+    media_doc = await media_service.get_original(media_id)
+    if not media_doc:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    return RangeFileResponse(
+        request,
+        str(original_path(media_id, media_doc["extension"])),
+        media_doc["content_type"],
+        etag=f'"{media_id}"'
+    )
+
+@router.get("/{media_id}/{variant}")
+async def get_media_variant(media_id: str, variant: str, request: Request):
+    """Serve a thumbnail; the path is derived from the id, so no lookup is needed"""
+    if variant not in VARIANTS or not is_media_id(media_id):
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    return RangeFileResponse(
+        request,
+        str(variant_path(media_id, variant)),
+        "image/jpeg",
+        etag=f'"{media_id}-{variant}"'
+    )
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from services.review_service import ReviewService
+from services.causal import issue_causal_token
+from models.review import ReviewCreate, ReviewResponse
+from database import get_database
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/reviews", tags=["reviews"])
+
+def get_review_service(db=Depends(get_database)):
+    return ReviewService(db)
+
+@router.post("/", response_model=ReviewResponse)
+async def create_review(
+    review_data: ReviewCreate,
+    response: Response,
+    review_service: ReviewService = Depends(get_review_service)
+):
+    """Create a review; the business rating is recomputed in the background"""
+    try:
+        review = await review_service.create_review(review_data)
+        if not review:
+            raise HTTPException(status_code=404, detail="Business not found")
+        await issue_causal_token(review_service.db, response)
+        return review
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating review: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
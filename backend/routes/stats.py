@@ -1,45 +1,57 @@
 from fastapi import APIRouter, Depends, HTTPException
 from database import get_database
+from services.rating_queue import rating_queue
+from services.engagement import engagement_buffer
+from services.cache import cache_registry, invalidation_bus
+from services.single_flight import flight_registry
+from services.stats_service import StatsService
+from middleware.admission import admission_controller
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/stats", tags=["statistics"])
 
+def get_stats_service(db=Depends(get_database)):
+    return StatsService(db)
+
 @router.get("/")
-async def get_platform_stats(db=Depends(get_database)):
+async def get_platform_stats(
+    stats_service: StatsService = Depends(get_stats_service)
+):
     """Get platform statistics for homepage"""
     try:
-        # Count total businesses
-        total_businesses = await db.businesses.count_documents({"is_active": True})
-        
-        # Count total reviews
-        total_reviews = await db.reviews.count_documents({})
-        
-        # Count cities (distinct)
-        cities = await db.businesses.distinct("address.city", {"is_active": True})
-        total_cities = len(cities)
-        
-        # Calculate average rating across all businesses
-        pipeline = [
-            {"$match": {"is_active": True, "total_reviews": {"$gt": 0}}},
-            {"$group": {
-                "_id": None,
-                "avg_platform_rating": {"$avg": "$rating_average"}
-            }}
-        ]
-        
-        result = await db.businesses.aggregate(pipeline).to_list(1)
-        avg_rating = round(result[0]["avg_platform_rating"], 1) if result else 0.0
-        
-        return {
-            "total_businesses": total_businesses,
-            "total_reviews": total_reviews,
-            "total_cities": total_cities,
-            "average_rating": avg_rating,
-            "cities": cities
-        }
-        
+        return await stats_service.get_platform_stats()
     except Exception as e:
         logger.error(f"Error getting platform stats: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/rating-queue")
+async def get_rating_queue_metrics():
+    """Get depth and lag metrics of the background rating recompute queue"""
+    return rating_queue.metrics()
+
+@router.get("/engagement")
+async def get_engagement_metrics():
+    """Get depth, flush and backpressure metrics of the engagement event buffer"""
+    return engagement_buffer.metrics()
+
+@router.get("/cache")
+async def get_cache_metrics():
+    """Get per-worker cache statistics and change-stream status"""
+    return {
+        "change_stream_active": invalidation_bus.stream_active,
+        "events_published": invalidation_bus.published_total,
+        "caches": [cache.stats() for cache in cache_registry]
+    }
+
+@router.get("/single-flight")
+async def get_single_flight_metrics():
+    """Get hit and wait metrics of the request coalescing layer"""
+    return [flight.stats() for flight in flight_registry]
+
+
+@router.get("/admission")
+async def get_admission_metrics():
+    """Get adaptive concurrency limits and shed counts per route group"""
+    return admission_controller.stats()
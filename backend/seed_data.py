@@ -4,6 +4,8 @@ from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from pathlib import Path
+from services.location_service import LocationService, with_location_keys
+from services.reconciliation import ReconciliationService
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
@@ -352,6 +354,8 @@ async def seed_database():
         
         # Insert businesses
         if businesses_data:
+            for business in businesses_data:
+                business["address"] = with_location_keys(business["address"])
             result = await db.businesses.insert_many(businesses_data)
             business_ids = result.inserted_ids
             print(f"✅ Inserted {len(business_ids)} businesses")
@@ -365,18 +369,20 @@ async def seed_database():
                 print(f"✅ Inserted {len(reviews_data)} reviews")
         
         # Update category business counts
-        categories = await db.categories.find({}).to_list(length=100)
-        for category in categories:
-            count = await db.businesses.count_documents({
-                "category": category["name"], 
-                "is_active": True
-            })
-            await db.categories.update_one(
-                {"_id": category["_id"]},
-                {"$set": {"business_count": count}}
-            )
+        await ReconciliationService(db).reconcile_category_counts()
         
         print("✅ Updated category business counts")
+        
+        await LocationService(db).rebuild()
+        print("✅ Built location hierarchy")
+        
+        # Invalidate HTTP validators (ETags) handed out for the old data
+        for name in ("businesses", "categories", "reviews"):
+            await db.collection_versions.update_one(
+                {"_id": name},
+                {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True
+            )
         print("🎉 Database seeded successfully!")
         
     except Exception as e:
@@ -10,7 +10,30 @@ from routes.businesses import router as businesses_router
 from routes.categories import router as categories_router
 from routes.map import router as map_router
 from routes.stats import router as stats_router
-from database import init_database, close_database
+from routes.reviews import router as reviews_router
+from routes.home import router as home_router
+from routes.locations import router as locations_router
+from routes.admin import router as admin_router
+from routes.media import router as media_router
+from routes.leaderboards import router as leaderboards_router
+from routes.events import router as events_router
+from database import db, init_database, close_database
+from services.business_service import BusinessService
+from services.location_service import LocationService
+from services.rating_queue import rating_queue
+from services.engagement import engagement_buffer
+from services.pin_snapshot import pin_snapshot
+from services.read_model import read_model, READ_MODEL_ENABLED
+from services.change_stream import ChangeStreamWatcher
+from services.scheduler import scheduler
+from services.jobs import register_jobs
+from services.media_store import shutdown_pool as shutdown_media_pool
+from middleware.admission import AdmissionControlMiddleware
+from middleware.compression import CompressionMiddleware
+from middleware.profiling import ProfilingMiddleware
+from middleware.tracing import TracingMiddleware
+from services.profiler import continuous_profiler
+from services.tracing import TRACING_ENABLED, exporter as trace_exporter
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -35,10 +58,27 @@ api_router.include_router(businesses_router)
 api_router.include_router(categories_router)
 api_router.include_router(map_router)
 api_router.include_router(stats_router)
+api_router.include_router(reviews_router)
+api_router.include_router(home_router)
+api_router.include_router(locations_router)
+api_router.include_router(admin_router)
+api_router.include_router(media_router)
+api_router.include_router(leaderboards_router)
+api_router.include_router(events_router)
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# gzip/brotli for dynamic responses; cached payloads arrive precompressed
+app.add_middleware(CompressionMiddleware)
+
+# Admin-requested per-request profiles (X-Profile: 1 with X-Admin-Token)
+app.add_middleware(ProfilingMiddleware)
+
+# Admission control / load shedding (added before CORS so shed responses
+# still carry CORS headers)
+app.add_middleware(AdmissionControlMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -46,8 +86,14 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Causal-Token", "X-Query-Plan", "X-Query-Warning", "X-Profile-File", "X-Snapshot-Version", "traceresponse"
+    ],
 )
 
+# Outermost, so request spans cover every other middleware
+app.add_middleware(TracingMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -55,16 +101,54 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Cross-worker cache invalidation (needs a replica set; falls back to TTLs)
+change_stream_watcher = ChangeStreamWatcher(db)
+
+# Maintenance jobs; each occurrence runs on exactly one worker
+register_jobs(scheduler)
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
     await init_database()
+    try:
+        await LocationService(db).ensure_initialized()
+    except Exception as e:
+        # Location filters fall back to whatever keys and counts exist
+        logger.error(f"Error initializing locations: {e}")
+    rating_queue.start(BusinessService(db).update_business_rating)
+    engagement_buffer.start(db)
+    try:
+        await pin_snapshot.ensure_loaded(db)
+    except Exception as e:
+        # Map endpoints load it on their first request instead
+        logger.error(f"Error loading pin snapshot: {e}")
+    if READ_MODEL_ENABLED:
+        try:
+            await read_model.ensure_loaded(db)
+        except Exception as e:
+            # Reads go to Mongo until the model loads
+            logger.error(f"Error loading read model: {e}")
+    if os.environ.get("CHANGE_STREAMS_ENABLED", "true").lower() == "true":
+        change_stream_watcher.start()
+    if os.environ.get("SCHEDULER_ENABLED", "true").lower() == "true":
+        scheduler.start(db)
+    continuous_profiler.start()
+    if TRACING_ENABLED:
+        trace_exporter.start()
     logger.info("🚀 Asteria Local API started successfully")
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
     """Close database connection on shutdown"""
+    continuous_profiler.stop()
+    await scheduler.stop()
+    await change_stream_watcher.stop()
+    await rating_queue.stop()
+    await engagement_buffer.stop()
+    shutdown_media_pool()
     await close_database()
+    trace_exporter.stop()
     logger.info("👋 Asteria Local API shut down")
@@ -1,69 +1,104 @@
 from typing import List, Optional
+from collections import defaultdict
 from bson import ObjectId
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from models.business import Business, BusinessCreate, BusinessUpdate, BusinessResponse
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorDatabase
+from models.business import (
+    Business, BusinessCreate, BusinessUpdate, BusinessResponse,
+    BusinessBulkUpdateItem, BusinessBulkUpdateResult
+)
 from models.review import ReviewResponse
+from services.cache import invalidation_bus
+from services.single_flight import SingleFlight
+from services.version_service import VersionService
+from services.location_service import LocationService, canonical_key, with_location_keys
+from services.leaderboard_service import LeaderboardService, bayesian_score
+from services.query_planner import QueryPlan
+from services.read_model import read_model
+from services.tracing import traced_methods
 import logging
 
 logger = logging.getLogger(__name__)
 
+featured_flight = SingleFlight("featured_businesses")
+
+LOCATION_FIELDS = {"address", "category", "is_active"}
+
+# Fields a patch may explicitly set to null
+NULLABLE_FIELDS = {"featured_position"}
+
+class VersionConflict(Exception):
+    """The business changed since the version the client edited"""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Business is at version {current_version}")
+        self.current_version = current_version
+
+@traced_methods
 class BusinessService:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(self, db: AsyncIOMotorDatabase, session: Optional[AsyncIOMotorClientSession] = None):
         self.db = db
         self.collection = db.businesses
+        # Causally consistent session the directory reads run in, if any
+        self.session = session
 
     async def create_business(self, business_data: BusinessCreate) -> BusinessResponse:
         """Create a new business"""
         business = Business(**business_data.dict())
-        result = await self.collection.insert_one(business.dict(by_alias=True, exclude_unset=True))
+        business_doc = business.dict(by_alias=True)
+        business_doc["_id"] = ObjectId(business_doc["_id"])
+        business_doc["address"] = with_location_keys(business_doc["address"])
+        business_doc["bayesian_score"] = bayesian_score(0.0, 0, await LeaderboardService(self.db).get_prior(business_doc["category"]))
+        await self.collection.insert_one(business_doc)
         
-        # Retrieve the created business
-        created_business = await self.collection.find_one({"_id": result.inserted_id})
-        return BusinessResponse.from_mongo(created_business)
+        # The inserted document is the response; no need to read it back
+        await LocationService(self.db).refresh_cities([business_doc["address"]["city_key"]])
+        await VersionService(self.db).bump("businesses")
+        invalidation_bus.notify("businesses", "insert", business_doc["_id"], document=business_doc)
+        return BusinessResponse.from_mongo(dict(business_doc))
 
     async def get_business_by_id(self, business_id: str) -> Optional[BusinessResponse]:
         """Get business by ID"""
+        record = self.get_business_record(business_id)
+        if record is not None:
+            return record.response
+        return BusinessResponse.from_mongo(await self.get_business_document(business_id))
+
+    def get_business_record(self, business_id: str):
+        """Read-model record of an active business, if the read model serves this read"""
+        if not read_model.serves(self.session):
+            return None
+        return read_model.get(business_id)
+
+    async def get_business_document(self, business_id: str) -> Optional[dict]:
+        """Get the raw business document by ID"""
         try:
-            business = await self.collection.find_one({"_id": ObjectId(business_id)})
-            return BusinessResponse.from_mongo(business)
+            return await self.collection.find_one({"_id": ObjectId(business_id)}, session=self.session)
         except Exception as e:
             logger.error(f"Error getting business {business_id}: {e}")
             return None
 
-    async def get_businesses(
-        self, 
-        category: Optional[str] = None,
-        city: Optional[str] = None,
-        search: Optional[str] = None,
-        limit: int = 20,
-        skip: int = 0
-    ) -> List[BusinessResponse]:
-        """Get businesses with filters"""
-        
-        # Build query
-        query = {"is_active": True}
-        
-        if category:
-            query["category"] = category
-            
-        if city:
-            query["address.city"] = city
-            
-        if search:
-            query["$or"] = [
-                {"name": {"$regex": search, "$options": "i"}},
-                {"description": {"$regex": search, "$options": "i"}}
-            ]
+    async def get_businesses(self, plan: QueryPlan, limit: int = 20, skip: int = 0) -> List[BusinessResponse]:
+        """Get businesses matching a listing plan, walking its index in sort order"""
+        if read_model.serves(self.session):
+            return read_model.find(plan, limit, skip)
 
-        # Execute query with pagination
-        cursor = self.collection.find(query).skip(skip).limit(limit)
+        cursor = self.collection.find(plan.filter, session=self.session).sort(plan.sort).hint(plan.index).skip(skip).limit(limit)
         businesses = await cursor.to_list(length=limit)
         
         return [BusinessResponse.from_mongo(business) for business in businesses]
 
     async def get_featured_businesses(self, limit: int = 10) -> List[BusinessResponse]:
         """Get featured businesses for homepage"""
-        
+        if read_model.serves(self.session):
+            return read_model.featured(limit)
+        if self.session is not None:
+            # Must not share a read started before the client's write
+            return await self._get_featured_businesses(limit)
+        return await featured_flight.do(limit, lambda: self._get_featured_businesses(limit))
+
+    async def _get_featured_businesses(self, limit: int) -> List[BusinessResponse]:
         # Sort by featured_position (ascending, nulls last), then by rating
         pipeline = [
             {"$match": {"is_active": True}},
@@ -80,43 +115,242 @@ class BusinessService:
             {"$limit": limit}
         ]
         
-        cursor = self.collection.aggregate(pipeline)
+        cursor = self.collection.aggregate(pipeline, session=self.session)
         businesses = await cursor.to_list(length=limit)
         
         return [BusinessResponse.from_mongo(business) for business in businesses]
 
     async def get_businesses_by_category(self, category_name: str, limit: int = 100) -> List[BusinessResponse]:
         """Get businesses by category name"""
+        if read_model.serves(self.session):
+            return read_model.by_category_name(category_name, limit)
         
         query = {
             "is_active": True,
             "category": category_name
         }
         
-        cursor = self.collection.find(query).sort("rating_average", -1).limit(limit)
+        # Confidence-weighted, so a single 5-star review does not top the list
+        cursor = self.collection.find(query, session=self.session).sort([("bayesian_score", -1), ("total_reviews", -1)]).limit(limit)
         businesses = await cursor.to_list(length=limit)
         
         return [BusinessResponse.from_mongo(business) for business in businesses]
 
     async def update_business(self, business_id: str, update_data: BusinessUpdate) -> Optional[BusinessResponse]:
-        """Update business"""
+        """Update business; raises VersionConflict if expected_version is stale"""
         try:
-            update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
+            update_dict = self._update_fields(update_data)
             update_dict["updated_at"] = datetime.utcnow()
             
-            result = await self.collection.update_one(
-                {"_id": ObjectId(business_id)}, 
-                {"$set": update_dict}
+            # One round trip: the before-image gives the previous city for
+            # location counts, and the after-image is derived from it
+            previous = await self.collection.find_one_and_update(
+                self._version_filter(ObjectId(business_id), update_data.expected_version),
+                {"$set": update_dict, "$inc": {"version": 1}},
+                return_document=ReturnDocument.BEFORE
             )
             
-            if result.modified_count:
-                updated_business = await self.collection.find_one({"_id": ObjectId(business_id)})
-                return BusinessResponse.from_mongo(updated_business)
-            return None
+            if previous is None:
+                if update_data.expected_version is not None:
+                    current = await self.collection.find_one({"_id": ObjectId(business_id)}, {"version": 1})
+                    if current is not None:
+                        raise VersionConflict(current.get("version", 1))
+                return None
+            
+            updated_business = self._after_image(previous, update_dict)
+            if LOCATION_FIELDS & update_dict.keys():
+                await LocationService(self.db).refresh_cities([
+                    (previous.get("address") or {}).get("city_key"),
+                    (updated_business.get("address") or {}).get("city_key")
+                ])
+            await VersionService(self.db).bump("businesses")
+            invalidation_bus.notify(
+                "businesses", "update", business_id, update_dict.keys(), updated_business
+            )
+            return BusinessResponse.from_mongo(updated_business)
+        except VersionConflict:
+            raise
         except Exception as e:
             logger.error(f"Error updating business {business_id}: {e}")
             return None
 
+    async def bulk_update_businesses(self, items: List[BusinessBulkUpdateItem]) -> List[BusinessBulkUpdateResult]:
+        """Validate a batch of patches together and apply them with one bulk_write.
+
+        Featured positions are checked against the state after the whole
+        batch, so reorders that swap positions are valid. Invalid items are
+        reported and skipped; the rest are applied.
+        """
+        now = datetime.utcnow()
+        results: List[Optional[BusinessBulkUpdateResult]] = [None] * len(items)
+        # item index -> (business _id, $set document)
+        updates = {}
+        seen = set()
+
+        def reject(index, status, error):
+            results[index] = BusinessBulkUpdateResult(id=items[index].id, status=status, error=error)
+            updates.pop(index, None)
+
+        for index, item in enumerate(items):
+            if not ObjectId.is_valid(item.id):
+                reject(index, "invalid", "Invalid business id")
+                continue
+            if item.id in seen:
+                reject(index, "invalid", "Business appears more than once in the batch")
+                continue
+            seen.add(item.id)
+
+            update_dict = self._update_fields(item)
+            if not update_dict:
+                reject(index, "invalid", "No fields to update")
+                continue
+            if update_dict.get("featured_position") is not None and update_dict["featured_position"] < 1:
+                reject(index, "invalid", "featured_position must be 1 or greater")
+                continue
+            update_dict["updated_at"] = now
+            updates[index] = (ObjectId(item.id), update_dict)
+
+        # Current documents, for existence, reorders and the before-images
+        documents = {
+            business["_id"]: business
+            async for business in self.collection.find({"_id": {"$in": [oid for oid, _ in updates.values()]}})
+        }
+        for index, (oid, _) in list(updates.items()):
+            if oid not in documents:
+                reject(index, "not_found", "Business not found")
+            elif items[index].expected_version not in (None, documents[oid].get("version", 1)):
+                reject(index, "conflict", f"Business is at version {documents[oid].get('version', 1)}")
+
+        categories = {update_dict["category"] for _, update_dict in updates.values() if "category" in update_dict}
+        if categories:
+            known = set(await self.db.categories.distinct("name", {"name": {"$in": list(categories)}}))
+            for index, (_, update_dict) in list(updates.items()):
+                if "category" in update_dict and update_dict["category"] not in known:
+                    reject(index, "invalid", f"Unknown category {update_dict['category']}")
+
+        for index in await self._featured_conflicts(updates, documents):
+            reject(index, "invalid", "featured_position is already taken")
+
+        if updates:
+            indexes = list(updates)
+            try:
+                result = await self.collection.bulk_write(
+                    [
+                        UpdateOne(
+                            self._version_filter(oid, items[index].expected_version),
+                            {"$set": update_dict, "$inc": {"version": 1}}
+                        )
+                        for index, (oid, update_dict) in updates.items()
+                    ],
+                    ordered=False
+                )
+                matched = result.matched_count
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    reject(indexes[error["index"]], "failed", error.get("errmsg", "Write failed"))
+                matched = e.details.get("nMatched", 0)
+
+            if matched < len(updates):
+                # Something changed between the read and the write; only the
+                # versions tell which items were applied
+                await self._reject_unapplied(updates, documents, reject)
+
+        # Derived data is refreshed once for the whole batch
+        city_keys = set()
+        for index, (oid, update_dict) in updates.items():
+            before = documents[oid]
+            after = self._after_image(before, update_dict)
+            if LOCATION_FIELDS & update_dict.keys():
+                city_keys.update([
+                    (before.get("address") or {}).get("city_key"),
+                    (after.get("address") or {}).get("city_key")
+                ])
+            invalidation_bus.notify("businesses", "update", oid, update_dict.keys(), after)
+            results[index] = BusinessBulkUpdateResult(
+                id=items[index].id, status="updated", business=BusinessResponse.from_mongo(after)
+            )
+
+        if updates:
+            await LocationService(self.db).refresh_cities(city_keys)
+            await VersionService(self.db).bump("businesses")
+            logger.info(f"Bulk updated {len(updates)} of {len(items)} businesses")
+
+        return results
+
+    async def _featured_conflicts(self, updates: dict, documents: dict) -> List[int]:
+        """Indexes of updates whose new featured_position would be shared"""
+        claims = {
+            index: update_dict["featured_position"]
+            for index, (_, update_dict) in updates.items()
+            if update_dict.get("featured_position") is not None
+        }
+        if not claims:
+            return []
+
+        batch_ids = [oid for oid, _ in updates.values()]
+        taken_outside = set(await self.collection.distinct(
+            "featured_position",
+            {"featured_position": {"$in": list(set(claims.values()))}, "_id": {"$nin": batch_ids}}
+        ))
+
+        rejected = set()
+        while True:
+            # Positions held after the batch by everything except valid claims
+            holders = defaultdict(list)
+            for index, (oid, update_dict) in updates.items():
+                if index in rejected:
+                    position = documents[oid].get("featured_position")
+                else:
+                    position = update_dict.get("featured_position", documents[oid].get("featured_position"))
+                if position is not None:
+                    holders[position].append(index)
+
+            newly_rejected = {
+                index for index, position in claims.items()
+                if index not in rejected and (position in taken_outside or len(holders[position]) > 1)
+            }
+            if not newly_rejected:
+                return sorted(rejected)
+            # Rejecting a claim leaves its business at its old position,
+            # which may in turn conflict with another claim
+            rejected |= newly_rejected
+
+    async def _reject_unapplied(self, updates: dict, documents: dict, reject):
+        versions = {
+            business["_id"]: business.get("version", 1)
+            async for business in self.collection.find(
+                {"_id": {"$in": [oid for oid, _ in updates.values()]}}, {"version": 1}
+            )
+        }
+        for index, (oid, _) in list(updates.items()):
+            if oid not in versions:
+                reject(index, "not_found", "Business not found")
+            elif versions[oid] == documents[oid].get("version", 1):
+                reject(index, "conflict", f"Business is at version {versions[oid]}")
+
+    @staticmethod
+    def _version_filter(business_id: ObjectId, expected_version: Optional[int]) -> dict:
+        query = {"_id": business_id}
+        if expected_version is not None:
+            query["version"] = expected_version
+        return query
+
+    @staticmethod
+    def _after_image(before: dict, update_dict: dict) -> dict:
+        """The document as a $set plus version increment leaves it"""
+        return {**before, **update_dict, "version": before.get("version", 1) + 1}
+
+    @staticmethod
+    def _update_fields(update_data: BusinessUpdate) -> dict:
+        """$set document of a patch: every field given, except nulls that would erase data"""
+        update_dict = {
+            k: v for k, v in update_data.dict(exclude={"id", "expected_version"}).items()
+            if v is not None or (k in NULLABLE_FIELDS and k in update_data.__fields_set__)
+        }
+        if "address" in update_dict:
+            update_dict["address"] = with_location_keys(update_dict["address"])
+        return update_dict
+
     async def update_business_rating(self, business_id: str):
         """Recalculate and update business rating based on reviews"""
         try:
@@ -139,30 +373,53 @@ class BusinessService:
                 avg_rating = 0.0
                 total_reviews = 0
 
+            business = await self.collection.find_one({"_id": ObjectId(business_id)}, {"category": 1})
+            if business is None:
+                return
+            leaderboards = LeaderboardService(self.db)
+            score = bayesian_score(avg_rating, total_reviews, await leaderboards.get_prior(business["category"]))
+
             # Update business
             await self.collection.update_one(
                 {"_id": ObjectId(business_id)},
                 {"$set": {
                     "rating_average": avg_rating,
                     "total_reviews": total_reviews,
+                    "bayesian_score": score,
                     "updated_at": datetime.utcnow()
                 }}
             )
             
+            await VersionService(self.db).bump("businesses")
+            invalidation_bus.notify(
+                "businesses", "update", business_id,
+                ["rating_average", "total_reviews", "bayesian_score", "updated_at"]
+            )
+            await leaderboards.refresh_businesses([business_id])
+            
             logger.info(f"Updated rating for business {business_id}: {avg_rating} ({total_reviews} reviews)")
             
         except Exception as e:
             logger.error(f"Error updating business rating {business_id}: {e}")
 
-    async def get_map_pins(self, category: Optional[str] = None, city: Optional[str] = None):
+    async def get_map_pins(
+        self,
+        category: Optional[str] = None,
+        city: Optional[str] = None,
+        neighborhood: Optional[str] = None
+    ):
         """Get aggregated map data for pins"""
+        if read_model.serves(self.session):
+            return read_model.map_pins(category, canonical_key(city) or None, canonical_key(neighborhood) or None)
         
         # Build match stage
         match_stage = {"is_active": True}
         if category:
             match_stage["category"] = category
         if city:
-            match_stage["address.city"] = city
+            match_stage["address.city_key"] = canonical_key(city)
+        if neighborhood:
+            match_stage["address.neighborhood_key"] = canonical_key(neighborhood)
 
         pipeline = [
             {"$match": match_stage},
@@ -187,7 +444,7 @@ class BusinessService:
             }}
         ]
         
-        cursor = self.collection.aggregate(pipeline)
+        cursor = self.collection.aggregate(pipeline, session=self.session)
         pins = await cursor.to_list(length=100)
         
         return pins
@@ -0,0 +1,223 @@
+import os
+import time
+from collections import OrderedDict, defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from bson import Timestamp
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Operation time the current request must observe (from a causal token);
+# cached values are only served once this worker has heard of changes up to it
+read_after: ContextVar[Optional[Timestamp]] = ContextVar("read_after", default=None)
+
+class InvalidationEvent:
+    """A change to one document (or a whole collection) that caches may depend on"""
+
+    __slots__ = ("collection", "operation", "document_id", "fields", "document", "updated_values", "relayed")
+
+    def __init__(
+        self,
+        collection: str,
+        operation: str,
+        document_id: Optional[str] = None,
+        fields: Optional[Iterable[str]] = None,
+        document: Optional[dict] = None,
+        updated_values: Optional[dict] = None,
+        relayed: bool = False
+    ):
+        self.collection = collection
+        self.operation = operation  # insert, update, replace, delete, drop
+        self.document_id = str(document_id) if document_id is not None else None
+        # Top-level fields touched by an update; None means "unknown / all"
+        self.fields = set(fields) if fields is not None else None
+        # Post-image of the document when known
+        self.document = document
+        # Values set by an update, as of this change (a relayed post-image is
+        # looked up later and may already include newer changes)
+        self.updated_values = updated_values
+        # Whether the change stream relayed this event (in oplog order)
+        self.relayed = relayed
+
+    def touches(self, fields: Optional[set]) -> bool:
+        """Whether this event may have changed any of the given fields"""
+        if fields is None or self.fields is None:
+            return True
+        return any(field.split(".")[0] in fields for field in self.fields)
+
+    def __repr__(self):
+        return f"InvalidationEvent({self.collection}, {self.operation}, {self.document_id})"
+
+class InvalidationBus:
+    """In-process fan-out of invalidation events to every cache of this worker.
+
+    Events come from two sources: the writes this worker performs itself, and
+    the change-stream watcher that relays writes made by every other worker.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callable[[InvalidationEvent], None]]] = defaultdict(list)
+        # True while a change stream is relaying remote writes; when False,
+        # caches fall back to short TTLs to bound staleness
+        self.stream_active = False
+        # Cluster time up to which the stream has relayed every change
+        self.relayed_through: Optional[Timestamp] = None
+        self.published_total = 0
+
+    def caught_up(self, operation_time: Optional[Timestamp]) -> bool:
+        """Whether every change up to ``operation_time`` has been relayed"""
+        if operation_time is None:
+            return True
+        return self.stream_active and self.relayed_through is not None and self.relayed_through >= operation_time
+
+    def subscribe(self, collection: str, callback: Callable[[InvalidationEvent], None]):
+        self._subscribers[collection].append(callback)
+
+    def publish(self, event: InvalidationEvent):
+        self.published_total += 1
+        for callback in self._subscribers.get(event.collection, []):
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Error handling {event}: {e}")
+
+    def notify(
+        self,
+        collection: str,
+        operation: str,
+        document_id: Optional[Any] = None,
+        fields: Optional[Iterable[str]] = None,
+        document: Optional[dict] = None
+    ):
+        """Publish a local write"""
+        self.publish(InvalidationEvent(collection, operation, document_id, fields, document))
+
+class TTLCache:
+    """Small LRU cache with TTL expiry and tag-based invalidation.
+
+    ``depends_on`` maps a collection to the set of top-level fields whose
+    changes affect the cached values (None meaning any field). Entries are
+    tagged either ``"<collection>:*"`` (dropped on any relevant change in the
+    collection) or ``"<collection>:<id>"`` (dropped only when that document
+    changes).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        fallback_ttl: float,
+        depends_on: Dict[str, Optional[Iterable[str]]],
+        maxsize: int = 1024,
+        bus: Optional[InvalidationBus] = None
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.maxsize = maxsize
+        self.bus = bus or invalidation_bus
+        self.depends_on = {
+            collection: set(fields) if fields is not None else None
+            for collection, fields in depends_on.items()
+        }
+
+        # key -> (expires_at, value, tags)
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._tag_index: Dict[str, set] = defaultdict(set)
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        for collection in self.depends_on:
+            self.bus.subscribe(collection, self._on_event)
+        cache_registry.append(self)
+
+    @property
+    def effective_ttl(self) -> float:
+        return self.ttl if self.bus.stream_active else min(self.ttl, self.fallback_ttl)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is not None and not self.bus.caught_up(read_after.get()):
+            # The client wrote something this worker may not have heard of yet
+            self.misses += 1
+            return default
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, tags: Optional[Iterable[str]] = None):
+        if key in self._entries:
+            self._remove(key)
+
+        if tags is None:
+            tags = [f"{collection}:*" for collection in self.depends_on]
+        tags = tuple(tags)
+
+        self._entries[key] = (time.monotonic() + self.effective_ttl, value, tags)
+        for tag in tags:
+            self._tag_index[tag].add(key)
+
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_tags(self, tags: Iterable[str]):
+        for tag in tags:
+            for key in list(self._tag_index.get(tag, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tag_index.clear()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "ttl": self.effective_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    def _on_event(self, event: InvalidationEvent):
+        if not event.touches(self.depends_on.get(event.collection)):
+            return
+
+        if event.document_id is None:
+            tags = [tag for tag in self._tag_index if tag.startswith(f"{event.collection}:")]
+        else:
+            tags = [f"{event.collection}:*", f"{event.collection}:{event.document_id}"]
+        self.invalidate_tags(tags)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+
+def clear_all_caches():
+    """Drop every cached entry of this worker"""
+    for cache in cache_registry:
+        cache.clear()
+
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "300"))
+CACHE_FALLBACK_TTL_SECONDS = float(os.environ.get("CACHE_FALLBACK_TTL_SECONDS", "15"))
+
+cache_registry: List[TTLCache] = []
+invalidation_bus = InvalidationBus()
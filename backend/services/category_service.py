@@ -1,26 +1,52 @@
 from typing import List, Optional
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorDatabase
 from models.category import Category, CategoryCreate, CategoryResponse
+from services.cache import TTLCache, invalidation_bus, CACHE_TTL_SECONDS, CACHE_FALLBACK_TTL_SECONDS
+from services.single_flight import SingleFlight
+from services.version_service import VersionService
+from services.reconciliation import ReconciliationService
+from services.tracing import traced_methods
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Category listings embed live business counts, so they depend on which
+# businesses are active and in which category, but not on anything else
+categories_cache = TTLCache(
+    "categories",
+    ttl=CACHE_TTL_SECONDS,
+    fallback_ttl=CACHE_FALLBACK_TTL_SECONDS,
+    depends_on={"categories": None, "businesses": ["category", "is_active"]}
+)
+
+popular_flight = SingleFlight("popular_categories")
+
+@traced_methods
 class CategoryService:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(self, db: AsyncIOMotorDatabase, session: Optional[AsyncIOMotorClientSession] = None):
         self.db = db
         self.collection = db.categories
+        # Causally consistent session the directory reads run in, if any
+        self.session = session
 
     async def create_category(self, category_data: CategoryCreate) -> CategoryResponse:
         """Create a new category"""
         category = Category(**category_data.dict())
-        result = await self.collection.insert_one(category.dict(by_alias=True, exclude_unset=True))
+        category_doc = category.dict(by_alias=True)
+        category_doc["_id"] = ObjectId(category_doc["_id"])
+        await self.collection.insert_one(category_doc)
         
-        # Retrieve the created category
-        created_category = await self.collection.find_one({"_id": result.inserted_id})
-        return CategoryResponse.from_mongo(created_category)
+        # The inserted document is the response; no need to read it back
+        await VersionService(self.db).bump("categories")
+        invalidation_bus.notify("categories", "insert", category_doc["_id"], document=category_doc)
+        return CategoryResponse.from_mongo(dict(category_doc))
 
     async def get_all_categories(self) -> List[CategoryResponse]:
         """Get all active categories with business counts"""
+        cached = categories_cache.get("all")
+        if cached is not None:
+            return cached
         
         # Aggregate to get business counts
         pipeline = [
@@ -48,42 +74,39 @@ class CategoryService:
             {"$sort": {"name": 1}}
         ]
         
-        cursor = self.collection.aggregate(pipeline)
+        cursor = self.collection.aggregate(pipeline, session=self.session)
         categories = await cursor.to_list(length=100)
         
-        return [CategoryResponse.from_mongo(category) for category in categories]
+        result = [CategoryResponse.from_mongo(category) for category in categories]
+        categories_cache.set("all", result)
+        return result
 
     async def get_category_by_slug(self, slug: str) -> Optional[CategoryResponse]:
         """Get category by slug"""
-        category = await self.collection.find_one({"slug": slug, "is_active": True})
+        category = await self.collection.find_one({"slug": slug, "is_active": True}, session=self.session)
         return CategoryResponse.from_mongo(category)
 
     async def update_category_counts(self):
         """Update business counts for all categories"""
         try:
-            categories = await self.collection.find({"is_active": True}).to_list(length=100)
-            
-            for category in categories:
-                # Count businesses in this category
-                business_count = await self.db.businesses.count_documents({
-                    "category": category["name"],
-                    "is_active": True
-                })
-                
-                # Update the category
-                await self.collection.update_one(
-                    {"_id": category["_id"]},
-                    {"$set": {"business_count": business_count}}
-                )
-                
-            logger.info("Updated business counts for all categories")
+            report = await ReconciliationService(self.db).reconcile_category_counts()
+            logger.info(f"Updated business counts for all categories ({report['changed']} changed)")
             
         except Exception as e:
             logger.error(f"Error updating category counts: {e}")
+            raise
 
     async def get_popular_categories(self, limit: int = 10) -> List[CategoryResponse]:
         """Get most popular categories by business count"""
-        
+        cached = categories_cache.get(("popular", limit))
+        if cached is not None:
+            return cached
+        if self.session is not None:
+            # Must not share a read started before the client's write
+            return await self._get_popular_categories(limit)
+        return await popular_flight.do(limit, lambda: self._get_popular_categories(limit))
+
+    async def _get_popular_categories(self, limit: int) -> List[CategoryResponse]:
         pipeline = [
             {"$match": {"is_active": True}},
             {"$lookup": {
@@ -110,7 +133,9 @@ class CategoryService:
             {"$limit": limit}
         ]
         
-        cursor = self.collection.aggregate(pipeline)
+        cursor = self.collection.aggregate(pipeline, session=self.session)
         categories = await cursor.to_list(length=limit)
         
-        return [CategoryResponse.from_mongo(category) for category in categories]
\ No newline at end of file
+        result = [CategoryResponse.from_mongo(category) for category in categories]
+        categories_cache.set(("popular", limit), result)
+        return result
\ No newline at end of file
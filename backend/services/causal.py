@@ -0,0 +1,98 @@
+"""Read-your-writes across primary and secondary reads.
+
+After a write, the client gets a causal token (``X-Causal-Token`` header
+and cookie) holding the primary's operation time at the end of the
+request. Reads that send it back run in a causally consistent session
+advanced to that time, so whichever member serves them waits until it has
+applied the write, and this worker's caches are bypassed until its change
+stream has relayed that far.
+"""
+import base64
+import binascii
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+import bson
+from bson import Timestamp
+from bson.errors import BSONError
+from fastapi import Depends, Request, Response
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import PyMongoError
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import ReadPreference
+from database import get_database
+from services.cache import read_after
+import logging
+
+logger = logging.getLogger(__name__)
+
+CAUSAL_CONSISTENCY = os.environ.get("CAUSAL_CONSISTENCY", "true").lower() == "true"
+CAUSAL_TOKEN_MAX_AGE_SECONDS = int(os.environ.get("CAUSAL_TOKEN_MAX_AGE_SECONDS", "120"))
+CAUSAL_HEADER = "X-Causal-Token"
+CAUSAL_COOKIE = "causal_token"
+
+def encode_token(operation_time: Timestamp, cluster_time: dict) -> str:
+    payload = bson.encode({"o": operation_time, "c": cluster_time, "t": datetime.utcnow()})
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+def decode_token(token: Optional[str]) -> Optional[Tuple[Timestamp, dict]]:
+    """(operation time, signed cluster time) of a token, or None if unusable"""
+    if not token:
+        return None
+    try:
+        payload = bson.decode(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (BSONError, binascii.Error, UnicodeEncodeError, ValueError):
+        return None
+
+    operation_time, cluster_time, issued_at = payload.get("o"), payload.get("c"), payload.get("t")
+    if not isinstance(operation_time, Timestamp) or not isinstance(cluster_time, dict):
+        return None
+    if not isinstance(cluster_time.get("clusterTime"), Timestamp) or not isinstance(issued_at, datetime):
+        return None
+    # The server rejects reads after a time it has not reached; only the
+    # cluster time is signed, so the operation time must not exceed it
+    if operation_time > cluster_time["clusterTime"]:
+        return None
+    # Once every member has caught up the token only costs cache misses
+    if datetime.utcnow() - issued_at > timedelta(seconds=CAUSAL_TOKEN_MAX_AGE_SECONDS):
+        return None
+    return operation_time, cluster_time
+
+async def causal_session(request: Request, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Dependency: a session reading at least the client's last write, if it sent a token"""
+    times = decode_token(request.headers.get(CAUSAL_HEADER) or request.cookies.get(CAUSAL_COOKIE))
+    if not CAUSAL_CONSISTENCY or times is None:
+        yield None
+        return
+
+    operation_time, cluster_time = times
+    async with await db.client.start_session(causal_consistency=True) as session:
+        session.advance_cluster_time(cluster_time)
+        session.advance_operation_time(operation_time)
+        read_after.set(operation_time)
+        yield session
+
+async def issue_causal_token(db: AsyncIOMotorDatabase, response: Response):
+    """Attach a token covering every write this request made"""
+    if not CAUSAL_CONSISTENCY:
+        return
+    try:
+        # A read on the primary returns its last applied operation time,
+        # which is at or after the writes already acknowledged to us
+        primary = db.with_options(read_preference=ReadPreference.PRIMARY, read_concern=ReadConcern("local"))
+        async with await db.client.start_session(causal_consistency=True) as session:
+            await primary.collection_versions.find_one({}, {"_id": 1}, session=session)
+            operation_time, cluster_time = session.operation_time, session.cluster_time
+    except PyMongoError as e:
+        logger.warning(f"Could not issue causal token: {e}")
+        return
+
+    # Standalone servers report no operation time, and need no token
+    if operation_time is None or cluster_time is None:
+        return
+    token = encode_token(operation_time, cluster_time)
+    response.headers[CAUSAL_HEADER] = token
+    response.set_cookie(
+        CAUSAL_COOKIE, token,
+        max_age=CAUSAL_TOKEN_MAX_AGE_SECONDS, httponly=True, samesite="lax"
+    )
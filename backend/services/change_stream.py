@@ -0,0 +1,179 @@
+import asyncio
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Iterable, Optional
+from bson import Timestamp
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure, PyMongoError
+from services.cache import InvalidationBus, InvalidationEvent, clear_all_caches, invalidation_bus
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Server error codes that mean the stored resume token can no longer be used
+RESUME_TOKEN_LOST_CODES = {260, 280, 286}
+
+def resume_token_time(token: Optional[dict]) -> Optional[Timestamp]:
+    """Cluster time a resume token points at, or None if it is not parsable.
+
+    ``_data`` is a hex KeyString starting with the cluster time: type byte
+    0x82, then seconds and increment as big-endian 32-bit integers.
+    """
+    data = (token or {}).get("_data")
+    if not isinstance(data, str) or len(data) < 18 or not data.startswith("82"):
+        return None
+    try:
+        raw = bytes.fromhex(data[2:18])
+    except ValueError:
+        return None
+    return Timestamp(int.from_bytes(raw[:4], "big"), int.from_bytes(raw[4:], "big"))
+
+class ChangeStreamWatcher:
+    """Relays writes from every worker and host into this worker's caches.
+
+    Watches the directory collections with a database-level change stream
+    (requires a replica set; a single-node one is enough locally) and
+    publishes each change on the invalidation bus. The resume token is stored
+    in Mongo so a restarted worker picks up where it left off. While the
+    stream is unavailable the bus is marked inactive and caches fall back to
+    short TTL expiry.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        collections: Iterable[str] = ("businesses", "categories", "reviews", "collection_versions"),
+        bus: Optional[InvalidationBus] = None,
+        worker_id: Optional[str] = None,
+        retry_seconds: float = 30.0,
+        token_flush_seconds: float = 1.0
+    ):
+        self.db = db
+        self.collections = list(collections)
+        self.bus = bus or invalidation_bus
+        self.worker_id = worker_id or os.environ.get("CHANGE_STREAM_WORKER_ID", socket.gethostname())
+        self.retry_seconds = retry_seconds
+        self.token_flush_seconds = token_flush_seconds
+        self.tokens = db.change_stream_tokens
+
+        self.events_total = 0
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.bus.stream_active = False
+        self.bus.relayed_through = None
+
+    def status(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "active": self.bus.stream_active,
+            "collections": self.collections,
+            "events_total": self.events_total,
+            "last_error": self.last_error,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self._watch()
+                self._deactivate("change stream closed")
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                self._deactivate(e)
+                if e.code in RESUME_TOKEN_LOST_CODES:
+                    # Events between the stored token and now are gone
+                    await self.tokens.delete_one({"_id": self.worker_id})
+                    continue
+            except PyMongoError as e:
+                self._deactivate(e)
+            await asyncio.sleep(self.retry_seconds)
+
+    async def _watch(self):
+        token_doc = await self.tokens.find_one({"_id": self.worker_id})
+        resume_after = token_doc["token"] if token_doc else None
+
+        pipeline = [{"$match": {"ns.coll": {"$in": self.collections}}}]
+        async with self.db.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after=resume_after
+        ) as stream:
+            if resume_after is None:
+                # Nothing to replay from, so anything cached may be stale
+                clear_all_caches()
+            self.bus.stream_active = True
+            self.last_error = None
+            logger.info(f"Change stream watching {self.collections} (worker {self.worker_id})")
+
+            last_flush = time.monotonic()
+            saved_token = resume_after
+            while stream.alive:
+                change = await stream.try_next()
+                if change is not None:
+                    self.events_total += 1
+                    self.bus.publish(self._to_event(change))
+                    self.bus.relayed_through = change.get("clusterTime")
+                else:
+                    # Batch drained: the post-batch resume token covers
+                    # no-ops and writes to unwatched collections, so tokened
+                    # reads stop bypassing caches on a quiet cluster too
+                    relayed = resume_token_time(stream.resume_token)
+                    if relayed is not None and (self.bus.relayed_through is None or relayed > self.bus.relayed_through):
+                        self.bus.relayed_through = relayed
+
+                if stream.resume_token != saved_token and time.monotonic() - last_flush >= self.token_flush_seconds:
+                    saved_token = stream.resume_token
+                    await self._save_token(saved_token)
+                    last_flush = time.monotonic()
+
+    async def _save_token(self, token):
+        await self.tokens.update_one(
+            {"_id": self.worker_id},
+            {"$set": {"token": token, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    def _deactivate(self, error):
+        if self.bus.stream_active or self.last_error is None:
+            logger.warning(f"Change stream unavailable, falling back to TTL expiry: {error}")
+        self.bus.stream_active = False
+        self.bus.relayed_through = None
+        self.last_error = str(error)
+
+    @staticmethod
+    def _to_event(change: dict) -> InvalidationEvent:
+        operation = change["operationType"]
+        collection = change.get("ns", {}).get("coll")
+        document_id = change.get("documentKey", {}).get("_id")
+
+        fields = None
+        updated_values = None
+        if operation == "update":
+            description = change.get("updateDescription", {})
+            updated_values = description.get("updatedFields", {})
+            fields = list(updated_values) + description.get("removedFields", [])
+
+        return InvalidationEvent(
+            collection,
+            operation,
+            document_id,
+            fields,
+            change.get("fullDocument"),
+            updated_values,
+            relayed=True
+        )
@@ -0,0 +1,264 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from services.cache import TTLCache, CACHE_TTL_SECONDS, CACHE_FALLBACK_TTL_SECONDS
+from services.tracing import traced_methods
+import logging
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ("view", "phone_tap", "whatsapp_click")
+
+# Collection holding the buckets of each granularity
+BUCKET_COLLECTIONS = {"hour": "engagement_hourly", "day": "engagement_daily"}
+
+ENGAGEMENT_HOURLY_RETENTION_DAYS = int(os.environ.get("ENGAGEMENT_HOURLY_RETENTION_DAYS", "35"))
+
+# (granularity, business id, bucket start)
+BucketKey = Tuple[str, ObjectId, datetime]
+
+# Ids of every active business, so most event batches need no query
+active_ids_cache = TTLCache(
+    "active_business_ids",
+    ttl=CACHE_TTL_SECONDS,
+    fallback_ttl=CACHE_FALLBACK_TTL_SECONDS,
+    depends_on={"businesses": ["is_active"]},
+    maxsize=1
+)
+
+async def active_business_ids(db: AsyncIOMotorDatabase, business_ids: Iterable[ObjectId]) -> Set[ObjectId]:
+    """The given ids that belong to active businesses"""
+    active = active_ids_cache.get("active")
+    if active is None:
+        active = frozenset(await db.businesses.distinct("_id", {"is_active": True}))
+        active_ids_cache.set("active", active)
+
+    business_ids = set(business_ids)
+    known = business_ids & active
+    unknown = list(business_ids - known)
+    if unknown:
+        # Created or reactivated since the set was cached
+        known.update(await db.businesses.distinct("_id", {"_id": {"$in": unknown}, "is_active": True}))
+    return known
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+class EngagementBuffer:
+    """Pre-aggregating in-memory buffer for engagement events.
+
+    Events are counted straight into the hourly and daily buckets they
+    belong to, so a flush writes one ``$inc`` upsert per touched bucket
+    however many events it holds. Flushes run when ``flush_events`` events
+    are buffered or ``flush_seconds`` after the oldest one arrived. Once
+    ``max_pending_buckets`` buckets are waiting (e.g. while Mongo is down)
+    new events are refused, and the endpoint answers 503.
+    """
+
+    def __init__(self, flush_events: int = 5000, flush_seconds: float = 5.0, max_pending_buckets: int = 100000):
+        self.flush_events = flush_events
+        self.flush_seconds = flush_seconds
+        self.max_pending_buckets = max_pending_buckets
+        self.db: Optional[AsyncIOMotorDatabase] = None
+
+        self._pending: Dict[BucketKey, Counter] = {}
+        self._pending_events = 0
+        self._oldest: Optional[float] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+
+        # Metrics
+        self.accepted_total = 0
+        self.rejected_total = 0
+        self.flushes_total = 0
+        self.failed_flushes_total = 0
+        self.written_buckets_total = 0
+        self.last_flush_seconds = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._flusher is not None and not self._flusher.done() and not self._stopping
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if self.running:
+            return
+        self.db = db
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._run())
+        logger.info(
+            f"Engagement buffer started (flush at {self.flush_events} events "
+            f"or {self.flush_seconds}s)"
+        )
+
+    async def stop(self, drain: bool = True):
+        """Stop the flusher, optionally writing everything still buffered"""
+        if self._flusher:
+            # Not cancelled: a flush in progress has already taken its batch
+            # out of the buffer and must finish (or requeue it)
+            self._stopping = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        if drain and self.db is not None and self._pending:
+            await self.flush()
+
+    def record(self, events: Iterable[Tuple[str, str]], at: Optional[datetime] = None) -> bool:
+        """Count (business id, event type) pairs; False when the buffer is full"""
+        if not self.running or len(self._pending) >= self.max_pending_buckets:
+            self.rejected_total += 1
+            return False
+
+        at = at or datetime.utcnow()
+        count = 0
+        for business_id, event_type in events:
+            business_id = ObjectId(business_id)
+            for granularity in BUCKET_COLLECTIONS:
+                key = (granularity, business_id, bucket_start(at, granularity))
+                self._pending.setdefault(key, Counter())[event_type] += 1
+            count += 1
+
+        self.accepted_total += count
+        self._pending_events += count
+        if self._oldest is None:
+            # Starts the flush timer
+            self._oldest = time.monotonic()
+            self._wakeup.set()
+        if self._pending_events >= self.flush_events:
+            self._wakeup.set()
+        return True
+
+    async def flush(self):
+        """Write the buffered counts with one unordered bulk upsert per granularity"""
+        async with self._flush_lock:
+            batch, self._pending = self._pending, {}
+            self._pending_events, self._oldest = 0, None
+            if not batch:
+                return
+
+            started = time.monotonic()
+            for granularity, collection in BUCKET_COLLECTIONS.items():
+                keys = [key for key in batch if key[0] == granularity]
+                if not keys:
+                    continue
+                operations = []
+                for key in keys:
+                    _, business_id, bucket = key
+                    operations.append(UpdateOne(
+                        {"business_id": business_id, "bucket": bucket},
+                        {"$inc": {f"counts.{event_type}": n for event_type, n in batch[key].items()}},
+                        upsert=True
+                    ))
+                try:
+                    await self.db[collection].bulk_write(operations, ordered=False)
+                    self.written_buckets_total += len(keys)
+                except BulkWriteError as e:
+                    # The rest of the batch was applied; retry only what failed
+                    failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                    self._requeue({keys[i]: batch[keys[i]] for i in failed})
+                    self.written_buckets_total += len(keys) - len(failed)
+                    self._failed(f"{len(failed)} {collection} upserts failed: {e}")
+                except PyMongoError as e:
+                    # The driver already retried these (single upserts are
+                    # retryable writes); requeueing risks a rare double count,
+                    # which beats losing the batch
+                    self._requeue({key: batch[key] for key in keys})
+                    self._failed(f"Error flushing {collection}: {e}")
+
+            self.flushes_total += 1
+            self.last_flush_seconds = time.monotonic() - started
+
+    def metrics(self) -> dict:
+        return {
+            "running": self.running,
+            "pending_events": self._pending_events,
+            "pending_buckets": len(self._pending),
+            "max_pending_buckets": self.max_pending_buckets,
+            "oldest_pending_age_seconds": round(time.monotonic() - self._oldest, 3) if self._oldest else 0.0,
+            "accepted_total": self.accepted_total,
+            "rejected_total": self.rejected_total,
+            "flushes_total": self.flushes_total,
+            "failed_flushes_total": self.failed_flushes_total,
+            "written_buckets_total": self.written_buckets_total,
+            "last_flush_seconds": round(self.last_flush_seconds, 3),
+            "last_error": self.last_error,
+        }
+
+    def _requeue(self, counts: Dict[BucketKey, Counter]):
+        for key, counter in counts.items():
+            self._pending.setdefault(key, Counter()).update(counter)
+            # Every event has one hourly bucket, so those count events
+            if key[0] == "hour":
+                self._pending_events += sum(counter.values())
+        if counts and self._oldest is None:
+            self._oldest = time.monotonic()
+
+    def _failed(self, message: str):
+        self.failed_flushes_total += 1
+        self.last_error = message
+        logger.error(message)
+
+    async def _run(self):
+        while not self._stopping:
+            due = self._oldest is not None and time.monotonic() - self._oldest >= self.flush_seconds
+            if due or self._pending_events >= self.flush_events:
+                try:
+                    await self.flush()
+                except Exception as e:
+                    self._failed(f"Error flushing engagement events: {e}")
+
+            timeout = None
+            if self._oldest is not None:
+                timeout = max(self._oldest + self.flush_seconds - time.monotonic(), 0.0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+engagement_buffer = EngagementBuffer(
+    flush_events=int(os.environ.get("ENGAGEMENT_FLUSH_EVENTS", "5000")),
+    flush_seconds=float(os.environ.get("ENGAGEMENT_FLUSH_SECONDS", "5")),
+    max_pending_buckets=int(os.environ.get("ENGAGEMENT_MAX_PENDING_BUCKETS", "100000")),
+)
+
+@traced_methods
+class EngagementService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def get_report(self, business_id: str, granularity: str, since: datetime) -> Optional[dict]:
+        """Per-bucket and total counts of a business, or None if it does not exist"""
+        if await self.db.businesses.find_one({"_id": ObjectId(business_id)}, {"_id": 1}) is None:
+            return None
+
+        since = bucket_start(since, granularity)
+        cursor = self.db[BUCKET_COLLECTIONS[granularity]].find(
+            {"business_id": ObjectId(business_id), "bucket": {"$gte": since}},
+            {"_id": 0, "bucket": 1, "counts": 1}
+        ).sort("bucket", 1)
+        buckets: List[dict] = await cursor.to_list(length=None)
+
+        totals = Counter({event_type: 0 for event_type in EVENT_TYPES})
+        for bucket in buckets:
+            totals.update(bucket.get("counts", {}))
+
+        return {
+            "business_id": business_id,
+            "granularity": granularity,
+            "since": since,
+            "totals": dict(totals),
+            "buckets": buckets,
+        }
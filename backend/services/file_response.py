@@ -0,0 +1,131 @@
+import os
+import stat
+from email.utils import formatdate
+from typing import Optional, Tuple
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single-range ``Range`` header.
+
+    Returns None when the whole file should be sent (no header, several
+    ranges, or a unit other than bytes) and raises ValueError for a range
+    that cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    start, _, end = header[6:].strip().partition("-")
+    try:
+        if start:
+            first = int(start)
+            last = int(end) if end else size - 1
+        else:
+            # Suffix range: the last N bytes
+            first = max(size - int(end), 0)
+            last = size - 1
+    except ValueError:
+        return None
+
+    if first > last or first >= size:
+        raise ValueError("Range not satisfiable")
+    return first, min(last, size - 1)
+
+class RangeFileResponse(Response):
+    """File response with single-range requests, validators and zero-copy send.
+
+    When the ASGI server offers the ``http.response.zerocopysend`` extension
+    the file descriptor is handed to it (sendfile); otherwise the file is
+    streamed in chunks read off the event loop.
+    """
+
+    def __init__(self, request: Request, path: str, media_type: str, etag: str, headers: Optional[dict] = None):
+        super().__init__(status_code=200, media_type=media_type, headers=headers)
+        self.path = path
+        self.request = request
+        self.etag = etag
+
+    async def __call__(self, scope, receive, send):
+        try:
+            stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+        except FileNotFoundError:
+            await Response(status_code=404)(scope, receive, send)
+            return
+        if not stat.S_ISREG(stat_result.st_mode):
+            await Response(status_code=404)(scope, receive, send)
+            return
+
+        size = stat_result.st_size
+        self.headers["etag"] = self.etag
+        self.headers["last-modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+        self.headers["accept-ranges"] = "bytes"
+        self.headers.setdefault("cache-control", IMMUTABLE_CACHE_CONTROL)
+
+        if self.etag in self.request.headers.get("if-none-match", ""):
+            self.status_code = 304
+            del self.headers["content-length"]
+            await self._send_start(send)
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        byte_range = None
+        # A range is only honoured while the client's copy is still current
+        if self.request.headers.get("if-range", self.etag) == self.etag:
+            try:
+                byte_range = parse_range(self.request.headers.get("range"), size)
+            except ValueError:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{size}"
+                self.headers["content-length"] = "0"
+                await self._send_start(send)
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        if byte_range is None:
+            offset, count = 0, size
+        else:
+            offset, count = byte_range[0], byte_range[1] - byte_range[0] + 1
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+        self.headers["content-length"] = str(count)
+
+        await self._send_start(send)
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        with open(self.path, "rb") as file:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.fileno(),
+                    "offset": offset,
+                    "count": count
+                })
+                return
+
+            file.seek(offset)
+            remaining = count
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(file.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                logger.error(f"File {self.path} shrank while being sent")
+                await send({"type": "http.response.body", "body": b""})
+
+    async def _send_start(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
@@ -0,0 +1,132 @@
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple
+import numpy as np
+from services.pin_snapshot import PinSnapshotStore, pin_snapshot
+from services.tracing import traced_methods
+import logging
+
+logger = logging.getLogger(__name__)
+
+# west, south, east, north: Tampico, Madero and Altamira
+DEFAULT_BBOX = tuple(
+    float(value) for value in os.environ.get("HEATMAP_DEFAULT_BBOX", "-98.05,22.15,-97.75,22.55").split(",")
+)
+MAX_GRIDS = int(os.environ.get("HEATMAP_MAX_GRIDS", "64"))
+
+BBox = Tuple[float, float, float, float]
+
+def bin_points(lat: np.ndarray, lng: np.ndarray, bbox: BBox, resolution: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Grid (row, col) of every point inside the bbox; rows run south to north.
+
+    Used both to build grids and to update them point by point, so the two
+    always agree on which cell a coordinate falls in.
+    """
+    west, south, east, north = bbox
+    lat = lat.astype(np.float64)
+    lng = lng.astype(np.float64)
+    inside = (lng >= west) & (lng <= east) & (lat >= south) & (lat <= north)
+    rows = ((lat[inside] - south) / (north - south) * resolution).astype(np.int64)
+    cols = ((lng[inside] - west) / (east - west) * resolution).astype(np.int64)
+    return np.minimum(rows, resolution - 1), np.minimum(cols, resolution - 1)
+
+class DensityGrid:
+    """Business counts binned over a bbox, kept current point by point"""
+
+    __slots__ = ("bbox", "resolution", "category_code", "counts")
+
+    def __init__(self, bbox: BBox, resolution: int, category_code: Optional[int], counts: np.ndarray):
+        self.bbox = bbox
+        self.resolution = resolution
+        self.category_code = category_code
+        self.counts = counts
+
+    def cell(self, lat: float, lng: float) -> Optional[Tuple[int, int]]:
+        rows, cols = bin_points(
+            np.array([lat], dtype=np.float32), np.array([lng], dtype=np.float32),
+            self.bbox, self.resolution
+        )
+        return (int(rows[0]), int(cols[0])) if len(rows) else None
+
+    def adjust(self, values, delta: int):
+        if values is None:
+            return
+        lat, lng, code = values
+        if self.category_code is not None and code != self.category_code:
+            return
+        cell = self.cell(lat, lng)
+        if cell is not None:
+            self.counts[cell] += delta
+
+    def to_dict(self) -> dict:
+        # Rows are returned north to south, like an image
+        grid = self.counts[::-1]
+        return {
+            "bbox": list(self.bbox),
+            "resolution": self.resolution,
+            "total": int(grid.sum()),
+            "max": int(grid.max()) if grid.size else 0,
+            "grid": grid.tolist(),
+        }
+
+@traced_methods
+class HeatmapService:
+    """Density grids over the pin snapshot's coordinate arrays.
+
+    Grids are built once per (category, resolution, bbox) with a vectorized
+    histogram (``np.bincount`` over flattened cell indices) and then updated
+    incrementally from pin snapshot changes, so serving a grid never touches
+    MongoDB.
+    """
+
+    def __init__(self, snapshot: PinSnapshotStore):
+        self.snapshot = snapshot
+        self._grids: "OrderedDict[tuple, DensityGrid]" = OrderedDict()
+        snapshot.listeners.append(self._on_change)
+
+    def get_grid(self, category: Optional[str], resolution: int, bbox: Optional[BBox] = None) -> DensityGrid:
+        bbox = tuple(round(value, 4) for value in (bbox or DEFAULT_BBOX))
+        key = (category, resolution, bbox)
+
+        grid = self._grids.get(key)
+        if grid is not None:
+            self._grids.move_to_end(key)
+            return grid
+
+        grid = self._build(category, resolution, bbox)
+        self._grids[key] = grid
+        while len(self._grids) > MAX_GRIDS:
+            self._grids.popitem(last=False)
+        return grid
+
+    def _build(self, category: Optional[str], resolution: int, bbox: BBox) -> DensityGrid:
+        lat, lng, codes = self.snapshot.columns()
+        category_code = None
+
+        if category is not None:
+            category_code = self.snapshot.category_code(category)
+            if category_code is None:
+                # No business in this category yet; a dedicated code is
+                # assigned when the first one appears
+                category_code = -1
+            mask = codes == category_code
+            lat, lng = lat[mask], lng[mask]
+
+        rows, cols = bin_points(lat, lng, bbox, resolution)
+        counts = np.bincount(rows * resolution + cols, minlength=resolution * resolution)
+        return DensityGrid(bbox, resolution, category_code, counts.astype(np.int32).reshape(resolution, resolution))
+
+    def _on_change(self, row, old, new):
+        if row is None:
+            # Full snapshot reload
+            self._grids.clear()
+            return
+        for key, grid in list(self._grids.items()):
+            if grid.category_code == -1:
+                # Built before its category existed; rebuild on next request
+                del self._grids[key]
+                continue
+            grid.adjust(old, -1)
+            grid.adjust(new, 1)
+
+heatmap_service = HeatmapService(pin_snapshot)
@@ -0,0 +1,113 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.category_service import CategoryService
+from services.review_service import ReviewService
+from services.rating_queue import rating_queue
+from services.reconciliation import ReconciliationService
+from services.similarity import SimilarityService
+from services.leaderboard_service import LeaderboardService
+from services.trending import TrendingService
+from services.scheduler import Job, JobScheduler
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Writes made just before the previous run started may have been committed
+# after it read them
+RUN_OVERLAP = timedelta(minutes=1)
+
+async def refresh_category_counts(db: AsyncIOMotorDatabase, last_success_at: Optional[datetime]):
+    await CategoryService(db).update_category_counts()
+
+async def sweep_business_ratings(db: AsyncIOMotorDatabase, last_success_at: Optional[datetime]):
+    """Recompute ratings of businesses reviewed since the last sweep.
+
+    Catches reviews whose queued recompute was lost, e.g. when a worker
+    stopped before its queue drained or reviews were written outside the API.
+    """
+    since = last_success_at - RUN_OVERLAP if last_success_at else None
+    business_ids = await ReviewService(db).get_reviewed_business_ids(since)
+    for business_id in business_ids:
+        rating_queue.enqueue(business_id)
+    logger.info(f"Rating sweep queued {len(business_ids)} businesses")
+
+async def reconcile_business_ratings(db: AsyncIOMotorDatabase, last_success_at: Optional[datetime]):
+    report = await ReconciliationService(db).reconcile_business_ratings()
+    logger.info(f"Rating reconciliation fixed {report['changed']} of {report['checked']} businesses")
+
+async def refresh_similar_businesses(db: AsyncIOMotorDatabase, last_success_at: Optional[datetime]):
+    service = SimilarityService(db)
+    if last_success_at is None:
+        await service.rebuild()
+        return
+    categories = await service.refresh_changed(last_success_at - RUN_OVERLAP)
+    if categories:
+        logger.info(f"Refreshed similar businesses for {len(categories)} categories")
+
+async def refresh_leaderboards(db: AsyncIOMotorDatabase, last_success_at: Optional[datetime]):
+    """Pick up edits (moves, renames, deactivations); reviews refresh boards directly"""
+    service = LeaderboardService(db)
+    if last_success_at is None:
+        await service.rebuild()
+        return
+    await service.refresh_changed(last_success_at - RUN_OVERLAP)
+
+async def rebuild_leaderboards(db: AsyncIOMotorDatabase, last_success_at: Optional[datetime]):
+    # Category priors drift slowly, so they are recomputed once a day
+    await LeaderboardService(db).rebuild()
+
+async def decay_trend_scores(db: AsyncIOMotorDatabase, last_success_at: Optional[datetime]):
+    """Bring every trend score to now; the first run backfills them from reviews"""
+    service = TrendingService(db)
+    if last_success_at is None:
+        await service.rebuild()
+        return
+    await service.decay()
+
+async def rebuild_trend_scores(db: AsyncIOMotorDatabase, last_success_at: Optional[datetime]):
+    await TrendingService(db).rebuild()
+
+def register_jobs(scheduler: JobScheduler):
+    """Register the maintenance jobs"""
+    scheduler.add_job(Job(
+        "category_counts",
+        refresh_category_counts,
+        interval_seconds=float(os.environ.get("CATEGORY_COUNTS_INTERVAL_SECONDS", "900"))
+    ))
+    scheduler.add_job(Job(
+        "rating_sweep",
+        sweep_business_ratings,
+        cron=os.environ.get("RATING_SWEEP_CRON", "*/30 * * * *")
+    ))
+    scheduler.add_job(Job(
+        "rating_reconciliation",
+        reconcile_business_ratings,
+        cron=os.environ.get("RATING_RECONCILIATION_CRON", "15 3 * * *")
+    ))
+    scheduler.add_job(Job(
+        "similar_businesses",
+        refresh_similar_businesses,
+        interval_seconds=float(os.environ.get("SIMILAR_REFRESH_INTERVAL_SECONDS", "60"))
+    ))
+    scheduler.add_job(Job(
+        "leaderboards",
+        refresh_leaderboards,
+        interval_seconds=float(os.environ.get("LEADERBOARD_REFRESH_INTERVAL_SECONDS", "60"))
+    ))
+    scheduler.add_job(Job(
+        "leaderboard_priors",
+        rebuild_leaderboards,
+        cron=os.environ.get("LEADERBOARD_PRIORS_CRON", "45 3 * * *")
+    ))
+    scheduler.add_job(Job(
+        "trend_decay",
+        decay_trend_scores,
+        interval_seconds=float(os.environ.get("TRENDING_DECAY_INTERVAL_SECONDS", "3600"))
+    ))
+    scheduler.add_job(Job(
+        "trend_rebuild",
+        rebuild_trend_scores,
+        cron=os.environ.get("TRENDING_REBUILD_CRON", "30 4 * * *")
+    ))
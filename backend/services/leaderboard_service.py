@@ -0,0 +1,259 @@
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+from models.business import card_image_url
+from services.cache import TTLCache, invalidation_bus, CACHE_TTL_SECONDS, CACHE_FALLBACK_TTL_SECONDS
+from services.location_service import canonical_key
+from services.version_service import VersionService
+from services.tracing import traced_methods
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Reviews' worth of confidence given to the category prior
+PRIOR_WEIGHT = float(os.environ.get("BAYESIAN_PRIOR_WEIGHT", "10"))
+LEADERBOARD_SIZE = int(os.environ.get("LEADERBOARD_SIZE", "10"))
+LEADERBOARD_MIN_REVIEWS = int(os.environ.get("LEADERBOARD_MIN_REVIEWS", "1"))
+
+MEDALS = {1: "🥇", 2: "🥈", 3: "🥉"}
+
+BOARD_PROJECTION = {
+    "name": 1, "category": 1, "address": 1, "images": 1,
+    "rating_average": 1, "total_reviews": 1, "bayesian_score": 1, "is_active": 1
+}
+
+# Priors only change when the nightly job recomputes them
+priors_cache = TTLCache(
+    "rating_priors",
+    ttl=CACHE_TTL_SECONDS,
+    fallback_ttl=CACHE_FALLBACK_TTL_SECONDS,
+    depends_on={"categories": ["rating_prior"]}
+)
+
+def bayesian_score(rating_average: float, total_reviews: int, prior_mean: float, prior_weight: float = PRIOR_WEIGHT) -> float:
+    """Rating shrunk toward the category mean; few reviews barely move it"""
+    total_reviews = total_reviews or 0
+    if total_reviews + prior_weight <= 0:
+        return 0.0
+    return round((prior_weight * prior_mean + total_reviews * (rating_average or 0.0)) / (prior_weight + total_reviews), 4)
+
+def board_id(category: str, city_key: Optional[str] = None, neighborhood_key: Optional[str] = None) -> str:
+    if neighborhood_key:
+        return f"{category}|{city_key}/{neighborhood_key}"
+    if city_key:
+        return f"{category}|{city_key}"
+    return category
+
+def boards_of(business: dict) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """(category, city_key, neighborhood_key) of every board a business can be on"""
+    address = business.get("address") or {}
+    category = business.get("category")
+    city_key, neighborhood_key = address.get("city_key"), address.get("neighborhood_key")
+    boards = [(category, None, None)]
+    if city_key:
+        boards.append((category, city_key, None))
+        if neighborhood_key:
+            boards.append((category, city_key, neighborhood_key))
+    return boards
+
+@traced_methods
+class LeaderboardService:
+    """Bayesian business scores and materialized top-N leaderboards.
+
+    ``bayesian_score`` is stored (and indexed) on every business, computed
+    against its category's review-weighted mean rating, kept in
+    ``categories.rating_prior``. Leaderboards for each category, and for
+    each city and neighborhood within it, are stored in ``leaderboards`` and
+    only the boards a changed business was or is on are recomputed.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.collection = db.leaderboards
+
+    async def get_leaderboards(
+        self,
+        category: Optional[str] = None,
+        city: Optional[str] = None,
+        neighborhood: Optional[str] = None
+    ) -> List[dict]:
+        """Stored leaderboards of a scope (neighborhoods need their city), one per category"""
+        city_key = canonical_key(city) or None
+        neighborhood_key = (canonical_key(neighborhood) or None) if city_key else None
+        query = {
+            "scope": "neighborhood" if neighborhood_key else "city" if city_key else "category",
+            "city_key": city_key,
+            "neighborhood_key": neighborhood_key
+        }
+        if category:
+            query["category"] = category
+        return await self.collection.find(query, {"_id": 0}).sort("category", 1).to_list(length=None)
+
+    async def get_prior(self, category: str) -> float:
+        """Mean rating of a category, or of all businesses before it has any"""
+        priors = priors_cache.get("priors")
+        if priors is None:
+            priors = {
+                category_doc["name"]: category_doc["rating_prior"]["mean"]
+                async for category_doc in self.db.categories.find(
+                    {"rating_prior": {"$exists": True}}, {"name": 1, "rating_prior": 1}
+                )
+            }
+            if priors:
+                priors[""] = round(sum(priors.values()) / len(priors), 4)
+            priors_cache.set("priors", priors)
+        if category in priors:
+            return priors[category]
+        return priors.get("", 0.0)
+
+    async def recompute_priors(self) -> Dict[str, float]:
+        """Store each category's review-weighted mean rating"""
+        pipeline = [
+            {"$match": {"is_active": True, "total_reviews": {"$gt": 0}}},
+            {"$group": {
+                "_id": "$category",
+                "weighted": {"$sum": {"$multiply": ["$rating_average", "$total_reviews"]}},
+                "reviews": {"$sum": "$total_reviews"}
+            }}
+        ]
+        groups = await self.db.businesses.aggregate(pipeline).to_list(length=None)
+        priors = {group["_id"]: round(group["weighted"] / group["reviews"], 4) for group in groups}
+
+        total_reviews = sum(group["reviews"] for group in groups)
+        global_mean = round(sum(group["weighted"] for group in groups) / total_reviews, 4) if total_reviews else 0.0
+
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"_id": category["_id"]},
+                {"$set": {"rating_prior": {"mean": priors.get(category["name"], global_mean), "updated_at": now}}}
+            )
+            async for category in self.db.categories.find({}, {"name": 1})
+        ]
+        if operations:
+            await self.db.categories.bulk_write(operations, ordered=False)
+
+        # Stored under "" for categories created since
+        priors[""] = global_mean
+        priors_cache.set("priors", priors)
+        invalidation_bus.notify("categories", "update", fields=["rating_prior"])
+        return priors
+
+    async def recompute_scores(self, query: Optional[dict] = None) -> int:
+        """Recompute bayesian_score of matching businesses, writing only changes"""
+        operations = []
+        async for business in self.db.businesses.find(
+            query or {}, {"category": 1, "rating_average": 1, "total_reviews": 1, "bayesian_score": 1}
+        ):
+            score = bayesian_score(
+                business.get("rating_average", 0.0),
+                business.get("total_reviews", 0),
+                await self.get_prior(business.get("category"))
+            )
+            if business.get("bayesian_score") != score:
+                operations.append(UpdateOne({"_id": business["_id"]}, {"$set": {"bayesian_score": score}}))
+
+        if operations:
+            await self.db.businesses.bulk_write(operations, ordered=False)
+            # Category listings are ordered by the score
+            await VersionService(self.db).bump("businesses")
+            invalidation_bus.notify("businesses", "update", fields=["bayesian_score"])
+        return len(operations)
+
+    async def rebuild(self):
+        """Recompute priors, every score and every leaderboard"""
+        await self.recompute_priors()
+        changed = await self.recompute_scores()
+
+        boards = set()
+        async for business in self.db.businesses.find({"is_active": True}, {"category": 1, "address": 1}):
+            boards.update(boards_of(business))
+        await self._refresh_boards(boards)
+        # Boards nobody qualifies for anymore
+        await self.collection.delete_many({"_id": {"$nin": [board_id(*board) for board in boards]}})
+        logger.info(f"Rebuilt {len(boards)} leaderboards ({changed} scores changed)")
+
+    async def refresh_businesses(self, business_ids: Iterable, previous: Iterable[dict] = ()):
+        """Recompute the boards the given businesses are on, or were on"""
+        business_ids = [ObjectId(business_id) for business_id in business_ids]
+        if not business_ids:
+            return
+
+        boards = set()
+        for business in previous:
+            boards.update(boards_of(business))
+        async for business in self.db.businesses.find({"_id": {"$in": business_ids}}, {"category": 1, "address": 1}):
+            boards.update(boards_of(business))
+        # Boards listing them, in case they moved since they were ranked
+        async for board in self.collection.find(
+            {"entries.id": {"$in": [str(business_id) for business_id in business_ids]}},
+            {"category": 1, "city_key": 1, "neighborhood_key": 1}
+        ):
+            boards.add((board["category"], board.get("city_key"), board.get("neighborhood_key")))
+
+        await self._refresh_boards(boards)
+
+    async def refresh_changed(self, since: datetime) -> int:
+        """Rescore businesses updated since a moment and refresh their boards"""
+        query = {"updated_at": {"$gte": since}}
+        await self.recompute_scores(query)
+        changed = await self.db.businesses.distinct("_id", query)
+        await self.refresh_businesses(changed)
+        return len(changed)
+
+    async def _refresh_boards(self, boards: Iterable[Tuple[str, Optional[str], Optional[str]]]):
+        now = datetime.utcnow()
+        operations = []
+        for category, city_key, neighborhood_key in boards:
+            query = {
+                "category": category,
+                "is_active": True,
+                "total_reviews": {"$gte": LEADERBOARD_MIN_REVIEWS}
+            }
+            if city_key:
+                query["address.city_key"] = city_key
+            if neighborhood_key:
+                query["address.neighborhood_key"] = neighborhood_key
+
+            ranked = await self.db.businesses.find(query, BOARD_PROJECTION).sort(
+                [("bayesian_score", -1), ("total_reviews", -1)]
+            ).limit(LEADERBOARD_SIZE).to_list(length=LEADERBOARD_SIZE)
+
+            _id = board_id(category, city_key, neighborhood_key)
+            if not ranked:
+                operations.append(DeleteMany({"_id": _id}))
+                continue
+
+            first = ranked[0].get("address") or {}
+            operations.append(ReplaceOne({"_id": _id}, {
+                "category": category,
+                "scope": "neighborhood" if neighborhood_key else "city" if city_key else "category",
+                "city_key": city_key,
+                "city": first.get("city") if city_key else None,
+                "neighborhood_key": neighborhood_key,
+                "neighborhood": first.get("neighborhood") if neighborhood_key else None,
+                "entries": [self._entry(position, business) for position, business in enumerate(ranked, 1)],
+                "updated_at": now
+            }, upsert=True))
+
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def _entry(position: int, business: dict) -> dict:
+        address = business.get("address") or {}
+        return {
+            "position": position,
+            "medal": MEDALS.get(position, ""),
+            "id": str(business["_id"]),
+            "name": business["name"],
+            "neighborhood": address.get("neighborhood", ""),
+            "city": address.get("city", ""),
+            "rating_average": business.get("rating_average", 0.0),
+            "total_reviews": business.get("total_reviews", 0),
+            "bayesian_score": business.get("bayesian_score", 0.0),
+            "card_image": card_image_url(business.get("images"))
+        }
@@ -0,0 +1,174 @@
+import re
+import unicodedata
+from datetime import datetime
+from typing import Iterable, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+from services.tracing import traced_methods
+import logging
+
+logger = logging.getLogger(__name__)
+
+def canonical_key(name: Optional[str]) -> str:
+    """Canonical, accent- and case-insensitive key for a city or neighborhood"""
+    if not name:
+        return ""
+    normalized = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", normalized.lower()).strip("-")
+
+def with_location_keys(address: dict) -> dict:
+    """Address dict with its canonical city/neighborhood keys filled in"""
+    address = dict(address)
+    address["city_key"] = canonical_key(address.get("city"))
+    address["neighborhood_key"] = canonical_key(address.get("neighborhood"))
+    return address
+
+@traced_methods
+class LocationService:
+    """Maintains the ``locations`` collection: city -> neighborhood with counts.
+
+    Documents are keyed ``city:<city_key>`` and
+    ``neighborhood:<city_key>/<neighborhood_key>`` and hold the display name,
+    per-category business counts and the centroid of active businesses.
+    They are recomputed per affected city on every business write, so they
+    never drift the way ``$inc`` counters can.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.collection = db.locations
+
+    async def ensure_initialized(self):
+        """Backfill canonical keys on businesses and build locations if missing"""
+        # Businesses without an address have nothing to key
+        cursor = self.db.businesses.find(
+            {"address": {"$type": "object"}, "address.city_key": {"$exists": False}},
+            {"address": 1}
+        )
+        updates = [
+            UpdateOne({"_id": business["_id"]}, {"$set": {"address": with_location_keys(business.get("address") or {})}})
+            async for business in cursor
+        ]
+        if updates:
+            await self.db.businesses.bulk_write(updates, ordered=False)
+            logger.info(f"Backfilled location keys on {len(updates)} businesses")
+
+        if updates or not await self.collection.find_one({}, {"_id": 1}):
+            await self.rebuild()
+
+    async def rebuild(self):
+        """Recompute every location document"""
+        await self._refresh(None)
+
+    async def refresh_cities(self, city_keys: Iterable[str]):
+        """Recompute the location documents of the given cities"""
+        city_keys = sorted({key for key in city_keys if key})
+        if city_keys:
+            await self._refresh(city_keys)
+
+    async def _refresh(self, city_keys: Optional[List[str]]):
+        match = {"is_active": True}
+        if city_keys is not None:
+            match["address.city_key"] = {"$in": city_keys}
+
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {
+                    "city_key": "$address.city_key",
+                    "neighborhood_key": "$address.neighborhood_key",
+                    "category": "$category"
+                },
+                "city": {"$first": "$address.city"},
+                "neighborhood": {"$first": "$address.neighborhood"},
+                "count": {"$sum": 1},
+                "lat_sum": {"$sum": "$address.coordinates.lat"},
+                "lng_sum": {"$sum": "$address.coordinates.lng"}
+            }}
+        ]
+        groups = await self.db.businesses.aggregate(pipeline).to_list(length=None)
+
+        now = datetime.utcnow()
+        documents = {}
+        for group in groups:
+            # Missing fields are left out of the group key
+            city_key = group["_id"].get("city_key")
+            neighborhood_key = group["_id"].get("neighborhood_key", "")
+            if not city_key:
+                continue
+
+            city_doc = documents.setdefault(f"city:{city_key}", {
+                "kind": "city",
+                "city": group["city"],
+                "city_key": city_key
+            })
+            neighborhood_doc = documents.setdefault(f"neighborhood:{city_key}/{neighborhood_key}", {
+                "kind": "neighborhood",
+                "city": group["city"],
+                "city_key": city_key,
+                "neighborhood": group["neighborhood"],
+                "neighborhood_key": neighborhood_key
+            })
+            category = group["_id"].get("category", "")
+            for doc in (city_doc, neighborhood_doc):
+                counts = doc.setdefault("category_counts", {})
+                counts[category] = counts.get(category, 0) + group["count"]
+                doc["business_count"] = doc.get("business_count", 0) + group["count"]
+                doc["lat_sum"] = doc.get("lat_sum", 0.0) + group["lat_sum"]
+                doc["lng_sum"] = doc.get("lng_sum", 0.0) + group["lng_sum"]
+
+        operations = []
+        for doc_id, doc in documents.items():
+            lat_sum, lng_sum = doc.pop("lat_sum"), doc.pop("lng_sum")
+            doc["centroid"] = {
+                "lat": round(lat_sum / doc["business_count"], 6),
+                "lng": round(lng_sum / doc["business_count"], 6)
+            }
+            doc["updated_at"] = now
+            operations.append(ReplaceOne({"_id": doc_id}, doc, upsert=True))
+
+        # Locations that no longer have any active business
+        stale = {"_id": {"$nin": list(documents)}}
+        if city_keys is not None:
+            stale["city_key"] = {"$in": city_keys}
+        operations.append(DeleteMany(stale))
+
+        await self.collection.bulk_write(operations, ordered=False)
+
+    async def get_locations(self, city: Optional[str] = None) -> List[dict]:
+        """Cities with their neighborhoods, or the neighborhoods of one city"""
+        query = {}
+        if city:
+            query["city_key"] = canonical_key(city)
+
+        docs = await self.collection.find(query, {"updated_at": 0}).sort(
+            [("city_key", 1), ("neighborhood_key", 1)]
+        ).to_list(length=None)
+
+        cities = {}
+        for doc in docs:
+            if doc["kind"] == "city":
+                cities[doc["city_key"]] = {
+                    "city": doc["city"],
+                    "key": doc["city_key"],
+                    "business_count": doc["business_count"],
+                    "category_counts": doc["category_counts"],
+                    "centroid": doc["centroid"],
+                    "neighborhoods": []
+                }
+        for doc in docs:
+            if doc["kind"] == "neighborhood" and doc["city_key"] in cities:
+                cities[doc["city_key"]]["neighborhoods"].append({
+                    "neighborhood": doc["neighborhood"],
+                    "key": doc["neighborhood_key"],
+                    "business_count": doc["business_count"],
+                    "category_counts": doc["category_counts"],
+                    "centroid": doc["centroid"]
+                })
+
+        return list(cities.values())
+
+    async def get_city_names(self) -> List[str]:
+        """Display names of every city with active businesses"""
+        docs = await self.collection.find({"kind": "city"}, {"city": 1}).sort("city_key", 1).to_list(length=None)
+        return [doc["city"] for doc in docs]
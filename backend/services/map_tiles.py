@@ -0,0 +1,203 @@
+"""Slippy-map tiles of business locations in a compact packed binary format.
+
+Tile format (all integers little-endian)::
+
+    header    4s   magic b"ATT1"
+              B    format version (2)
+              B    zoom
+              I    tile x
+              I    tile y
+              H    extent (tile-local coordinate range, 4096)
+              H    number of categories in the table
+              I    number of features
+    table     per category: B length, then that many UTF-8 bytes
+    features  per feature (20 bytes):
+              H    x in tile-local pixels (0..extent-1, west to east)
+              H    y in tile-local pixels (0..extent-1, north to south)
+              H    index into the category table
+              H    number of businesses (1 for a single pin, more for a cluster)
+              12s  ObjectId of the business (the first member for clusters)
+
+Below ``CLUSTER_MAX_ZOOM`` businesses of the same category falling into the
+same cell of a ``CLUSTER_GRID`` x ``CLUSTER_GRID`` grid are merged into one
+cluster feature positioned at their centroid. A tile is built from at most
+``MAP_TILE_MAX_BUSINESSES`` businesses.
+"""
+import hashlib
+import math
+import os
+import struct
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.cache import TTLCache, InvalidationEvent, invalidation_bus, CACHE_TTL_SECONDS, CACHE_FALLBACK_TTL_SECONDS
+from services.tracing import traced_methods
+import logging
+
+logger = logging.getLogger(__name__)
+
+TILE_MAGIC = b"ATT1"
+TILE_VERSION = 2
+TILE_EXTENT = 4096
+MAX_ZOOM = 22
+CLUSTER_MAX_ZOOM = int(os.environ.get("MAP_TILE_CLUSTER_MAX_ZOOM", "15"))
+CLUSTER_GRID = 64
+# Bounds the work (and memory) of low-zoom tiles covering whole regions
+MAP_TILE_MAX_BUSINESSES = int(os.environ.get("MAP_TILE_MAX_BUSINESSES", "20000"))
+
+FEATURE_DTYPE = np.dtype([
+    ("x", "<u2"),
+    ("y", "<u2"),
+    ("category", "<u2"),
+    ("count", "<u2"),
+    ("id", "V12"),
+])
+
+# Only these fields decide what a tile contains
+TILE_FIELDS = ["address", "category", "is_active"]
+
+tile_cache = TTLCache(
+    "map_tiles",
+    ttl=CACHE_TTL_SECONDS,
+    fallback_ttl=CACHE_FALLBACK_TTL_SECONDS,
+    depends_on={"businesses": TILE_FIELDS},
+    maxsize=int(os.environ.get("MAP_TILE_CACHE_SIZE", "4096"))
+)
+_cached_zooms = set()
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(lat_min, lat_max, lng_min, lng_max) of a Web Mercator tile"""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), lat(y), x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0
+
+def tile_for(lat: float, lng: float, z: int) -> Tuple[int, int]:
+    """Tile containing a coordinate at zoom ``z``"""
+    n = 2 ** z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_tag(z: int, x: int, y: int) -> str:
+    return f"tile:{z}/{x}/{y}"
+
+def _on_business_change(event: InvalidationEvent):
+    """Drop the tiles covering a business's new location.
+
+    Tiles covering its old location are tagged with the business id and are
+    dropped by the cache itself.
+    """
+    if event.operation == "delete" or not event.touches(set(TILE_FIELDS)):
+        return
+
+    coordinates = ((event.document or {}).get("address") or {}).get("coordinates")
+    if not coordinates:
+        # New location unknown: every cached tile might now be wrong
+        tile_cache.clear()
+        return
+
+    tags = [tile_tag(z, *tile_for(coordinates["lat"], coordinates["lng"], z)) for z in _cached_zooms]
+    tile_cache.invalidate_tags(tags)
+
+invalidation_bus.subscribe("businesses", _on_business_change)
+
+@traced_methods
+class MapTileService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.collection = db.businesses
+
+    async def get_tile(self, z: int, x: int, y: int, category: Optional[str] = None) -> Tuple[bytes, str]:
+        """Get the encoded tile and its ETag"""
+        key = (z, x, y, category)
+        cached = tile_cache.get(key)
+        if cached is not None:
+            return cached
+
+        lat_min, lat_max, lng_min, lng_max = tile_bounds(z, x, y)
+        query = {
+            "is_active": True,
+            "address.coordinates.lat": {"$gte": lat_min, "$lt": lat_max},
+            "address.coordinates.lng": {"$gte": lng_min, "$lt": lng_max},
+        }
+        if category:
+            query["category"] = category
+
+        cursor = self.collection.find(
+            query,
+            {"category": 1, "address.coordinates.lat": 1, "address.coordinates.lng": 1}
+        ).limit(MAP_TILE_MAX_BUSINESSES)
+        businesses = await cursor.to_list(length=MAP_TILE_MAX_BUSINESSES)
+        if len(businesses) >= MAP_TILE_MAX_BUSINESSES:
+            logger.warning(f"Tile {z}/{x}/{y} truncated at {MAP_TILE_MAX_BUSINESSES} businesses")
+
+        body = self._encode(z, x, y, businesses)
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+        tags = [tile_tag(z, x, y)] + [f"businesses:{business['_id']}" for business in businesses]
+        tile_cache.set(key, (body, etag), tags=tags)
+        _cached_zooms.add(z)
+
+        return body, etag
+
+    def _encode(self, z: int, x: int, y: int, businesses: List[dict]) -> bytes:
+        lat_min, lat_max, lng_min, lng_max = tile_bounds(z, x, y)
+
+        categories: Dict[str, int] = {}
+        # (cell, category index) -> [sum px, sum py, count, first id]
+        groups: Dict[tuple, list] = defaultdict(lambda: [0.0, 0.0, 0, None])
+        cluster = z < CLUSTER_MAX_ZOOM
+
+        for business in businesses:
+            coordinates = business["address"]["coordinates"]
+            px = self._project_x(coordinates["lng"], lng_min, lng_max)
+            py = self._project_y(coordinates["lat"], z, y)
+            category_index = categories.setdefault(business.get("category", ""), len(categories))
+
+            if cluster:
+                cell = (int(px) * CLUSTER_GRID // TILE_EXTENT, int(py) * CLUSTER_GRID // TILE_EXTENT)
+            else:
+                cell = business["_id"]
+
+            group = groups[(cell, category_index)]
+            group[0] += px
+            group[1] += py
+            group[2] += 1
+            if group[3] is None:
+                group[3] = business["_id"].binary
+
+        features = np.zeros(len(groups), dtype=FEATURE_DTYPE)
+        for i, ((_, category_index), (sum_x, sum_y, count, first_id)) in enumerate(groups.items()):
+            features[i] = (
+                min(int(sum_x / count), TILE_EXTENT - 1),
+                min(int(sum_y / count), TILE_EXTENT - 1),
+                category_index,
+                min(count, 0xFFFF),
+                first_id,
+            )
+
+        header = struct.pack(
+            "<4sBBIIHHI",
+            TILE_MAGIC, TILE_VERSION, z, x, y, TILE_EXTENT, len(categories), len(features)
+        )
+        table = b"".join(
+            struct.pack("<B", len(encoded)) + encoded
+            for encoded in (name.encode("utf-8")[:255] for name in categories)
+        )
+        return header + table + features.tobytes()
+
+    @staticmethod
+    def _project_x(lng: float, lng_min: float, lng_max: float) -> float:
+        return (lng - lng_min) / (lng_max - lng_min) * TILE_EXTENT
+
+    @staticmethod
+    def _project_y(lat: float, z: int, y: int) -> float:
+        # Mercator y is not linear in latitude, so project in world pixels
+        lat = max(min(lat, 85.0511), -85.0511)
+        world_y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * (2 ** z)
+        return (world_y - y) * TILE_EXTENT
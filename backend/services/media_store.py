@@ -0,0 +1,200 @@
+"""Content-addressed local store for uploaded business images.
+
+Layout under ``MEDIA_ROOT``::
+
+    originals/<ab>/<sha256>.<ext>       the uploaded bytes, untouched
+    variants/<name>/<ab>/<sha256>.jpg   resized renditions (see VARIANTS)
+    tmp/                                uploads in progress
+
+Files are named by the SHA-256 of the uploaded bytes, so the same image
+uploaded twice is stored once, and URLs never change content (served as
+immutable).
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from fastapi import UploadFile
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from models.business import MEDIA_URL_PREFIX
+from services.tracing import traced_methods
+import logging
+
+logger = logging.getLogger(__name__)
+
+MEDIA_ROOT = Path(os.environ.get("MEDIA_ROOT", Path(__file__).parent.parent / "media"))
+MAX_UPLOAD_BYTES = int(os.environ.get("MEDIA_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.environ.get("MEDIA_MAX_IMAGE_PIXELS", str(40_000_000)))
+THUMBNAIL_WORKERS = int(os.environ.get("MEDIA_THUMBNAIL_WORKERS", "2"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# name -> (width, height, mode): "crop" fills exactly that size (list cards),
+# "fit" bounds the image keeping its aspect ratio (detail pages)
+VARIANTS = {
+    "card": (400, 300, "crop"),
+    "detail": (1200, 900, "fit"),
+}
+
+FORMATS = {
+    "JPEG": ("jpg", "image/jpeg"),
+    "PNG": ("png", "image/png"),
+    "WEBP": ("webp", "image/webp"),
+    "GIF": ("gif", "image/gif"),
+}
+
+class InvalidImage(Exception):
+    """The upload is not an image the store accepts"""
+
+def is_media_id(value: str) -> bool:
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+def original_path(digest: str, extension: str) -> Path:
+    return MEDIA_ROOT / "originals" / digest[:2] / f"{digest}.{extension}"
+
+def variant_path(digest: str, variant: str) -> Path:
+    return MEDIA_ROOT / "variants" / variant / digest[:2] / f"{digest}.jpg"
+
+def media_url(digest: str, variant: Optional[str] = None) -> str:
+    return f"{MEDIA_URL_PREFIX}/{digest}/{variant}" if variant else f"{MEDIA_URL_PREFIX}/{digest}"
+
+def _render_variants(source: str, digest: str) -> dict:
+    """Validate an image and write its variants; runs in a worker process"""
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    try:
+        with Image.open(source) as image:
+            image.verify()
+        with Image.open(source) as image:
+            if image.format not in FORMATS:
+                raise InvalidImage(f"Unsupported image format {image.format}")
+            info = {"format": image.format, "width": image.width, "height": image.height, "variants": {}}
+
+            image = ImageOps.exif_transpose(image)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+
+            for name, (width, height, mode) in VARIANTS.items():
+                if mode == "crop":
+                    rendition = ImageOps.fit(image, (width, height), Image.LANCZOS)
+                else:
+                    rendition = image.copy()
+                    rendition.thumbnail((width, height), Image.LANCZOS)
+
+                path = variant_path(digest, name)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                partial = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+                rendition.save(partial, "JPEG", quality=82, optimize=True, progressive=True)
+                os.replace(partial, path)
+                info["variants"][name] = {
+                    "width": rendition.width,
+                    "height": rendition.height,
+                    "size": path.stat().st_size
+                }
+            return info
+    except InvalidImage:
+        raise
+    except Exception as e:
+        # Pillow raises many types for corrupt or hostile files
+        raise InvalidImage(f"Not a valid image ({type(e).__name__})")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
+
+@traced_methods
+class MediaService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.collection = db.media
+
+    async def store_upload(self, upload: UploadFile) -> dict:
+        """Stream an upload into the store, deduplicated by content hash"""
+        tmp_dir = MEDIA_ROOT / "tmp"
+        await asyncio.to_thread(tmp_dir.mkdir, parents=True, exist_ok=True)
+        tmp_path = tmp_dir / uuid.uuid4().hex
+
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as tmp_file:
+                while True:
+                    chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > MAX_UPLOAD_BYTES:
+                        raise InvalidImage(f"Image is larger than {MAX_UPLOAD_BYTES} bytes")
+                    digest.update(chunk)
+                    await asyncio.to_thread(tmp_file.write, chunk)
+
+            media_id = digest.hexdigest()
+            existing = await self.collection.find_one({"_id": media_id})
+            if existing is not None:
+                return self._describe(existing, deduplicated=True)
+
+            loop = asyncio.get_running_loop()
+            info = await loop.run_in_executor(_get_pool(), _render_variants, str(tmp_path), media_id)
+
+            extension, content_type = FORMATS[info["format"]]
+            destination = original_path(media_id, extension)
+            await asyncio.to_thread(destination.parent.mkdir, parents=True, exist_ok=True)
+            await asyncio.to_thread(os.replace, tmp_path, destination)
+
+            media_doc = {
+                "_id": media_id,
+                "content_type": content_type,
+                "extension": extension,
+                "size": size,
+                "width": info["width"],
+                "height": info["height"],
+                "variants": info["variants"],
+                "created_at": datetime.utcnow()
+            }
+            try:
+                await self.collection.insert_one(media_doc)
+            except DuplicateKeyError:
+                # The same image finished uploading concurrently
+                return self._describe(media_doc, deduplicated=True)
+
+            logger.info(f"Stored media {media_id} ({size} bytes, {info['width']}x{info['height']})")
+            return self._describe(media_doc, deduplicated=False)
+        finally:
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+
+    async def get_original(self, media_id: str) -> Optional[dict]:
+        """Media document of an original, if stored"""
+        if not is_media_id(media_id):
+            return None
+        return await self.collection.find_one({"_id": media_id}, {"content_type": 1, "extension": 1})
+
+    @staticmethod
+    def _describe(media_doc: dict, deduplicated: bool) -> dict:
+        return {
+            "id": media_doc["_id"],
+            "url": media_url(media_doc["_id"]),
+            "content_type": media_doc["content_type"],
+            "size": media_doc["size"],
+            "width": media_doc["width"],
+            "height": media_doc["height"],
+            "variants": {
+                name: {**variant, "url": media_url(media_doc["_id"], name)}
+                for name, variant in media_doc["variants"].items()
+            },
+            "deduplicated": deduplicated
+        }
@@ -0,0 +1,439 @@
+"""Columnar in-memory snapshot of every active business location.
+
+Payload format (all integers little-endian)::
+
+    header    4s   magic b"ATS1"
+              B    format version (1)
+              B    flags (bit 0 set: delta against the client's version)
+              H    number of categories in the table
+              8s   epoch (identifies this snapshot lineage)
+              I    version
+              I    number of rows
+              I    number of removed ids (deltas only)
+    table     per category code: B length, then that many UTF-8 bytes
+    columns   ids       rows * 12 bytes (ObjectId)
+              lat       rows * float32
+              lng       rows * float32
+              category  rows * uint8 (index into the table)
+    removed   removed * 12 bytes (ObjectId)
+
+The client keeps the ``X-Snapshot-Version`` header (``<epoch>:<version>``)
+and passes it back as ``since`` to get only the rows changed after it. Epoch
+and version are shared by every worker: the epoch is stored on the
+``businesses`` document of ``collection_versions`` and the version is that
+document's counter, as relayed by the change stream. A ``since`` from
+another epoch, newer than this worker has seen, or older than the retained
+history gets a full snapshot (flags bit 0 clear). Clients apply ``removed``
+before upserting ``rows``: a business removed and re-added since the
+client's version appears in both. Category codes index the table of the
+same payload only.
+"""
+import asyncio
+import os
+import struct
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import numpy as np
+from bson import Binary, ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from services.cache import InvalidationEvent, cache_registry, invalidation_bus, CACHE_FALLBACK_TTL_SECONDS
+import logging
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"ATS1"
+SNAPSHOT_FORMAT = 1
+FLAG_DELTA = 1
+HEADER = struct.Struct("<4sBBH8sIII")
+
+SNAPSHOT_FIELDS = {"address", "category", "is_active"}
+MAX_TOMBSTONES = int(os.environ.get("PIN_SNAPSHOT_MAX_TOMBSTONES", "10000"))
+# Row version of changes made after the last counter value seen
+PENDING = 0xFFFFFFFF
+
+async def shared_lineage(db: AsyncIOMotorDatabase) -> Tuple[bytes, int]:
+    """(epoch, version) of the businesses counter, creating the epoch once"""
+    try:
+        await db.collection_versions.update_one(
+            {"_id": "businesses", "snapshot_epoch": {"$exists": False}},
+            {"$set": {"snapshot_epoch": Binary(os.urandom(8))}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another worker created it first
+        pass
+    doc = await db.collection_versions.find_one({"_id": "businesses"}, {"snapshot_epoch": 1, "version": 1})
+    return bytes(doc["snapshot_epoch"]), doc.get("version", 0)
+
+class PinSnapshotStore:
+    """Per-worker columnar store of pin coordinates with versioned deltas.
+
+    Rows are never moved while the process lives: removed businesses are
+    marked dead and their ids kept as tombstones, so every row can carry the
+    version at which it last changed and a delta is one vectorized mask.
+
+    Versions are values of the shared businesses counter, so a client may
+    take ``since`` from one worker to another. A row changed by an event is
+    stamped with the first counter value relayed after that event; as every
+    worker sees events in oplog order, a payload at version ``v`` from any
+    worker lacks only changes stamped above ``v``. While a stream relays
+    changes, this worker's own writes are applied when relayed, in order.
+    Stamps may only err high (re-sending a row), so any row touched again is
+    restamped even if its pin did not change. Without a change stream
+    workers do not see each other's writes, and only the local counter
+    bumps advance the version; the store is then reloaded in the
+    background once it is older than CACHE_FALLBACK_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self._load_lock = asyncio.Lock()
+        self._loaded_at = 0.0
+        self._loading = False
+        self._reload_again = False
+        # Ids changed while loading, refreshed after the load
+        self._dirty: Set[bytes] = set()
+        # Versions at which a refresh or reload started; the advertised
+        # version stays there until they finish
+        self._holds: Counter = Counter()
+
+        # Called with (row, old values or None, new values or None) on every
+        # change, where values are (lat, lng, category code); called with
+        # (None, None, None) after a full reload
+        self.listeners: List[Callable] = []
+
+        self._reset()
+
+    def _reset(self, epoch: bytes = b"\0" * 8, version: int = 0):
+        self.epoch = epoch
+        # Last counter value relayed
+        self.counter = version
+        self._has_pending = False
+        # Bumped on every change, keys the cached full payload
+        self._changes = 0
+
+        self.ids = np.zeros((0, 12), dtype=np.uint8)
+        self.lat = np.zeros(0, dtype=np.float32)
+        self.lng = np.zeros(0, dtype=np.float32)
+        self.category = np.zeros(0, dtype=np.uint8)
+        self.alive = np.zeros(0, dtype=bool)
+        self.row_version = np.zeros(0, dtype=np.uint32)
+
+        self.categories: List[str] = []
+        self._category_codes: Dict[str, int] = {}
+        self._rows: Dict[bytes, int] = {}
+        # (version, id bytes) of rows removed, oldest first
+        self._tombstones: List[Tuple[int, bytes]] = []
+        self._min_delta_version = 0
+        self._full_payload: Optional[Tuple[int, bytes]] = None
+
+    @property
+    def version(self) -> int:
+        """Counter value every row is current to"""
+        if self._holds:
+            return min(self.counter, min(self._holds))
+        return self.counter
+
+    @property
+    def version_token(self) -> str:
+        return f"{self.epoch.hex()}:{self.version}"
+
+    @property
+    def fresh(self) -> bool:
+        """Whether other workers' changes are known to be applied"""
+        if not self.loaded:
+            return False
+        return invalidation_bus.stream_active or time.monotonic() - self._loaded_at < CACHE_FALLBACK_TTL_SECONDS
+
+    async def ensure_loaded(self, db: AsyncIOMotorDatabase):
+        if self.loaded:
+            if not self.fresh:
+                # No stream relays other workers' writes: reload in the background
+                self._reload_soon()
+            return
+        async with self._load_lock:
+            if not self.loaded:
+                await self.load(db)
+
+    async def load(self, db: AsyncIOMotorDatabase):
+        """(Re)build the store from every active business"""
+        self.db = db
+        self._loading = True
+        self._reload_again = False
+        self._dirty = set()
+        started = time.monotonic()
+        try:
+            # Read the counter first: rows written after it are re-sent, never missed
+            epoch, version = await shared_lineage(db)
+            cursor = db.businesses.find(
+                {"is_active": True},
+                {"category": 1, "address.coordinates": 1}
+            )
+            businesses = await cursor.to_list(length=None)
+        finally:
+            self._loading = False
+
+        self._reset(epoch, version)
+        n = len(businesses)
+        self.ids = np.zeros((n, 12), dtype=np.uint8)
+        self.lat = np.zeros(n, dtype=np.float32)
+        self.lng = np.zeros(n, dtype=np.float32)
+        self.category = np.zeros(n, dtype=np.uint8)
+        self.alive = np.ones(n, dtype=bool)
+        self.row_version = np.full(n, version, dtype=np.uint32)
+
+        for row, business in enumerate(businesses):
+            lat, lng = self._coordinates(business)
+            id_bytes = business["_id"].binary
+            self.ids[row] = np.frombuffer(id_bytes, dtype=np.uint8)
+            self.lat[row] = lat
+            self.lng[row] = lng
+            self.category[row] = self._category_code(business.get("category", ""))
+            self._rows[id_bytes] = row
+
+        self._min_delta_version = version
+        self.loaded = True
+        self._loaded_at = started
+        self._notify(None, None, None)
+        logger.info(f"Pin snapshot loaded: {n} businesses, {len(self.categories)} categories, version {version}")
+
+        # Changes the load may have read too early
+        if self._reload_again:
+            self._reload_soon()
+            return
+        dirty, self._dirty = self._dirty, set()
+        for id_bytes in dirty:
+            await self._refresh(ObjectId(id_bytes))
+
+    def _reload_soon(self):
+        if self._loading or self.db is None:
+            return
+        self._loading = True
+        self._run_held(self.load(self.db))
+
+    def clear(self):
+        """Changes may have been missed; reload"""
+        if self.loaded:
+            self._reload_soon()
+
+    def stats(self) -> dict:
+        return {
+            "name": "pin_snapshot",
+            "size": int(self.alive.sum()),
+            "version": self.version,
+            "counter": self.counter,
+            "tombstones": len(self._tombstones),
+        }
+
+    def category_code(self, name: str) -> Optional[int]:
+        """Code of a category, or None if no live business ever had it"""
+        return self._category_codes.get(name)
+
+    def columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(lat, lng, category) of the live rows"""
+        return self.lat[self.alive], self.lng[self.alive], self.category[self.alive]
+
+    def full_payload(self) -> bytes:
+        key = (self.version, self._changes)
+        if self._full_payload is None or self._full_payload[0] != key:
+            mask = self.alive
+            self._full_payload = (key, self._encode(mask, [], delta=False))
+        return self._full_payload[1]
+
+    def delta_payload(self, since: str) -> Optional[bytes]:
+        """Rows changed after ``since``; None when a full snapshot is needed"""
+        epoch_hex, _, version = since.partition(":")
+        try:
+            if bytes.fromhex(epoch_hex) != self.epoch:
+                return None
+            since_version = int(version)
+        except ValueError:
+            return None
+        if since_version < self._min_delta_version or since_version > self.version:
+            return None
+
+        mask = self.alive & (self.row_version > since_version)
+        removed = [id_bytes for version, id_bytes in self._tombstones if version > since_version]
+        return self._encode(mask, removed, delta=True)
+
+    def apply(self, business_id: ObjectId, business: Optional[dict]):
+        """Insert, move or remove one business (None or inactive removes it)"""
+        id_bytes = business_id.binary
+        row = self._rows.get(id_bytes)
+        old = None
+        if row is not None and self.alive[row]:
+            old = (float(self.lat[row]), float(self.lng[row]), int(self.category[row]))
+
+        if business is None or not business.get("is_active", True):
+            if row is None:
+                return
+            self._has_pending = True
+            self.row_version[row] = PENDING
+            if old is None:
+                # Already removed: move its tombstone to the pending end
+                self._tombstones = [entry for entry in self._tombstones if entry[1] != id_bytes]
+                self._tombstones.append((PENDING, id_bytes))
+                return
+            self._changes += 1
+            self.alive[row] = False
+            self._tombstones.append((PENDING, id_bytes))
+            if len(self._tombstones) > MAX_TOMBSTONES:
+                dropped_version, _ = self._tombstones.pop(0)
+                # Every version handed out so far may lack a pending one
+                self._min_delta_version = max(self._min_delta_version, min(dropped_version, self.counter + 1))
+            self._notify(row, old, None)
+            return
+
+        lat, lng = self._coordinates(business)
+        code = self._category_code(business.get("category", ""))
+        new = (float(np.float32(lat)), float(np.float32(lng)), code)
+        self._has_pending = True
+        if new == old:
+            self.row_version[row] = PENDING
+            return
+
+        self._changes += 1
+        if row is None:
+            row = len(self.lat)
+            self._rows[id_bytes] = row
+            self.ids = np.vstack([self.ids, np.frombuffer(id_bytes, dtype=np.uint8)])
+            self.lat = np.append(self.lat, np.float32(lat))
+            self.lng = np.append(self.lng, np.float32(lng))
+            self.category = np.append(self.category, np.uint8(code))
+            self.alive = np.append(self.alive, True)
+            self.row_version = np.append(self.row_version, np.uint32(PENDING))
+        else:
+            self.lat[row] = lat
+            self.lng[row] = lng
+            self.category[row] = code
+            self.alive[row] = True
+            self.row_version[row] = PENDING
+        self._notify(row, old, new)
+
+    def advance(self, counter: int):
+        """Stamp pending changes with a newly relayed counter value"""
+        if counter <= self.counter:
+            return
+        if self._has_pending:
+            self.row_version[self.row_version == PENDING] = counter
+            for i in range(len(self._tombstones) - 1, -1, -1):
+                if self._tombstones[i][0] != PENDING:
+                    break
+                self._tombstones[i] = (counter, self._tombstones[i][1])
+            self._has_pending = False
+        self.counter = counter
+
+    @staticmethod
+    def _in_order(event: InvalidationEvent) -> bool:
+        # Local events would run ahead of changes still being relayed
+        return event.relayed or not invalidation_bus.stream_active
+
+    def on_event(self, event: InvalidationEvent):
+        if self.db is None or not self._in_order(event) or not event.touches(SNAPSHOT_FIELDS):
+            return
+        if event.document_id is None:
+            # Collection-wide change: rebuild from scratch
+            if self._loading:
+                self._reload_again = True
+            else:
+                self._reload_soon()
+            return
+        if not self.loaded and not self._loading:
+            return
+
+        business_id = ObjectId(event.document_id)
+        if self._loading:
+            self._dirty.add(business_id.binary)
+        if event.operation == "delete":
+            self.apply(business_id, None)
+        elif event.document is not None and "address" in event.document:
+            self.apply(business_id, event.document)
+        else:
+            self._run_held(self._refresh(business_id))
+
+    def on_counter_event(self, event: InvalidationEvent):
+        if event.document_id != "businesses" or not self._in_order(event):
+            return
+        # A relayed update's post-image is looked up later and may run ahead
+        values = event.updated_values if event.updated_values is not None else event.document
+        counter = (values or {}).get("version")
+        if counter is not None and self.loaded:
+            self.advance(int(counter))
+
+    def _run_held(self, work):
+        """Run ``work`` in the background without advertising versions it may not reflect yet"""
+        held = self.counter
+        self._holds[held] += 1
+
+        def release(_):
+            self._holds[held] -= 1
+            if not self._holds[held]:
+                del self._holds[held]
+
+        asyncio.ensure_future(work).add_done_callback(release)
+
+    async def _refresh(self, business_id: ObjectId):
+        try:
+            business = await self.db.businesses.find_one(
+                {"_id": business_id},
+                {"category": 1, "is_active": 1, "address.coordinates": 1}
+            )
+            self.apply(business_id, business)
+        except Exception as e:
+            logger.error(f"Error refreshing pin snapshot row {business_id}: {e}")
+
+    def _notify(self, row: int, old, new):
+        for listener in self.listeners:
+            try:
+                listener(row, old, new)
+            except Exception as e:
+                logger.error(f"Error in pin snapshot listener: {e}")
+
+    def _category_code(self, name: str) -> int:
+        code = self._category_codes.get(name)
+        if code is None:
+            if len(self.categories) >= 255:
+                raise ValueError("Pin snapshot supports at most 255 categories")
+            code = len(self.categories)
+            self.categories.append(name)
+            self._category_codes[name] = code
+        return code
+
+    @staticmethod
+    def _coordinates(business: dict) -> Tuple[float, float]:
+        coordinates = (business.get("address") or {}).get("coordinates") or {}
+        return coordinates.get("lat", 0.0), coordinates.get("lng", 0.0)
+
+    def _encode(self, mask: np.ndarray, removed: List[bytes], delta: bool) -> bytes:
+        header = HEADER.pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_FORMAT,
+            FLAG_DELTA if delta else 0,
+            len(self.categories),
+            self.epoch,
+            self.version,
+            int(mask.sum()),
+            len(removed)
+        )
+        table = b"".join(
+            struct.pack("<B", len(encoded)) + encoded
+            for encoded in (name.encode("utf-8")[:255] for name in self.categories)
+        )
+        return b"".join([
+            header,
+            table,
+            self.ids[mask].tobytes(),
+            self.lat[mask].astype("<f4").tobytes(),
+            self.lng[mask].astype("<f4").tobytes(),
+            self.category[mask].tobytes(),
+            b"".join(removed),
+        ])
+
+pin_snapshot = PinSnapshotStore()
+invalidation_bus.subscribe("businesses", pin_snapshot.on_event)
+invalidation_bus.subscribe("collection_versions", pin_snapshot.on_counter_event)
+# A change stream that restarts without a resume token triggers a reload
+cache_registry.append(pin_snapshot)
@@ -0,0 +1,248 @@
+"""Sampling profiler writing collapsed stacks for flamegraphs.
+
+A sampler thread periodically captures a stack from the event loop
+thread. Each sample is weighted by the microseconds since the previous
+one: the sampler only gets the GIL between the loop's switch intervals,
+so busy stretches are sampled less often than waits, and plain counts
+would overstate waiting. Output uses the collapsed format
+(``frame;frame;frame weight`` per line) that speedscope, inferno and
+flamegraph.pl read directly.
+
+Request profiles follow one asyncio task, so concurrent requests do not
+show up in each other's profiles. While the task runs, its frames come
+from the loop thread. While it is suspended, they come from walking its
+chain of awaiting coroutines, and the stack ends in a ``[waiting]`` frame.
+This makes the profile wall-clock: time spent waiting on Motor shows up
+under the call that awaited it.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "asteria-profiles")))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "2"))
+PROFILE_MAX_BYTES = int(os.environ.get("PROFILE_MAX_BYTES", str(100 * 1024 * 1024)))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "500"))
+# Continuous whole-process sampling; 0 disables it
+PROFILE_CONTINUOUS_HZ = float(os.environ.get("PROFILE_CONTINUOUS_HZ", "0"))
+PROFILE_CONTINUOUS_WINDOW_SECONDS = int(os.environ.get("PROFILE_CONTINUOUS_WINDOW_SECONDS", "300"))
+
+PROFILE_SUFFIX = ".collapsed"
+WAITING_FRAME = "[waiting]"
+
+_SITE_PREFIXES = sorted({os.path.abspath(p) for p in sys.path + [os.getcwd()] if os.path.isdir(p)}, key=len, reverse=True)
+
+def _short_path(filename: str) -> str:
+    for prefix in _SITE_PREFIXES:
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+def thread_stack(frame, stop_at=None) -> List[str]:
+    """Labels from the outermost frame to ``frame``, starting at ``stop_at`` if it is on the stack"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        if frame is stop_at:
+            break
+        frame = frame.f_back
+    else:
+        if stop_at is not None:
+            return []
+    return [frame_label(f) for f in reversed(frames)]
+
+def awaiting_stack(coro) -> List[str]:
+    """Labels along a suspended coroutine's await chain, outermost first"""
+    labels = []
+    awaitable = coro
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(frame_label(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    labels.append(WAITING_FRAME)
+    return labels
+
+def task_stack(task: asyncio.Task, thread_id: int) -> Optional[List[str]]:
+    """Current stack of ``task``, whether it is running or suspended"""
+    coro = task.get_coro()
+    root = getattr(coro, "cr_frame", None)
+    if root is None:
+        return None
+    running = thread_stack(sys._current_frames().get(thread_id), stop_at=root)
+    return running or awaiting_stack(coro)
+
+def collapse(counts: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+class ProfileStore:
+    """Profile files in PROFILE_DIR, pruned oldest-first to stay within budget"""
+
+    def __init__(self, directory: Path = PROFILE_DIR, max_bytes: int = PROFILE_MAX_BYTES, max_files: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_name(kind: str, label: str = "") -> str:
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        slug = "".join(c if c.isalnum() else "-" for c in label).strip("-")[:60]
+        parts = [stamp, kind] + ([slug] if slug else []) + [uuid.uuid4().hex[:8]]
+        return "-".join(parts) + PROFILE_SUFFIX
+
+    def path(self, name: str) -> Optional[Path]:
+        """Path of a stored profile, or None for names outside the store"""
+        if os.sep in name or not name.endswith(PROFILE_SUFFIX):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+    def write(self, name: str, counts: Counter):
+        if not counts:
+            return
+        with self._lock:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                tmp = self.directory / f".{name}.tmp"
+                tmp.write_text(collapse(counts))
+                tmp.replace(self.directory / name)
+                self._prune()
+            except OSError as e:
+                logger.error(f"Error writing profile {name}: {e}")
+
+    def list(self) -> List[dict]:
+        profiles = []
+        for path in self.directory.glob(f"*{PROFILE_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            profiles.append({
+                "name": path.name,
+                "size": stat.st_size,
+                "created_at": datetime.utcfromtimestamp(stat.st_mtime),
+            })
+        profiles.sort(key=lambda p: p["created_at"], reverse=True)
+        return profiles
+
+    def _prune(self):
+        files = []
+        for path in self.directory.glob(f"*{PROFILE_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        while files and (total > self.max_bytes or len(files) > self.max_files):
+            _, size, path = files.pop(0)
+            path.unlink(missing_ok=True)
+            total -= size
+
+profile_store = ProfileStore()
+
+class TaskProfiler(threading.Thread):
+    """Samples one asyncio task until stopped, then writes its profile"""
+
+    def __init__(self, task: asyncio.Task, name: str, store: ProfileStore = profile_store, interval_ms: float = PROFILE_INTERVAL_MS):
+        super().__init__(name=f"profiler-{name}", daemon=True)
+        self.task = task
+        self.thread_id = threading.get_ident()
+        self.profile_name = name
+        self.store = store
+        self.interval = interval_ms / 1000
+        self.counts: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Stop sampling; the file is written from the sampler thread"""
+        self._stopped.set()
+
+    def run(self):
+        last = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            try:
+                stack = task_stack(self.task, self.thread_id)
+            except (AttributeError, RuntimeError, ValueError):
+                # The task moved on while we walked it
+                continue
+            if stack:
+                self.counts[";".join(stack)] += round(elapsed * 1e6)
+        self.store.write(self.profile_name, self.counts)
+
+class ContinuousProfiler:
+    """Samples the event loop thread at a low rate, one profile per window"""
+
+    def __init__(self, hz: float = PROFILE_CONTINUOUS_HZ, window_seconds: int = PROFILE_CONTINUOUS_WINDOW_SECONDS, store: ProfileStore = profile_store):
+        self.hz = hz
+        self.window_seconds = window_seconds
+        self.store = store
+        self.samples_total = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start sampling the calling thread (the event loop thread)"""
+        if self.hz <= 0 or self.running:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(threading.get_ident(),), name="profiler-continuous", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Continuous profiling at {self.hz} Hz into {self.store.directory}")
+
+    def stop(self):
+        if self._thread:
+            self._stopped.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self, thread_id: int):
+        interval = 1 / self.hz
+        counts: Counter = Counter()
+        window_end = time.monotonic() + self.window_seconds
+        last = time.perf_counter()
+        while not self._stopped.wait(interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frame = sys._current_frames().get(thread_id)
+            # Skip samples of the loop idling in its selector
+            if frame is None or frame.f_code.co_filename.endswith("selectors.py"):
+                continue
+            counts[";".join(thread_stack(frame))] += round(elapsed * 1e6)
+            self.samples_total += 1
+
+            if time.monotonic() >= window_end:
+                self.store.write(self.store.new_name("continuous"), counts)
+                counts = Counter()
+                window_end = time.monotonic() + self.window_seconds
+        self.store.write(self.store.new_name("continuous"), counts)
+
+continuous_profiler = ContinuousProfiler()
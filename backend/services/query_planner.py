@@ -0,0 +1,192 @@
+"""Index-aware planning of business listing queries.
+
+Every listing query is an equality match on a *scope* (any of category,
+city and neighborhood, always with ``is_active``), one of the ``SORTS`` and
+optional refinements. A query is only run when one of ``LISTING_INDEXES``
+has exactly the scope's fields as its equality prefix followed by the sort
+keys (equality, sort, range), so it is answered by walking that index in
+order and stopping at ``limit``: no collection scan and no in-memory sort.
+Refinements the index does not cover are applied to the documents fetched
+while walking it and reported as warnings, since a very selective one makes
+the walk long.
+"""
+import re
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+from services.location_service import canonical_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+IndexKeys = List[Tuple[str, int]]
+
+SORTS: Dict[str, IndexKeys] = {
+    "score": [("bayesian_score", -1)],
+    "rating": [("rating_average", -1), ("total_reviews", -1)],
+    "newest": [("created_at", -1)],
+    # Time-decayed review velocity, see services/trending.py
+    "trending": [("trend_score", -1)],
+}
+DEFAULT_SORT = "score"
+
+# Query parameter -> document field matched by equality
+SCOPE_FIELDS = {
+    "category": "category",
+    "city": "address.city_key",
+    "neighborhood": "address.neighborhood_key",
+}
+
+LISTING_INDEXES: List[IndexKeys] = [
+    # Best-first (Bayesian score) in every scope
+    [("is_active", 1), ("bayesian_score", -1)],
+    [("category", 1), ("is_active", 1), ("bayesian_score", -1)],
+    [("address.city_key", 1), ("is_active", 1), ("bayesian_score", -1)],
+    [("address.city_key", 1), ("address.neighborhood_key", 1), ("is_active", 1), ("bayesian_score", -1)],
+    [("category", 1), ("address.city_key", 1), ("is_active", 1), ("bayesian_score", -1)],
+    [("category", 1), ("address.city_key", 1), ("address.neighborhood_key", 1), ("is_active", 1), ("bayesian_score", -1)],
+    # Raw rating and recency, platform-wide and per category
+    [("is_active", 1), ("rating_average", -1), ("total_reviews", -1)],
+    [("category", 1), ("is_active", 1), ("rating_average", -1), ("total_reviews", -1)],
+    [("is_active", 1), ("created_at", -1)],
+    [("category", 1), ("is_active", 1), ("created_at", -1)],
+    # Trending, platform-wide, per category and per city
+    [("is_active", 1), ("trend_score", -1)],
+    [("category", 1), ("is_active", 1), ("trend_score", -1)],
+    [("address.city_key", 1), ("is_active", 1), ("trend_score", -1)],
+    [("category", 1), ("address.city_key", 1), ("is_active", 1), ("trend_score", -1)],
+]
+
+class UnsupportedQuery(ValueError):
+    """No declared index can serve the requested filters and sort"""
+
+def index_name(keys: IndexKeys) -> str:
+    """MongoDB's default name for an index with these keys"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+class QueryPlan:
+    def __init__(
+        self,
+        filter: dict,
+        sort_name: str,
+        index: IndexKeys,
+        warnings: List[str],
+        scope: Dict[str, str],
+        refinements: dict
+    ):
+        self.filter = filter
+        self.sort_name = sort_name
+        self.sort = SORTS[sort_name]
+        self.index = index
+        self.warnings = warnings
+        # The request itself, for evaluating it without MongoDB: scope
+        # parameter -> canonical value, and the non-empty refinements
+        self.scope = scope
+        self.refinements = refinements
+
+    @property
+    def index_name(self) -> str:
+        return index_name(self.index)
+
+class QueryPlanner:
+    def __init__(self, indexes: List[IndexKeys] = LISTING_INDEXES):
+        self.indexes = indexes
+
+    async def ensure_indexes(self, collection):
+        """Create every declared index"""
+        for keys in self.indexes:
+            await collection.create_index(keys)
+
+    def plan(
+        self,
+        category: Optional[str] = None,
+        city: Optional[str] = None,
+        neighborhood: Optional[str] = None,
+        price_range: Optional[List[str]] = None,
+        services: Optional[List[str]] = None,
+        services_mode: str = "all",
+        is_verified: Optional[bool] = None,
+        min_rating: Optional[float] = None,
+        search: Optional[str] = None,
+        sort: str = DEFAULT_SORT
+    ) -> QueryPlan:
+        if sort not in SORTS:
+            raise UnsupportedQuery(f"Unknown sort {sort!r}; use one of {', '.join(SORTS)}")
+        if services_mode not in ("all", "any"):
+            raise UnsupportedQuery("services_mode must be 'all' or 'any'")
+
+        if neighborhood and not city:
+            raise UnsupportedQuery("neighborhood requires city")
+
+        scope = {"category": category, "city": canonical_key(city), "neighborhood": canonical_key(neighborhood)}
+        scope = {name: value for name, value in scope.items() if value}
+        index = self.index_for(scope.keys(), sort)
+        if index is None:
+            raise UnsupportedQuery(
+                f"Sorting by {sort} is not supported when filtering by "
+                f"{' + '.join(sorted(scope)) or 'nothing'}; supported: {self._describe_shapes()}"
+            )
+
+        query = {"is_active": True}
+        for name, value in scope.items():
+            query[SCOPE_FIELDS[name]] = value
+        if sort == "trending":
+            # Only businesses with recent reviews trend; the range on the
+            # sort key ends the index walk at the first zero score
+            query["trend_score"] = {"$gt": 0}
+
+        # Refinements, applied while walking the index
+        residual = []
+        if price_range:
+            query["price_range"] = price_range[0] if len(price_range) == 1 else {"$in": price_range}
+            residual.append("price_range")
+        if services:
+            query["services"] = {"$all" if services_mode == "all" else "$in": services}
+            residual.append("services")
+        if is_verified is not None:
+            query["is_verified"] = is_verified
+            residual.append("is_verified")
+        if min_rating is not None:
+            query["rating_average"] = {"$gte": min_rating}
+            # A range on the leading sort key bounds the index walk itself
+            if SORTS[sort][0][0] != "rating_average":
+                residual.append("min_rating")
+        if search:
+            pattern = re.escape(search)
+            query["$or"] = [
+                {"name": {"$regex": pattern, "$options": "i"}},
+                {"description": {"$regex": pattern, "$options": "i"}}
+            ]
+            residual.append("search")
+
+        warnings = [f"{name} is not indexed and is filtered while scanning {index_name(index)}" for name in residual]
+        refinements = {
+            "price_range": price_range, "services": services, "services_mode": services_mode,
+            "is_verified": is_verified, "min_rating": min_rating, "search": search
+        }
+        return QueryPlan(query, sort, index, warnings, scope, refinements)
+
+    def index_for(self, scope_names, sort: str) -> Optional[IndexKeys]:
+        """Declared index with exactly this scope as equality prefix, then the sort"""
+        equality = {SCOPE_FIELDS[name] for name in scope_names} | {"is_active"}
+        sort_keys = SORTS[sort]
+        for keys in self.indexes:
+            prefix, rest = keys[:len(equality)], keys[len(equality):]
+            if {field for field, _ in prefix} == equality and rest[:len(sort_keys)] == sort_keys:
+                return keys
+        return None
+
+    def allowed_shapes(self) -> List[Tuple[Tuple[str, ...], str]]:
+        """Every (scope, sort) combination a declared index serves"""
+        shapes = []
+        names = list(SCOPE_FIELDS)
+        for size in range(len(names) + 1):
+            for scope in combinations(names, size):
+                for sort in SORTS:
+                    if self.index_for(scope, sort) is not None:
+                        shapes.append((scope, sort))
+        return shapes
+
+    def _describe_shapes(self) -> str:
+        return "; ".join(f"{' + '.join(scope) or 'no filter'} by {sort}" for scope, sort in self.allowed_shapes())
+
+listing_planner = QueryPlanner()
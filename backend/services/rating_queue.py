@@ -0,0 +1,161 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set
+import logging
+
+logger = logging.getLogger(__name__)
+
+RecomputeFn = Callable[[str], Awaitable[None]]
+
+class RatingRecomputeQueue:
+    """Deduplicating, debounced work queue for business rating recomputes.
+
+    Every review write enqueues its business id. Ids already waiting are
+    coalesced, so a business is recomputed at most once per debounce window
+    no matter how many reviews arrive, and recomputes run with bounded
+    concurrency against the database.
+    """
+
+    def __init__(self, debounce_seconds: float = 5.0, max_concurrency: int = 4):
+        self.debounce_seconds = debounce_seconds
+        self.max_concurrency = max_concurrency
+        self._recompute: Optional[RecomputeFn] = None
+
+        # business_id -> monotonic time of the first enqueue in this window
+        self._pending: Dict[str, float] = {}
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.enqueued_total = 0
+        self.coalesced_total = 0
+        self.processed_total = 0
+        self.failed_total = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self._lag_sum = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._dispatcher is not None and not self._dispatcher.done()
+
+    def start(self, recompute: RecomputeFn):
+        """Start the dispatcher loop with the given recompute coroutine"""
+        if self.running:
+            return
+        self._recompute = recompute
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._run())
+        logger.info(
+            f"Rating queue started (debounce={self.debounce_seconds}s, "
+            f"concurrency={self.max_concurrency})"
+        )
+
+    async def stop(self, drain: bool = True):
+        """Stop the dispatcher, optionally flushing everything still pending"""
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+        if drain and self._recompute:
+            for business_id in list(self._pending):
+                if business_id not in self._in_flight:
+                    self._dispatch(business_id)
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def enqueue(self, business_id: str):
+        """Schedule a rating recompute, coalescing with any pending one"""
+        business_id = str(business_id)
+        self.enqueued_total += 1
+
+        if business_id in self._pending:
+            self.coalesced_total += 1
+            return
+
+        self._pending[business_id] = time.monotonic()
+        if self._wakeup:
+            self._wakeup.set()
+
+    def metrics(self) -> dict:
+        """Queue depth, throughput and lag metrics"""
+        now = time.monotonic()
+        oldest = min(self._pending.values(), default=None)
+        processed = self.processed_total + self.failed_total
+
+        return {
+            "running": self.running,
+            "depth": len(self._pending),
+            "in_flight": len(self._in_flight),
+            "debounce_seconds": self.debounce_seconds,
+            "max_concurrency": self.max_concurrency,
+            "enqueued_total": self.enqueued_total,
+            "coalesced_total": self.coalesced_total,
+            "processed_total": self.processed_total,
+            "failed_total": self.failed_total,
+            "oldest_pending_age_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+            "last_lag_seconds": round(self.last_lag_seconds, 3),
+            "max_lag_seconds": round(self.max_lag_seconds, 3),
+            "avg_lag_seconds": round(self._lag_sum / processed, 3) if processed else 0.0,
+        }
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            next_due = None
+
+            for business_id, first_seen in list(self._pending.items()):
+                due_at = first_seen + self.debounce_seconds
+                # A business already being recomputed stays pending until the
+                # running recompute finishes, so the newest reviews are counted
+                if due_at <= now and business_id not in self._in_flight:
+                    self._dispatch(business_id)
+                elif next_due is None or due_at < next_due:
+                    next_due = due_at
+
+            timeout = max(next_due - now, 0.05) if next_due is not None else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, business_id: str):
+        first_seen = self._pending.pop(business_id)
+        self._in_flight.add(business_id)
+        task = asyncio.create_task(self._process(business_id, first_seen))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, business_id: str, first_seen: float):
+        try:
+            async with self._semaphore:
+                lag = time.monotonic() - first_seen
+                self.last_lag_seconds = lag
+                self.max_lag_seconds = max(self.max_lag_seconds, lag)
+                self._lag_sum += lag
+
+                await self._recompute(business_id)
+                self.processed_total += 1
+        except Exception as e:
+            self.failed_total += 1
+            logger.error(f"Error recomputing rating for business {business_id}: {e}")
+        finally:
+            self._in_flight.discard(business_id)
+            if self._wakeup:
+                self._wakeup.set()
+
+rating_queue = RatingRecomputeQueue(
+    debounce_seconds=float(os.environ.get("RATING_DEBOUNCE_SECONDS", "5")),
+    max_concurrency=int(os.environ.get("RATING_MAX_CONCURRENCY", "4")),
+)
@@ -0,0 +1,415 @@
+"""In-process read model of every active business.
+
+Optional (``READ_MODEL_ENABLED``); when loaded, ``BusinessService`` serves
+listings, featured, category pages, single businesses and map pins from it
+instead of querying MongoDB, which stays the source of truth:
+
+* one ``BusinessRecord`` (``__slots__``) per business, holding the fields
+  filters need, the ``BusinessResponse`` and its pre-serialized JSON;
+* numpy columns of the sort keys, indexed by row, and sorted row orders
+  computed lazily and dropped on change;
+* row sets by category, city and (city, neighborhood).
+
+Like the pin snapshot it is kept current from invalidation-bus events
+(this worker's writes and the change stream). While the change stream is
+down it is only trusted for ``CACHE_FALLBACK_TTL_SECONDS`` after a load,
+and reloaded on demand after that.
+"""
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set
+import numpy as np
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from models.business import BusinessResponse
+from services.cache import InvalidationEvent, invalidation_bus, cache_registry, CACHE_FALLBACK_TTL_SECONDS
+from services.query_planner import QueryPlan
+from services.response_cache import SerializedList, encode_json
+import logging
+
+logger = logging.getLogger(__name__)
+
+READ_MODEL_ENABLED = os.environ.get("READ_MODEL_ENABLED", "false").lower() == "true"
+
+# Same as the featured pipeline's $ifNull
+UNFEATURED_POSITION = 9999
+MAP_PINS_LIMIT = 100
+
+class BusinessRecord:
+    __slots__ = (
+        "row", "id", "category", "city_key", "neighborhood_key", "neighborhood",
+        "price_range", "services", "is_verified", "name", "description",
+        "lat", "lng", "last_modified", "response", "json"
+    )
+
+    def __init__(self, row: int, business: dict):
+        response = BusinessResponse.from_mongo(dict(business))
+        address = business.get("address") or {}
+        coordinates = address.get("coordinates") or {}
+
+        self.row = row
+        self.id = str(business["_id"])
+        self.category = business.get("category")
+        self.city_key = address.get("city_key")
+        self.neighborhood_key = address.get("neighborhood_key")
+        self.neighborhood = address.get("neighborhood")
+        self.price_range = business.get("price_range")
+        self.services = frozenset(business.get("services") or ())
+        self.is_verified = business.get("is_verified", False)
+        # Lowercased for the case-insensitive search
+        self.name = (business.get("name") or "").lower()
+        self.description = (business.get("description") or "").lower()
+        self.lat = coordinates.get("lat")
+        self.lng = coordinates.get("lng")
+        self.last_modified = business.get("updated_at") or business.get("created_at")
+        self.response = response
+        self.json = encode_json(response)
+
+def _refinement_filter(refinements: dict) -> Optional[Callable[[BusinessRecord], bool]]:
+    """Predicate matching the planner's residual MongoDB filters"""
+    checks = []
+    if refinements.get("price_range"):
+        price_ranges = set(refinements["price_range"])
+        checks.append(lambda record: record.price_range in price_ranges)
+    if refinements.get("services"):
+        services = frozenset(refinements["services"])
+        if refinements.get("services_mode", "all") == "all":
+            checks.append(lambda record: services <= record.services)
+        else:
+            checks.append(lambda record: not services.isdisjoint(record.services))
+    if refinements.get("is_verified") is not None:
+        is_verified = refinements["is_verified"]
+        checks.append(lambda record: record.is_verified == is_verified)
+    if refinements.get("search"):
+        needle = refinements["search"].lower()
+        checks.append(lambda record: needle in record.name or needle in record.description)
+
+    if not checks:
+        return None
+    return lambda record: all(check(record) for check in checks)
+
+class DirectoryReadModel:
+    def __init__(self):
+        self.name = "read_model"
+        self.loaded = False
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self._load_lock = asyncio.Lock()
+        self._loading = False
+        # Businesses changed while a load was reading them
+        self._pending: Set[str] = set()
+        self._reload_again = False
+        self._loaded_at = 0.0
+        self._failed_at: Optional[float] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+        self._reset()
+
+    def _reset(self):
+        self.records: List[Optional[BusinessRecord]] = []
+        self._rows: Dict[str, int] = {}
+
+        self.alive = np.zeros(0, dtype=bool)
+        self.rating_average = np.zeros(0, dtype=np.float64)
+        self.total_reviews = np.zeros(0, dtype=np.int64)
+        self.bayesian_score = np.zeros(0, dtype=np.float64)
+        self.created_at = np.zeros(0, dtype=np.float64)
+        self.trend_score = np.zeros(0, dtype=np.float64)
+        self.featured_position = np.zeros(0, dtype=np.int64)
+
+        self.by_category: Dict[str, Set[int]] = defaultdict(set)
+        self.by_city: Dict[str, Set[int]] = defaultdict(set)
+        self.by_neighborhood: Dict[tuple, Set[int]] = defaultdict(set)
+
+        # sort name -> live rows in that order
+        self._orders: Dict[str, np.ndarray] = {}
+
+    @property
+    def fresh(self) -> bool:
+        if not self.loaded:
+            return False
+        return invalidation_bus.stream_active or time.monotonic() - self._loaded_at < CACHE_FALLBACK_TTL_SECONDS
+
+    def serves(self, session=None) -> bool:
+        """Whether reads may be served from memory (never inside a causal session)"""
+        if session is not None:
+            return False
+        if not self.loaded:
+            # A failed load is retried at most once per fallback TTL
+            if self._failed_at is not None and time.monotonic() - self._failed_at >= CACHE_FALLBACK_TTL_SECONDS:
+                self._reload_soon()
+            return False
+        if self.fresh:
+            self.hits += 1
+            return True
+        self.misses += 1
+        self._reload_soon()
+        return False
+
+    async def ensure_loaded(self, db: AsyncIOMotorDatabase):
+        if self.loaded:
+            return
+        async with self._load_lock:
+            if not self.loaded:
+                await self.load(db)
+
+    async def load(self, db: AsyncIOMotorDatabase):
+        """(Re)build the model from every active business"""
+        self.db = db
+        self._loading = True
+        self._pending = set()
+        self._reload_again = False
+        try:
+            started = time.monotonic()
+            businesses = await db.businesses.find({"is_active": True}).to_list(length=None)
+
+            self._reset()
+            for business in businesses:
+                self.apply(str(business["_id"]), business)
+            self.loaded = True
+            self._loaded_at = started
+            self._failed_at = None
+            self.reloads += 1
+        except Exception:
+            self._failed_at = time.monotonic()
+            raise
+        finally:
+            self._loading = False
+        logger.info(f"Read model loaded: {len(businesses)} businesses")
+
+        # Changes the load may have read too early
+        if self._reload_again:
+            self._reload_soon()
+            return
+        pending, self._pending = self._pending, set()
+        for business_id in pending:
+            await self._refresh(business_id)
+
+    def _reload_soon(self):
+        if self._loading or self.db is None:
+            return
+        self._loading = True
+        asyncio.ensure_future(self._background_load())
+
+    async def _background_load(self):
+        try:
+            await self.load(self.db)
+        except Exception as e:
+            logger.error(f"Error reloading read model: {e}")
+
+    def apply(self, business_id: str, business: Optional[dict]):
+        """Insert, replace or remove one business (None or inactive removes it)"""
+        row = self._rows.get(business_id)
+        if row is not None and self.alive[row]:
+            self._unindex(self.records[row])
+
+        if business is None or not business.get("is_active", True):
+            return
+
+        if row is None:
+            row = len(self.records)
+            self._rows[business_id] = row
+            self.records.append(None)
+            if row >= len(self.alive):
+                self._grow()
+
+        try:
+            record = BusinessRecord(row, business)
+        except Exception as e:
+            logger.error(f"Error loading business {business_id} into the read model: {e}")
+            return
+
+        self.records[row] = record
+        self.alive[row] = True
+        self.rating_average[row] = business.get("rating_average") or 0.0
+        self.total_reviews[row] = business.get("total_reviews") or 0
+        self.bayesian_score[row] = business.get("bayesian_score") or 0.0
+        self.created_at[row] = record.response.created_at.timestamp()
+        self.trend_score[row] = business.get("trend_score") or 0.0
+        featured_position = business.get("featured_position")
+        self.featured_position[row] = UNFEATURED_POSITION if featured_position is None else featured_position
+
+        self.by_category[record.category].add(row)
+        if record.city_key:
+            self.by_city[record.city_key].add(row)
+            self.by_neighborhood[(record.city_key, record.neighborhood_key)].add(row)
+        self._orders.clear()
+
+    def _grow(self):
+        """Double the columns' capacity; rows past the last record stay dead"""
+        extra = max(len(self.alive), 64)
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+        self.rating_average = np.concatenate([self.rating_average, np.zeros(extra, dtype=np.float64)])
+        self.total_reviews = np.concatenate([self.total_reviews, np.zeros(extra, dtype=np.int64)])
+        self.bayesian_score = np.concatenate([self.bayesian_score, np.zeros(extra, dtype=np.float64)])
+        self.created_at = np.concatenate([self.created_at, np.zeros(extra, dtype=np.float64)])
+        self.trend_score = np.concatenate([self.trend_score, np.zeros(extra, dtype=np.float64)])
+        self.featured_position = np.concatenate([
+            self.featured_position, np.full(extra, UNFEATURED_POSITION, dtype=np.int64)
+        ])
+
+    def _unindex(self, record: BusinessRecord):
+        self.alive[record.row] = False
+        self.records[record.row] = None
+        self.by_category[record.category].discard(record.row)
+        if record.city_key:
+            self.by_city[record.city_key].discard(record.row)
+            self.by_neighborhood[(record.city_key, record.neighborhood_key)].discard(record.row)
+        self._orders.clear()
+
+    def on_event(self, event: InvalidationEvent):
+        if self.db is None:
+            return
+        if event.document_id is None:
+            # Collection-wide change (rescoring, reconciliation)
+            if self._loading:
+                self._reload_again = True
+            else:
+                self._reload_soon()
+            return
+
+        if self._loading:
+            self._pending.add(event.document_id)
+        if event.operation == "delete":
+            self.apply(event.document_id, None)
+        elif event.document is not None and "name" in event.document and "address" in event.document:
+            # Whole post-image (after-images and change stream full documents)
+            self.apply(event.document_id, event.document)
+        else:
+            asyncio.ensure_future(self._refresh(event.document_id))
+
+    async def _refresh(self, business_id: str):
+        try:
+            business = await self.db.businesses.find_one({"_id": ObjectId(business_id)})
+            self.apply(business_id, business)
+        except Exception as e:
+            logger.error(f"Error refreshing read model business {business_id}: {e}")
+
+    # Reads
+
+    def get(self, business_id: str) -> Optional[BusinessRecord]:
+        row = self._rows.get(business_id)
+        return self.records[row] if row is not None else None
+
+    def find(self, plan: QueryPlan, limit: int, skip: int = 0) -> SerializedList:
+        """Businesses matching a listing plan, in its sort order"""
+        rows = self._scope_rows(plan.scope.get("category"), plan.scope.get("city"), plan.scope.get("neighborhood"))
+        order = self._order(plan.sort_name, rows)
+        min_rating = plan.refinements.get("min_rating")
+        if min_rating is not None:
+            order = order[self.rating_average[order] >= min_rating]
+        if plan.sort_name == "trending":
+            order = order[self.trend_score[order] > 0]
+        return self._page(order, _refinement_filter(plan.refinements), limit, skip)
+
+    def featured(self, limit: int) -> SerializedList:
+        return self._page(self._order("featured"), None, limit)
+
+    def by_category_name(self, category: str, limit: int) -> SerializedList:
+        return self._page(self._order("score", self.by_category.get(category, set())), None, limit)
+
+    def map_pins(self, category: Optional[str], city_key: Optional[str], neighborhood_key: Optional[str]) -> List[dict]:
+        """Businesses grouped by category, neighborhood and exact location"""
+        rows = self._scope_rows(category, city_key, neighborhood_key)
+        if rows is None:
+            rows = np.flatnonzero(self.alive).tolist()
+        groups: Dict[tuple, dict] = {}
+        for row in sorted(rows):
+            record = self.records[row]
+            key = (record.category, record.neighborhood, record.lat, record.lng)
+            pin = groups.get(key)
+            if pin is None:
+                if len(groups) >= MAP_PINS_LIMIT:
+                    continue
+                pin = groups[key] = {
+                    "count": 0, "category": record.category, "neighborhood": record.neighborhood,
+                    "lat": record.lat, "lng": record.lng
+                }
+            pin["count"] += 1
+        return list(groups.values())
+
+    def _scope_rows(self, category: Optional[str], city_key: Optional[str], neighborhood_key: Optional[str]) -> Optional[Set[int]]:
+        """Rows of a scope; None means every live row"""
+        sets = []
+        if category:
+            sets.append(self.by_category.get(category, set()))
+        if city_key and neighborhood_key:
+            sets.append(self.by_neighborhood.get((city_key, neighborhood_key), set()))
+        elif city_key:
+            sets.append(self.by_city.get(city_key, set()))
+        elif neighborhood_key:
+            sets.append({row for (_, key), rows in self.by_neighborhood.items() if key == neighborhood_key for row in rows})
+        if not sets:
+            return None
+        return set.intersection(*sorted(sets, key=len))
+
+    def _order(self, sort_name: str, rows: Optional[Set[int]] = None) -> np.ndarray:
+        order = self._orders.get(sort_name)
+        if order is None:
+            if sort_name == "score":
+                order = np.lexsort((-self.total_reviews, -self.bayesian_score))
+            elif sort_name == "rating":
+                order = np.lexsort((-self.total_reviews, -self.rating_average))
+            elif sort_name == "newest":
+                order = np.argsort(-self.created_at, kind="stable")
+            elif sort_name == "trending":
+                order = np.argsort(-self.trend_score, kind="stable")
+            elif sort_name == "featured":
+                order = np.lexsort((-self.total_reviews, -self.rating_average, self.featured_position))
+            else:
+                raise ValueError(f"Unknown sort {sort_name!r}")
+            order = order[self.alive[order]]
+            self._orders[sort_name] = order
+
+        if rows is None:
+            return order
+        mask = np.zeros(len(self.alive), dtype=bool)
+        mask[list(rows)] = True
+        return order[mask[order]]
+
+    def _page(
+        self,
+        order: np.ndarray,
+        predicate: Optional[Callable[[BusinessRecord], bool]],
+        limit: int,
+        skip: int = 0
+    ) -> SerializedList:
+        records = []
+        for row in order.tolist():
+            record = self.records[row]
+            if predicate is not None and not predicate(record):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            records.append(record)
+            if len(records) >= limit:
+                break
+        return SerializedList((record.response for record in records), (record.json for record in records))
+
+    # Cache registry protocol (stats endpoint, change stream restarts)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "size": int(self.alive.sum()),
+            "fresh": self.fresh,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
+
+    def clear(self):
+        """Changes may have been missed; reload before serving again"""
+        if self.loaded:
+            self.loaded = False
+            self._reload_soon()
+
+read_model = DirectoryReadModel()
+if READ_MODEL_ENABLED:
+    invalidation_bus.subscribe("businesses", read_model.on_event)
+    cache_registry.append(read_model)
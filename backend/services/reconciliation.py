@@ -0,0 +1,110 @@
+import time
+from datetime import datetime
+from typing import Dict, List
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from services.cache import invalidation_bus
+from services.version_service import VersionService
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Changed documents listed in a report; the counts always cover all of them
+MAX_DRIFT_SAMPLES = 20
+
+RATING_FIELDS = ["rating_average", "total_reviews", "updated_at"]
+
+class ReconciliationService:
+    """Recomputes every denormalized counter from its source collection.
+
+    Each counter family costs one grouped aggregation over the source plus
+    one projected scan of the target; only documents whose stored value
+    differs are written, with a single unordered ``bulk_write``.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, dry_run: bool = False):
+        self.db = db
+        self.dry_run = dry_run
+
+    async def reconcile_all(self) -> Dict[str, dict]:
+        """Reconcile every counter family and report the drift found"""
+        return {
+            "categories": await self.reconcile_category_counts(),
+            "business_ratings": await self.reconcile_business_ratings()
+        }
+
+    async def reconcile_category_counts(self) -> dict:
+        """``categories.business_count`` from active businesses"""
+        started = time.monotonic()
+        pipeline = [
+            {"$match": {"is_active": True}},
+            {"$group": {"_id": "$category", "count": {"$sum": 1}}}
+        ]
+        counts = {
+            group["_id"]: group["count"]
+            async for group in self.db.businesses.aggregate(pipeline)
+        }
+
+        operations, drift = [], []
+        checked = 0
+        async for category in self.db.categories.find({}, {"name": 1, "business_count": 1}):
+            checked += 1
+            expected = counts.get(category["name"], 0)
+            stored = category.get("business_count")
+            if stored != expected:
+                operations.append(UpdateOne({"_id": category["_id"]}, {"$set": {"business_count": expected}}))
+                drift.append({"id": str(category["_id"]), "name": category["name"], "stored": stored, "expected": expected})
+
+        if operations and not self.dry_run:
+            await self.db.categories.bulk_write(operations, ordered=False)
+            await VersionService(self.db).bump("categories")
+            invalidation_bus.notify("categories", "update", fields=["business_count"])
+
+        return self._report(checked, drift, started)
+
+    async def reconcile_business_ratings(self) -> dict:
+        """``rating_average``/``total_reviews`` of businesses from reviews"""
+        started = time.monotonic()
+        pipeline = [
+            {"$group": {
+                "_id": "$business_id",
+                "avg_rating": {"$avg": "$rating"},
+                "total_reviews": {"$sum": 1}
+            }}
+        ]
+        totals = {
+            group["_id"]: (round(group["avg_rating"], 1), group["total_reviews"])
+            async for group in self.db.reviews.aggregate(pipeline, allowDiskUse=True)
+        }
+
+        now = datetime.utcnow()
+        operations, drift = [], []
+        checked = 0
+        cursor = self.db.businesses.find({}, {"rating_average": 1, "total_reviews": 1}).batch_size(10000)
+        async for business in cursor:
+            checked += 1
+            # Same rounding and no-review defaults as update_business_rating
+            expected = totals.get(business["_id"], (0.0, 0))
+            stored = (business.get("rating_average"), business.get("total_reviews"))
+            if stored != expected:
+                operations.append(UpdateOne(
+                    {"_id": business["_id"]},
+                    {"$set": {"rating_average": expected[0], "total_reviews": expected[1], "updated_at": now}}
+                ))
+                drift.append({"id": str(business["_id"]), "stored": list(stored), "expected": list(expected)})
+
+        if operations and not self.dry_run:
+            await self.db.businesses.bulk_write(operations, ordered=False)
+            await VersionService(self.db).bump("businesses")
+            invalidation_bus.notify("businesses", "update", fields=RATING_FIELDS)
+
+        return self._report(checked, drift, started)
+
+    def _report(self, checked: int, drift: List[dict], started: float) -> dict:
+        return {
+            "checked": checked,
+            "changed": len(drift),
+            "applied": bool(drift) and not self.dry_run,
+            "duration_seconds": round(time.monotonic() - started, 3),
+            "samples": drift[:MAX_DRIFT_SAMPLES]
+        }
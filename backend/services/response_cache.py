@@ -0,0 +1,135 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from middleware.compression import MINIMUM_SIZE, compress, negotiate_encoding
+from services.cache import TTLCache
+from services.tracing import span
+
+def encode_json(data: Any) -> bytes:
+    """Compact UTF-8 JSON, as every cached response body is encoded"""
+    return json.dumps(jsonable_encoder(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class SerializedList(list):
+    """List of models that also carries each item's JSON encoding"""
+
+    __slots__ = ("fragments",)
+
+    def __init__(self, items: Iterable[Any] = (), fragments: Iterable[bytes] = ()):
+        super().__init__(items)
+        self.fragments = list(fragments)
+
+class CachedPayload:
+    """Serialized JSON response body plus its compressed variants.
+
+    Each encoding is compressed at most once per cache entry, so hot cached
+    responses are never recompressed per request.
+    """
+
+    __slots__ = ("body", "_encoded")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self._encoded: Dict[str, bytes] = {}
+
+    @classmethod
+    def from_data(cls, data: Any) -> "CachedPayload":
+        if isinstance(data, SerializedList):
+            # Items were serialized once, when they were loaded
+            return cls(b"[" + b",".join(data.fragments) + b"]")
+        with span("serialize.json"):
+            return cls(encode_json(data))
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        if encoding is None or len(self.body) < MINIMUM_SIZE:
+            return self.body
+        if encoding not in self._encoded:
+            with span("compress", attributes={"encoding": encoding, "bytes": len(self.body)}):
+                self._encoded[encoding] = compress(self.body, encoding)
+        return self._encoded[encoding]
+
+def payload_response(request: Request, payload: CachedPayload, headers: Optional[dict] = None) -> Response:
+    """Build a JSON response for a cached payload in the negotiated encoding"""
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    body = payload.encoded(encoding)
+
+    response_headers = {"Vary": "Accept-Encoding", **(headers or {})}
+    if body is not payload.body:
+        response_headers["Content-Encoding"] = encoding
+
+    return Response(content=body, media_type="application/json", headers=response_headers)
+
+async def serve_cached_json(
+    request: Request,
+    cache: TTLCache,
+    key: Hashable,
+    build: Callable[[], Awaitable[Any]],
+    headers: Optional[dict] = None
+) -> Response:
+    """Serve ``build()`` as JSON through ``cache``, keeping compressed bytes"""
+    payload = cache.get(key)
+    if payload is None:
+        payload = CachedPayload.from_data(await build())
+        cache.set(key, payload)
+    return payload_response(request, payload, headers)
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag derived from version parts (ids, timestamps, counters)"""
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+def list_etag(name: str, versions: Dict[str, dict], params: Iterable[Any] = ()) -> str:
+    """ETag for a list response from the versions of the collections it reads"""
+    return make_etag(name, tuple(params), tuple(sorted((k, v["version"]) for k, v in versions.items())))
+
+def latest_modified(versions: Dict[str, dict]) -> Optional[datetime]:
+    timestamps = [v["updated_at"] for v in versions.values() if v.get("updated_at")]
+    return max(timestamps) if timestamps else None
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since against the current validators"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence; If-Modified-Since is then ignored
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        # HTTP dates have one-second resolution
+        return last_modified.replace(microsecond=0) <= since
+
+    return False
+
+def list_validators(
+    request: Request,
+    name: str,
+    versions: Dict[str, dict],
+    params: Iterable[Any] = ()
+) -> Tuple[dict, bool]:
+    """Validator headers for a list response and whether the client copy is fresh"""
+    etag = list_etag(name, versions, params)
+    last_modified = latest_modified(versions)
+    return validator_headers(etag, last_modified), is_not_modified(request, etag, last_modified)
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
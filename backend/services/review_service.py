@@ -0,0 +1,56 @@
+from typing import List, Optional
+from datetime import datetime
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from models.review import ReviewCreate, ReviewResponse
+from services.cache import invalidation_bus
+from services.rating_queue import rating_queue
+from services.trending import TrendingService
+from services.tracing import traced_methods
+import logging
+
+logger = logging.getLogger(__name__)
+
+@traced_methods
+class ReviewService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.collection = db.reviews
+
+    async def create_review(self, review_data: ReviewCreate) -> Optional[ReviewResponse]:
+        """Create a review and schedule the business rating recompute"""
+        if not ObjectId.is_valid(review_data.business_id):
+            return None
+
+        business_id = ObjectId(review_data.business_id)
+        business = await self.db.businesses.find_one(
+            {"_id": business_id, "is_active": True},
+            {"_id": 1}
+        )
+        if not business:
+            return None
+
+        review_doc = {
+            **review_data.dict(),
+            "business_id": business_id,
+            "is_verified": False,
+            "created_at": datetime.utcnow()
+        }
+        await self.collection.insert_one(review_doc)
+        invalidation_bus.notify("reviews", "insert", review_doc["_id"], document=review_doc)
+
+        # Ratings are recomputed in the background, coalesced per business
+        rating_queue.enqueue(review_data.business_id)
+        try:
+            await TrendingService(self.db).record_review(business_id, review_doc["rating"], review_doc["created_at"])
+        except Exception as e:
+            # The nightly trend rebuild picks the review up
+            logger.error(f"Error updating trend score of business {business_id}: {e}")
+
+        return ReviewResponse.from_mongo(review_doc)
+
+    async def get_reviewed_business_ids(self, since: Optional[datetime] = None) -> List[str]:
+        """Ids of businesses with reviews created since a moment (all if None)"""
+        query = {"created_at": {"$gte": since}} if since else {}
+        business_ids = await self.collection.distinct("business_id", query)
+        return [str(business_id) for business_id in business_ids]
@@ -0,0 +1,349 @@
+import asyncio
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Called with the database and the start time of the job's last successful
+# run on any worker (None if it never succeeded)
+JobFn = Callable[[AsyncIOMotorDatabase, Optional[datetime]], Awaitable[None]]
+
+NEVER = datetime(1970, 1, 1)
+
+class CronSchedule:
+    """Minimal five-field cron expression (minute hour day month weekday), UTC.
+
+    Supports ``*``, numbers, ranges (``1-5``), steps (``*/15``, ``0-30/10``)
+    and comma-separated lists. Weekdays run 0-6 from Sunday; 7 is Sunday too.
+    """
+
+    FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+
+        values = [self._parse_field(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        self.weekdays = {day % 7 for day in weekdays}
+        # Like cron: when both day fields are restricted, either may match
+        self._any_day = parts[2] == "*"
+        self._any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            spec, _, step = part.partition("/")
+            step = int(step) if step else 1
+            if spec == "*":
+                start, end = low, high
+            elif "-" in spec:
+                start, end = (int(value) for value in spec.split("-", 1))
+            else:
+                start = end = int(spec)
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Invalid cron field {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_match = moment.day in self.days
+        # datetime.weekday() is 0 for Monday; cron counts from Sunday
+        weekday_match = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day:
+            return weekday_match
+        if self._any_weekday:
+            return day_match
+        return day_match or weekday_match
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after ``moment``"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+class Job:
+    """A named coroutine run on an interval or a cron schedule"""
+
+    def __init__(
+        self,
+        name: str,
+        func: JobFn,
+        interval_seconds: Optional[float] = None,
+        cron: Optional[str] = None,
+        lease_seconds: float = 300.0,
+        timeout_seconds: Optional[float] = None
+    ):
+        if (interval_seconds is None) == (cron is None):
+            raise ValueError(f"Job {name} needs exactly one of interval_seconds or cron")
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.cron = CronSchedule(cron) if cron else None
+        self.lease_seconds = lease_seconds
+        self.timeout_seconds = timeout_seconds
+
+        # Per-worker metrics
+        self.runs_total = 0
+        self.failures_total = 0
+        self.running = False
+
+    @property
+    def schedule(self) -> str:
+        return f"cron {self.cron.expression}" if self.cron else f"every {self.interval_seconds:g}s"
+
+    def first_run(self, now: datetime) -> datetime:
+        return self.cron.next_after(now) if self.cron else now
+
+    def next_run(self, started_at: datetime, now: datetime) -> datetime:
+        if self.cron:
+            return self.cron.next_after(now)
+        # Fixed rate, but never schedule into the past after a long run
+        return max(started_at + timedelta(seconds=self.interval_seconds), now)
+
+class JobScheduler:
+    """In-app scheduler where exactly one worker runs each job occurrence.
+
+    Every job has a lock document in ``scheduler_locks`` holding its next due
+    time and a lease. A worker runs a due job only after atomically taking
+    the lease, renews it while the job runs and releases it together with
+    the next due time, so the schedule is shared by all workers and a crashed
+    worker's lease simply expires. Each run is recorded in ``scheduler_runs``.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None, poll_seconds: float = 5.0):
+        self.worker_id = worker_id or os.environ.get("SCHEDULER_WORKER_ID", f"{socket.gethostname()}:{os.getpid()}")
+        self.poll_seconds = poll_seconds
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self.jobs: Dict[str, Job] = {}
+
+        # Job name -> earliest time worth trying to take its lease again
+        self._wake_at: Dict[str, datetime] = {}
+        self._job_tasks: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def add_job(self, job: Job):
+        if job.name in self.jobs:
+            raise ValueError(f"Job {job.name} is already registered")
+        self.jobs[job.name] = job
+
+    def start(self, db: AsyncIOMotorDatabase):
+        if self.running:
+            return
+        self.db = db
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Scheduler started as {self.worker_id} with {len(self.jobs)} jobs")
+
+    async def stop(self):
+        """Stop scheduling and wait for jobs running on this worker"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._job_tasks:
+            await asyncio.gather(*self._job_tasks, return_exceptions=True)
+
+    async def status(self, db: AsyncIOMotorDatabase, history: int = 10) -> List[dict]:
+        """Schedule, lease and recent runs of every job"""
+        locks = {
+            doc["_id"]: doc
+            async for doc in db.scheduler_locks.find({"_id": {"$in": list(self.jobs)}})
+        }
+
+        result = []
+        for name, job in self.jobs.items():
+            lock = locks.get(name, {})
+            runs = await db.scheduler_runs.find(
+                {"job": name}, {"_id": 0, "job": 0}
+            ).sort("started_at", -1).limit(history).to_list(length=None)
+
+            result.append({
+                "name": name,
+                "schedule": job.schedule,
+                "running_here": job.running,
+                "runs_here": job.runs_total,
+                "failures_here": job.failures_total,
+                "owner": lock.get("owner"),
+                "lease_until": lock.get("lease_until"),
+                "next_run_at": lock.get("next_run_at"),
+                "last_status": lock.get("last_status"),
+                "last_started_at": lock.get("last_started_at"),
+                "last_duration_ms": lock.get("last_duration_ms"),
+                "last_error": lock.get("last_error"),
+                "last_success_at": lock.get("last_success_at"),
+                "recent_runs": runs
+            })
+        return result
+
+    async def _run(self):
+        for job in self.jobs.values():
+            try:
+                await self._ensure_lock(job)
+            except Exception as e:
+                # Retried by _acquire on the next poll
+                logger.error(f"Error creating lock for job {job.name}: {e}")
+
+        while True:
+            now = datetime.utcnow()
+            for job in self.jobs.values():
+                if job.running or self._wake_at.get(job.name, NEVER) > now:
+                    continue
+                try:
+                    lock = await self._acquire(job, now)
+                except Exception as e:
+                    logger.error(f"Error acquiring lease for job {job.name}: {e}")
+                    continue
+                if lock is not None:
+                    self._launch(job, lock)
+
+            await asyncio.sleep(self.poll_seconds)
+
+    async def _ensure_lock(self, job: Job):
+        try:
+            await self.db.scheduler_locks.update_one(
+                {"_id": job.name},
+                {"$setOnInsert": {
+                    "owner": None,
+                    "lease_until": NEVER,
+                    "next_run_at": job.first_run(datetime.utcnow())
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Another worker created it at the same moment
+            pass
+
+    async def _acquire(self, job: Job, now: datetime) -> Optional[dict]:
+        """Take the job's lease if it is due and free; None otherwise"""
+        lock = await self.db.scheduler_locks.find_one_and_update(
+            {
+                "_id": job.name,
+                "next_run_at": {"$lte": now},
+                "lease_until": {"$lte": now}
+            },
+            {"$set": {
+                "owner": self.worker_id,
+                "lease_until": now + timedelta(seconds=job.lease_seconds),
+                "last_started_at": now
+            }},
+            return_document=ReturnDocument.BEFORE
+        )
+        if lock is not None:
+            return lock
+
+        # Not due or held elsewhere: don't ask again before it could change
+        current = await self.db.scheduler_locks.find_one({"_id": job.name})
+        if current is None:
+            await self._ensure_lock(job)
+            return None
+        self._wake_at[job.name] = max(current["next_run_at"], current["lease_until"])
+        return None
+
+    def _launch(self, job: Job, lock: dict):
+        job.running = True
+        task = asyncio.create_task(self._execute(job, lock.get("last_success_at")))
+        self._job_tasks.add(task)
+        task.add_done_callback(self._job_tasks.discard)
+
+    async def _execute(self, job: Job, last_success_at: Optional[datetime]):
+        started_at = datetime.utcnow()
+        started = time.monotonic()
+        heartbeat = asyncio.create_task(self._renew_lease(job))
+        error = None
+
+        try:
+            await asyncio.wait_for(job.func(self.db, last_success_at), job.timeout_seconds)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.error(f"Job {job.name} failed: {error}")
+        finally:
+            heartbeat.cancel()
+
+        finished_at = datetime.utcnow()
+        duration_ms = round((time.monotonic() - started) * 1000, 1)
+        job.runs_total += 1
+        if error:
+            job.failures_total += 1
+
+        next_run_at = job.next_run(started_at, finished_at)
+        release = {
+            "owner": None,
+            "lease_until": finished_at,
+            "next_run_at": next_run_at,
+            "last_status": "failed" if error else "success",
+            "last_duration_ms": duration_ms,
+            "last_error": error
+        }
+        if not error:
+            release["last_success_at"] = started_at
+
+        try:
+            await self.db.scheduler_locks.update_one(
+                {"_id": job.name, "owner": self.worker_id},
+                {"$set": release}
+            )
+            await self.db.scheduler_runs.insert_one({
+                "job": job.name,
+                "worker": self.worker_id,
+                "status": release["last_status"],
+                "started_at": started_at,
+                "finished_at": finished_at,
+                "duration_ms": duration_ms,
+                "error": error
+            })
+        except Exception as e:
+            logger.error(f"Error recording run of job {job.name}: {e}")
+        finally:
+            self._wake_at[job.name] = next_run_at
+            job.running = False
+
+        logger.info(f"Job {job.name} finished in {duration_ms}ms ({release['last_status']})")
+
+    async def _renew_lease(self, job: Job):
+        """Keep extending the lease while the job runs on this worker"""
+        while True:
+            await asyncio.sleep(job.lease_seconds / 3)
+            try:
+                result = await self.db.scheduler_locks.update_one(
+                    {"_id": job.name, "owner": self.worker_id},
+                    {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=job.lease_seconds)}}
+                )
+                if result.matched_count == 0:
+                    logger.warning(f"Lost the lease of job {job.name} while it was running")
+                    return
+            except Exception as e:
+                logger.error(f"Error renewing lease of job {job.name}: {e}")
+
+scheduler = JobScheduler(poll_seconds=float(os.environ.get("SCHEDULER_POLL_SECONDS", "5")))
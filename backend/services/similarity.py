@@ -0,0 +1,231 @@
+import asyncio
+import math
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import DeleteMany, ReplaceOne
+from models.business import card_image_url
+from services.tracing import traced_methods
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOP_K = int(os.environ.get("SIMILAR_TOP_K", "8"))
+# Share of the score from attributes; the rest comes from proximity
+ATTRIBUTE_WEIGHT = float(os.environ.get("SIMILAR_ATTRIBUTE_WEIGHT", "0.75"))
+# Proximity halves roughly every 3.5 km at the default 5 km scale
+DISTANCE_SCALE_KM = float(os.environ.get("SIMILAR_DISTANCE_SCALE_KM", "5"))
+# Rows of the similarity matrix computed at once, bounding memory to
+# BLOCK_ROWS x category size
+BLOCK_ROWS = 1024
+
+PRICE_LEVELS = {"$": 0.0, "$$": 1.0, "$$$": 2.0, "$$$$": 3.0}
+
+FEATURE_PROJECTION = {
+    "name": 1, "category": 1, "subcategory": 1, "services": 1, "price_range": 1,
+    "rating_average": 1, "total_reviews": 1, "address": 1, "images": 1
+}
+
+def feature_matrix(businesses: List[dict]) -> np.ndarray:
+    """L2-normalized attribute vectors of businesses of one category.
+
+    Subcategory is one-hot and services multi-hot (scaled to unit length);
+    price level, rating and log review count are standardized within the
+    category so they pull similar businesses together in both directions.
+    """
+    n = len(businesses)
+    subcategories = sorted({business.get("subcategory") or "" for business in businesses})
+    services = sorted({service for business in businesses for service in business.get("services") or []})
+    subcategory_index = {name: i for i, name in enumerate(subcategories)}
+    service_index = {name: i for i, name in enumerate(services)}
+
+    one_hot = np.zeros((n, len(subcategories)), dtype=np.float32)
+    multi_hot = np.zeros((n, len(services)), dtype=np.float32)
+    numeric = np.zeros((n, 3), dtype=np.float32)
+
+    for row, business in enumerate(businesses):
+        one_hot[row, subcategory_index[business.get("subcategory") or ""]] = 1.0
+        for service in business.get("services") or []:
+            multi_hot[row, service_index[service]] = 1.0
+        numeric[row] = (
+            PRICE_LEVELS.get(business.get("price_range"), 1.0),
+            business.get("rating_average") or 0.0,
+            math.log1p(business.get("total_reviews") or 0)
+        )
+
+    service_norms = np.linalg.norm(multi_hot, axis=1, keepdims=True)
+    multi_hot /= np.where(service_norms > 0, service_norms, 1.0)
+
+    spread = numeric.std(axis=0)
+    numeric = (numeric - numeric.mean(axis=0)) / np.where(spread > 0, spread, 1.0)
+
+    features = np.hstack([one_hot, multi_hot, 0.5 * numeric])
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return features / np.where(norms > 0, norms, 1.0)
+
+def coordinates_km(businesses: List[dict]) -> np.ndarray:
+    """Equirectangular (x, y) in km, accurate enough within a metro area"""
+    coordinates = [((b.get("address") or {}).get("coordinates") or {}) for b in businesses]
+    lat = np.array([c.get("lat", 0.0) for c in coordinates], dtype=np.float64)
+    lng = np.array([c.get("lng", 0.0) for c in coordinates], dtype=np.float64)
+    scale = math.cos(math.radians(float(lat.mean()))) if len(lat) else 1.0
+    return np.column_stack([lng * 111.32 * scale, lat * 110.57])
+
+def top_neighbors(features: np.ndarray, points: np.ndarray, k: int):
+    """Yield (row, neighbor rows, scores) for every row, best first"""
+    n = len(features)
+    k = min(k, n - 1)
+    if k <= 0:
+        for row in range(n):
+            yield row, np.zeros(0, dtype=np.int64), np.zeros(0)
+        return
+
+    for start in range(0, n, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, n)
+        cosine = features[start:stop] @ features.T
+        distance = np.hypot(
+            points[start:stop, 0, None] - points[None, :, 0],
+            points[start:stop, 1, None] - points[None, :, 1]
+        )
+        scores = ATTRIBUTE_WEIGHT * cosine + (1 - ATTRIBUTE_WEIGHT) * np.exp(-distance / DISTANCE_SCALE_KM)
+        # A business is not similar to itself
+        scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+        for offset in range(stop - start):
+            yield start + offset, candidates[offset], candidate_scores[offset]
+
+def neighbor_operations(category: str, businesses: List[dict], now: datetime) -> list:
+    """Upserts of the top-k entries of a category's businesses (CPU-bound)"""
+    if not businesses:
+        return []
+    features = feature_matrix(businesses)
+    points = coordinates_km(businesses)
+    return [
+        ReplaceOne(
+            {"_id": businesses[row]["_id"]},
+            {
+                "category": category,
+                "neighbors": [summary(businesses[i], score) for i, score in zip(neighbors, scores)],
+                "updated_at": now
+            },
+            upsert=True
+        )
+        for row, neighbors, scores in top_neighbors(features, points, TOP_K)
+    ]
+
+def summary(business: dict, score: float) -> dict:
+    address = business.get("address") or {}
+    return {
+        "id": str(business["_id"]),
+        "name": business["name"],
+        "category": business["category"],
+        "subcategory": business.get("subcategory") or "",
+        "neighborhood": address.get("neighborhood", ""),
+        "city": address.get("city", ""),
+        "price_range": business.get("price_range", "$$"),
+        "rating_average": business.get("rating_average", 0.0),
+        "total_reviews": business.get("total_reviews", 0),
+        "card_image": card_image_url(business.get("images")),
+        "score": round(float(score), 4)
+    }
+
+# Categories being refreshed in the background after a lookup miss
+_background_refreshes: Dict[str, asyncio.Task] = {}
+
+@traced_methods
+class SimilarityService:
+    """Precomputed top-k similar businesses, blocked by category.
+
+    Every business in a category is compared with every other one in that
+    category only; results, with the neighbors' display fields embedded,
+    are stored one document per business in ``business_similar`` so the
+    endpoint is a single ``_id`` lookup.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.collection = db.business_similar
+
+    async def get_similar(self, business_id: str, limit: int = TOP_K) -> Optional[List[dict]]:
+        """Similar businesses, or None if the business does not exist"""
+        if not ObjectId.is_valid(business_id):
+            return None
+
+        entry = await self.collection.find_one({"_id": ObjectId(business_id)}, {"neighbors": 1})
+        if entry is None:
+            # Created since the last refresh: answer empty rather than
+            # computing a whole category inline, and refresh it in the background
+            business = await self.db.businesses.find_one(
+                {"_id": ObjectId(business_id), "is_active": True}, {"category": 1}
+            )
+            if business is None:
+                return None
+            self._schedule_refresh(business["category"])
+            return []
+
+        return entry.get("neighbors", [])[:limit]
+
+    def _schedule_refresh(self, category: str):
+        if category in _background_refreshes:
+            return
+        task = asyncio.create_task(self._background_refresh(category))
+        _background_refreshes[category] = task
+        task.add_done_callback(lambda _: _background_refreshes.pop(category, None))
+
+    async def _background_refresh(self, category: str):
+        try:
+            await self._refresh_category(category)
+        except Exception as e:
+            logger.error(f"Error refreshing similar businesses of {category}: {e}")
+
+    async def rebuild(self):
+        """Recompute every category"""
+        categories = await self.db.businesses.distinct("category", {"is_active": True})
+        await self.refresh_categories(categories)
+        # Categories left without active businesses
+        await self.collection.delete_many({"category": {"$nin": categories}})
+
+    async def refresh_changed(self, since: datetime) -> List[str]:
+        """Recompute the categories touched by businesses updated since a moment"""
+        changed = await self.db.businesses.find(
+            {"updated_at": {"$gte": since}}, {"category": 1}
+        ).to_list(length=None)
+        if not changed:
+            return []
+
+        changed_ids = [business["_id"] for business in changed]
+        categories = {business["category"] for business in changed}
+        # A business that moved or was deactivated still appears in its old
+        # category's entries, including its own
+        categories.update(await self.collection.distinct(
+            "category",
+            {"$or": [{"_id": {"$in": changed_ids}}, {"neighbors.id": {"$in": [str(i) for i in changed_ids]}}]}
+        ))
+        await self.refresh_categories(categories)
+        return sorted(categories)
+
+    async def refresh_categories(self, categories: Iterable[str]):
+        for category in categories:
+            await self._refresh_category(category)
+
+    async def _refresh_category(self, category: str):
+        businesses = await self.db.businesses.find(
+            {"category": category, "is_active": True}, FEATURE_PROJECTION
+        ).to_list(length=None)
+
+        # Keep the event loop serving requests while NumPy works
+        operations = await asyncio.to_thread(neighbor_operations, category, businesses, datetime.utcnow())
+        operations.append(DeleteMany({
+            "category": category,
+            "_id": {"$nin": [business["_id"] for business in businesses]}
+        }))
+        await self.collection.bulk_write(operations, ordered=False)
+        logger.info(f"Refreshed similar businesses of {category} ({len(businesses)} businesses)")
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Collapses identical concurrent calls into one in-flight database call.
+
+    The first caller for a key runs the query; every caller arriving while it
+    is still running awaits the same future instead of issuing its own query.
+    Results are not kept after the call completes (that is what caches are
+    for), so there is no staleness beyond the duration of one query.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+        self.calls = 0
+        self.executions = 0
+        self.hits = 0
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+
+        flight_registry.append(self)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        future = self._calls.get(key)
+
+        if future is not None:
+            self.hits += 1
+            started = time.monotonic()
+            try:
+                # Shielded so a cancelled follower does not cancel the leader
+                return await asyncio.shield(future)
+            finally:
+                waited = time.monotonic() - started
+                self.wait_seconds_total += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        self.executions += 1
+        future = asyncio.ensure_future(fn())
+        self._calls[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled() and future.exception() is not None:
+            logger.debug(f"Single-flight {self.name} call {key!r} failed: {future.exception()}")
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "executions": self.executions,
+            "hits": self.hits,
+            "hit_ratio": round(self.hits / self.calls, 3) if self.calls else 0.0,
+            "avg_wait_seconds": round(self.wait_seconds_total / self.hits, 4) if self.hits else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 4),
+        }
+
+flight_registry: List[SingleFlight] = []
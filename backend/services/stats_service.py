@@ -0,0 +1,47 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.single_flight import SingleFlight
+from services.location_service import LocationService
+from services.tracing import traced_methods
+import logging
+
+logger = logging.getLogger(__name__)
+
+stats_flight = SingleFlight("stats")
+
+@traced_methods
+class StatsService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def get_platform_stats(self) -> dict:
+        """Get platform statistics for homepage"""
+        return await stats_flight.do("platform", self._compute_platform_stats)
+
+    async def _compute_platform_stats(self) -> dict:
+        # Average rating across all businesses
+        pipeline = [
+            {"$match": {"is_active": True, "total_reviews": {"$gt": 0}}},
+            {"$group": {
+                "_id": None,
+                "avg_platform_rating": {"$avg": "$rating_average"}
+            }}
+        ]
+        
+        # The four queries are independent, so run them concurrently
+        total_businesses, total_reviews, cities, result = await asyncio.gather(
+            self.db.businesses.count_documents({"is_active": True}),
+            self.db.reviews.count_documents({}),
+            LocationService(self.db).get_city_names(),
+            self.db.businesses.aggregate(pipeline).to_list(1)
+        )
+        
+        avg_rating = round(result[0]["avg_platform_rating"], 1) if result else 0.0
+        
+        return {
+            "total_businesses": total_businesses,
+            "total_reviews": total_reviews,
+            "total_cities": len(cities),
+            "average_rating": avg_rating,
+            "cities": cities
+        }
@@ -0,0 +1,327 @@
+"""Request tracing with W3C trace context.
+
+Each sampled request gets a server span (see middleware/tracing.py). Spans
+for service methods (``traced_methods``) and Mongo commands
+(``MongoCommandTracer``, a pymongo command listener) become its children
+through the ``current_span`` context variable. Motor copies the context
+into its executor threads, so command events see the span that awaited
+them.
+
+Finished spans are queued and exported in batches from a background
+thread. They are written as JSON lines to TRACE_FILE, or posted as
+OTLP/HTTP JSON to TRACE_OTLP_ENDPOINT. When the queue is full, spans are
+dropped and counted.
+"""
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import re
+import tempfile
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from pymongo import monitoring
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "file")
+TRACE_FILE = os.environ.get("TRACE_FILE", os.path.join(tempfile.gettempdir(), "asteria-traces.jsonl"))
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "asteria-local-api")
+TRACE_QUEUE_SIZE = int(os.environ.get("TRACE_QUEUE_SIZE", "10000"))
+TRACE_BATCH_SIZE = int(os.environ.get("TRACE_BATCH_SIZE", "512"))
+TRACE_FLUSH_SECONDS = float(os.environ.get("TRACE_FLUSH_SECONDS", "2"))
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+INVALID_TRACE_ID = "0" * 32
+INVALID_SPAN_ID = "0" * 16
+
+# OTLP span kinds
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+class Span:
+    """One timed operation; only sampled spans are created below the root"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "sampled",
+                 "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 kind: str = "internal", attributes: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64).to_bytes(8, "big").hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, end_ns: Optional[int] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if self.sampled:
+            exporter.submit(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace id, parent span id, sampled) from a W3C traceparent header"""
+    if not header:
+        return None
+    match = TRACEPARENT_RE.match(header.strip().lower())
+    if not match:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == INVALID_TRACE_ID or parent_id == INVALID_SPAN_ID:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+def start_request_span(name: str, traceparent: Optional[str], attributes: Optional[dict] = None) -> Span:
+    """Root span of a request, continuing the caller's trace if it sent one.
+
+    The caller's sampling decision is kept; otherwise TRACE_SAMPLE_RATE
+    decides. Unsampled spans still carry ids so the trace context
+    propagates, but nothing below them is recorded.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id = random.getrandbits(128).to_bytes(16, "big").hex(), None
+        sampled = random.random() < TRACE_SAMPLE_RATE
+    return Span(name, trace_id, parent_id, sampled, "server", attributes)
+
+def start_child_span(name: str, kind: str = "internal", attributes: Optional[dict] = None) -> Optional[Span]:
+    parent = current_span.get()
+    if parent is None or not parent.sampled:
+        return None
+    return Span(name, parent.trace_id, parent.span_id, True, kind, attributes)
+
+@contextmanager
+def span(name: str, kind: str = "internal", attributes: Optional[dict] = None):
+    """Record a child of the current span, if the request is sampled"""
+    child = start_child_span(name, kind, attributes)
+    if child is None:
+        yield None
+        return
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current_span.reset(token)
+        child.end()
+
+def traced(name: str):
+    """Decorator recording each call of a coroutine function as a span"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            parent = current_span.get()
+            if parent is None or not parent.sampled:
+                return await func(*args, **kwargs)
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def traced_methods(cls):
+    """Class decorator tracing every public coroutine method as ``Class.method``"""
+    for attr, value in list(vars(cls).items()):
+        if not attr.startswith("_") and inspect.iscoroutinefunction(value):
+            setattr(cls, attr, traced(f"{cls.__name__}.{attr}")(value))
+    return cls
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """pymongo command listener recording each command as a client span"""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[int, tuple], Span] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        command = event.command
+        collection = command.get(event.command_name)
+        attributes = {
+            "db.system": "mongodb",
+            "db.name": event.database_name,
+            "db.operation": event.command_name,
+        }
+        if isinstance(collection, str):
+            attributes["db.mongodb.collection"] = collection
+        host, port = event.connection_id[:2] if isinstance(event.connection_id, tuple) else (event.connection_id, None)
+        attributes["net.peer.name"] = str(host)
+        if port is not None:
+            attributes["net.peer.port"] = port
+
+        child = start_child_span(f"mongodb.{event.command_name}", "client", attributes)
+        if child is not None:
+            with self._lock:
+                self._pending[(event.request_id, event.connection_id)] = child
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        child = self._finish(event)
+        if child is not None:
+            child.error = str(event.failure)
+
+    def _finish(self, event) -> Optional[Span]:
+        with self._lock:
+            child = self._pending.pop((event.request_id, event.connection_id), None)
+        if child is not None:
+            # Use the driver's timing, which excludes executor queueing
+            child.end(child.start_ns + event.duration_micros * 1000)
+        return child
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def otlp_request(spans: List[Span]) -> dict:
+    """OTLP/HTTP JSON ExportTraceServiceRequest for a batch of spans"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": "asteria-local"},
+            "spans": [{
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                "name": s.name,
+                "kind": SPAN_KINDS[s.kind],
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            } for s in spans]
+        }]
+    }]}
+
+class SpanExporter:
+    """Bounded queue of finished spans drained in batches by a daemon thread"""
+
+    def __init__(self, kind: str = TRACE_EXPORTER, queue_size: int = TRACE_QUEUE_SIZE,
+                 batch_size: int = TRACE_BATCH_SIZE, flush_seconds: float = TRACE_FLUSH_SECONDS):
+        if kind not in ("file", "otlp"):
+            raise ValueError(f"Unknown trace exporter {kind!r}")
+        self.kind = kind
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.exported_total = 0
+        self.dropped_total = 0
+        self.last_error: Optional[str] = None
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Export what is queued and stop the thread"""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def submit(self, finished: Span):
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped_total += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": TRACING_ENABLED,
+            "exporter": self.kind,
+            "sample_rate": TRACE_SAMPLE_RATE,
+            "queued": self._queue.qsize(),
+            "exported_total": self.exported_total,
+            "dropped_total": self.dropped_total,
+            "last_error": self.last_error,
+        }
+
+    def _run(self):
+        running = True
+        while running:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            if batch:
+                self._export(batch)
+
+    def _export(self, batch: List[Span]):
+        try:
+            if self.kind == "otlp":
+                request = urllib.request.Request(
+                    TRACE_OTLP_ENDPOINT,
+                    data=json.dumps(otlp_request(batch)).encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                    method="POST"
+                )
+                with urllib.request.urlopen(request, timeout=10):
+                    pass
+            else:
+                with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(s.to_dict(), default=str) + "\n" for s in batch))
+            self.exported_total += len(batch)
+        except Exception as e:
+            # Tracing must never take the API down; the batch is lost
+            self.dropped_total += len(batch)
+            if str(e) != self.last_error:
+                logger.warning(f"Could not export {len(batch)} spans: {e}")
+            self.last_error = str(e)
+
+exporter = SpanExporter()
+mongo_command_tracer = MongoCommandTracer()
@@ -0,0 +1,118 @@
+"""Time-decayed review velocity ("trending") scores.
+
+A business's ``trend_score`` is the sum over its reviews of
+``rating / 5 * exp(-rate * age)``, with ``rate`` set by
+TRENDING_HALF_LIFE_HOURS. The score is stored decayed to
+``trend_decayed_at``, which is enough to maintain it without touching
+review history:
+
+* a new review decays the stored score to now and adds the review's
+  weight, in one pipeline update;
+* the periodic decay job brings every score to the same moment with one
+  ``update_many``, so the ``trend_score`` indexes order businesses
+  correctly. Scores that decay below TRENDING_MIN_SCORE are zeroed and
+  drop out of the trending lists.
+
+A nightly rebuild recomputes the scores from recent reviews, which fixes
+drift from reviews written outside the API.
+"""
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateMany, UpdateOne
+from services.cache import invalidation_bus
+from services.version_service import VersionService
+from services.tracing import traced_methods
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", "72"))
+TRENDING_MIN_SCORE = float(os.environ.get("TRENDING_MIN_SCORE", "0.01"))
+# Decay per millisecond, the unit of date differences in MongoDB
+DECAY_RATE = math.log(2) / (TRENDING_HALF_LIFE_HOURS * 3600 * 1000)
+# Reviews older than this contribute less than 0.1% of their weight
+REBUILD_WINDOW = timedelta(hours=TRENDING_HALF_LIFE_HOURS * 10)
+
+def review_weight(rating: int) -> float:
+    return rating / 5
+
+def decayed_score(now: datetime) -> dict:
+    """Expression for the stored trend score decayed to ``now``"""
+    return {"$multiply": [
+        {"$ifNull": ["$trend_score", 0]},
+        {"$exp": {"$multiply": [-DECAY_RATE, {"$subtract": [now, {"$ifNull": ["$trend_decayed_at", now]}]}]}}
+    ]}
+
+@traced_methods
+class TrendingService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.collection = db.businesses
+
+    async def record_review(self, business_id: str, rating: int, created_at: datetime):
+        """Add a review's weight to its business's score"""
+        now = datetime.utcnow()
+        age_ms = max((now - created_at).total_seconds() * 1000, 0.0)
+        weight = review_weight(rating) * math.exp(-DECAY_RATE * age_ms)
+        await self.collection.update_one(
+            {"_id": ObjectId(business_id)},
+            [{"$set": {
+                "trend_score": {"$add": [decayed_score(now), weight]},
+                "trend_decayed_at": now
+            }}]
+        )
+        await VersionService(self.db).bump("businesses")
+        invalidation_bus.notify("businesses", "update", str(business_id), ["trend_score", "trend_decayed_at"])
+
+    async def decay(self, now: Optional[datetime] = None) -> int:
+        """Decay every non-zero score to ``now``; returns how many changed"""
+        now = now or datetime.utcnow()
+        result = await self.collection.update_many(
+            {"trend_score": {"$gt": 0}},
+            [{"$set": {
+                "trend_score": {"$let": {
+                    "vars": {"score": decayed_score(now)},
+                    "in": {"$cond": [{"$lt": ["$$score", TRENDING_MIN_SCORE]}, 0, "$$score"]}
+                }},
+                "trend_decayed_at": now
+            }}]
+        )
+        if result.modified_count:
+            await VersionService(self.db).bump("businesses")
+            invalidation_bus.notify("businesses", "update", fields=["trend_score", "trend_decayed_at"])
+        return result.modified_count
+
+    async def rebuild(self) -> int:
+        """Recompute every score from recent reviews; returns how many changed"""
+        now = datetime.utcnow()
+        pipeline = [
+            {"$match": {"created_at": {"$gte": now - REBUILD_WINDOW}}},
+            {"$group": {
+                "_id": "$business_id",
+                "score": {"$sum": {"$multiply": [
+                    {"$divide": ["$rating", 5]},
+                    {"$exp": {"$multiply": [-DECAY_RATE, {"$subtract": [now, "$created_at"]}]}}
+                ]}}
+            }},
+            {"$match": {"score": {"$gte": TRENDING_MIN_SCORE}}}
+        ]
+        scores = {doc["_id"]: doc["score"] async for doc in self.db.reviews.aggregate(pipeline)}
+
+        operations = [
+            UpdateOne({"_id": business_id}, {"$set": {"trend_score": score, "trend_decayed_at": now}})
+            for business_id, score in scores.items()
+        ]
+        # Businesses without recent reviews
+        operations.append(UpdateMany(
+            {"_id": {"$nin": list(scores)}, "trend_score": {"$gt": 0}},
+            {"$set": {"trend_score": 0, "trend_decayed_at": now}}
+        ))
+        result = await self.collection.bulk_write(operations, ordered=False)
+        await VersionService(self.db).bump("businesses")
+        invalidation_bus.notify("businesses", "update", fields=["trend_score", "trend_decayed_at"])
+        logger.info(f"Rebuilt trend scores of {len(scores)} businesses")
+        return result.modified_count
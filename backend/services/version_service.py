@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import Dict, Optional
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from services.cache import TTLCache, invalidation_bus, CACHE_TTL_SECONDS, CACHE_FALLBACK_TTL_SECONDS
+from services.tracing import traced_methods
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Version documents are tiny and read on every conditional list request, so
+# they are cached per worker; bumps are relayed by the change stream
+versions_cache = TTLCache(
+    "collection_versions",
+    ttl=CACHE_TTL_SECONDS,
+    fallback_ttl=CACHE_FALLBACK_TTL_SECONDS,
+    depends_on={"collection_versions": None}
+)
+
+@traced_methods
+class VersionService:
+    """Monotonic per-collection content versions used as list validators"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, session: Optional[AsyncIOMotorClientSession] = None):
+        self.db = db
+        self.collection = db.collection_versions
+        self.session = session
+
+    async def bump(self, *names: str):
+        """Record that the content of the given collections changed"""
+        now = datetime.utcnow()
+        for name in names:
+            document = await self.collection.find_one_and_update(
+                {"_id": name},
+                {"$inc": {"version": 1}, "$set": {"updated_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            invalidation_bus.notify("collection_versions", "update", name, ["version", "updated_at"], document)
+
+    async def get_versions(self, *names: str) -> Dict[str, dict]:
+        """Get ``{"version", "updated_at"}`` for each collection"""
+        key = tuple(sorted(names))
+        cached = versions_cache.get(key)
+        if cached is not None:
+            return cached
+
+        docs = await self.collection.find({"_id": {"$in": list(names)}}, session=self.session).to_list(length=len(names))
+        versions = {name: {"version": 0, "updated_at": None} for name in names}
+        for doc in docs:
+            versions[doc["_id"]] = {"version": doc.get("version", 0), "updated_at": doc.get("updated_at")}
+
+        versions_cache.set(key, versions, tags=[f"collection_versions:{name}" for name in names])
+        return versions
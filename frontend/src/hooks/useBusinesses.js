@@ -24,7 +24,7 @@ export const useFeaturedBusinesses = (limit = 10) => {
         reviews: business.total_reviews,
         category: business.category,
         neighborhood: business.address.neighborhood,
-        image: business.images[0] || 'https://images.unsplash.com/photo-1517248135467-4c7edcad34c4?w=300&h=200&fit=crop&crop=center',
+        image: business.card_image || 'https://images.unsplash.com/photo-1517248135467-4c7edcad34c4?w=300&h=200&fit=crop&crop=center',
         price: business.price_range,
         services: business.services,
         phone: business.phone,
@@ -70,7 +70,7 @@ export const useBusinessSearch = () => {
         reviews: business.total_reviews,
         category: business.category,
         neighborhood: business.address.neighborhood,
-        image: business.images[0] || 'https://images.unsplash.com/photo-1517248135467-4c7edcad34c4?w=300&h=200&fit=crop&crop=center',
+        image: business.card_image || 'https://images.unsplash.com/photo-1517248135467-4c7edcad34c4?w=300&h=200&fit=crop&crop=center',
         price: business.price_range,
         services: business.services,
         phone: business.phone
@@ -303,10 +303,10 @@ const CategoryPage = () => {
                   viewMode === 'list' ? 'hover:-translate-y-1' : 'hover:-translate-y-2'
                 }`}
               >
-                {viewMode === 'grid' && business.images && business.images[0] && (
+                {viewMode === 'grid' && business.card_image && (
                   <div className="h-48 overflow-hidden rounded-t-lg">
                     <img 
-                      src={business.images[0]} 
+                      src={business.card_image} 
                       alt={business.name}
                       className="w-full h-full object-cover transition-transform duration-300 group-hover:scale-110"
                     />
@@ -314,10 +314,10 @@ const CategoryPage = () => {
                 )}
 
                 <CardContent className={viewMode === 'list' ? 'p-6 flex items-center gap-6' : 'p-6'}>
-                  {viewMode === 'list' && business.images && business.images[0] && (
+                  {viewMode === 'list' && business.card_image && (
                     <div className="w-24 h-24 flex-shrink-0 overflow-hidden rounded-lg">
                       <img 
-                        src={business.images[0]} 
+                        src={business.card_image} 
                         alt={business.name}
                         className="w-full h-full object-cover"
                       />
@@ -6,14 +6,25 @@ const API_BASE = process.env.REACT_APP_BACKEND_URL + '/api';
 const apiClient = axios.create({
   baseURL: API_BASE,
   timeout: 10000,
+  // Repeat array params (?services=a&services=b), as FastAPI expects
+  paramsSerializer: { indexes: null },
   headers: {
     'Content-Type': 'application/json',
   }
 });
 
+// Read-your-writes: the token from our last write is sent with later reads
+// so they see that write even when served by a lagging replica
+const CAUSAL_TOKEN_MAX_AGE_MS = 120 * 1000;
+let causalToken = null;
+let causalTokenIssuedAt = 0;
+
 // Request interceptor
 apiClient.interceptors.request.use(
   (config) => {
+    if (causalToken && Date.now() - causalTokenIssuedAt < CAUSAL_TOKEN_MAX_AGE_MS) {
+      config.headers['X-Causal-Token'] = causalToken;
+    }
     console.log(`Making API request: ${config.method?.toUpperCase()} ${config.url}`);
     return config;
   },
@@ -26,6 +37,11 @@ apiClient.interceptors.request.use(
 // Response interceptor
 apiClient.interceptors.response.use(
   (response) => {
+    const token = response.headers['x-causal-token'];
+    if (token) {
+      causalToken = token;
+      causalTokenIssuedAt = Date.now();
+    }
     console.log(`API response: ${response.status} ${response.config.url}`);
     return response;
   },
@@ -0,0 +1,87 @@
+import base64
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import bson
+import pytest
+from bson import Timestamp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+# database.py requires these at import time (it connects lazily)
+with pytest.MonkeyPatch.context() as env:
+    env.setenv("MONGO_URL", os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    env.setenv("DB_NAME", os.environ.get("DB_NAME", "test"))
+    from services.causal import CAUSAL_TOKEN_MAX_AGE_SECONDS, decode_token, encode_token
+    from services.cache import InvalidationBus
+    from services.change_stream import resume_token_time
+
+CLUSTER_TIME = {"clusterTime": Timestamp(1700000000, 5), "signature": {"hash": b"\0" * 20, "keyId": 0}}
+
+def test_token_round_trip():
+    assert decode_token(encode_token(Timestamp(1700000000, 3), CLUSTER_TIME)) == (Timestamp(1700000000, 3), CLUSTER_TIME)
+
+@pytest.mark.parametrize("token", [None, "", "not base64!", "AAAA", encode_token(Timestamp(1700000001, 0), CLUSTER_TIME)])
+def test_unusable_tokens_are_ignored(token):
+    assert decode_token(token) is None
+
+def test_expired_tokens_are_ignored():
+    issued_at = datetime.utcnow() - timedelta(seconds=CAUSAL_TOKEN_MAX_AGE_SECONDS + 1)
+    payload = bson.encode({"o": Timestamp(1700000000, 3), "c": CLUSTER_TIME, "t": issued_at})
+    assert decode_token(base64.urlsafe_b64encode(payload).decode("ascii")) is None
+
+def test_resume_token_time():
+    token = {"_data": "8265539280000000052B022C0100296E5A1004" + "0" * 40}
+    assert resume_token_time(token) == Timestamp(0x65539280, 5)
+
+@pytest.mark.parametrize("token", [None, {}, {"_data": "82ZZ"}, {"_data": "8265539280"}, {"_data": "C265539280000000052B"}])
+def test_unparsable_resume_tokens(token):
+    assert resume_token_time(token) is None
+
+def test_caches_wait_for_the_relayed_time():
+    bus = InvalidationBus()
+    bus.stream_active = True
+    bus.relayed_through = Timestamp(1700000000, 4)
+    assert not bus.caught_up(Timestamp(1700000000, 5))
+    # An empty batch's post-batch resume token moves past the token's time
+    bus.relayed_through = resume_token_time({"_data": "82" + (1700000001).to_bytes(4, "big").hex() + "00000001" + "2B02"})
+    assert bus.caught_up(Timestamp(1700000000, 5))
+
+@pytest.fixture(scope="module")
+def replica_set():
+    if not os.environ.get("MONGO_URL"):
+        pytest.skip("MONGO_URL is not set")
+    from pymongo import MongoClient
+
+    client = MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=5000)
+    hello = client.admin.command("hello")
+    if "setName" not in hello or len(hello.get("hosts", [])) < 2:
+        client.close()
+        pytest.skip("MONGO_URL is not a replica set with secondaries")
+    yield client
+    client.close()
+
+def test_secondary_reads_see_tokened_writes(replica_set):
+    from pymongo import WriteConcern
+    from pymongo.read_concern import ReadConcern
+    from pymongo.read_preferences import Secondary
+
+    database = replica_set[os.environ.get("DB_NAME", "test") + "_causal"]
+    # Acknowledged by the primary alone, so secondaries are usually behind
+    writes = database.get_collection("probe", write_concern=WriteConcern(w=1))
+    reads = database.get_collection("probe", read_preference=Secondary(), read_concern=ReadConcern("majority"))
+    writes.delete_many({})
+
+    for i in range(50):
+        with replica_set.start_session(causal_consistency=True) as session:
+            writes.update_one({"_id": "probe"}, {"$set": {"n": i}}, upsert=True, session=session)
+            token = encode_token(session.operation_time, session.cluster_time)
+
+        operation_time, cluster_time = decode_token(token)
+        with replica_set.start_session(causal_consistency=True) as session:
+            session.advance_cluster_time(cluster_time)
+            session.advance_operation_time(operation_time)
+            assert reads.find_one({"_id": "probe"}, session=session)["n"] == i
+
+    writes.drop()
@@ -0,0 +1,69 @@
+import struct
+import sys
+from pathlib import Path
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from services.map_tiles import CLUSTER_MAX_ZOOM, FEATURE_DTYPE, TILE_EXTENT, TILE_MAGIC, TILE_VERSION, MapTileService, tile_for
+
+HEADER = "<4sBBIIHHI"
+FEATURE = "<HHHH12s"
+
+# _encode does not touch the database
+encoder = MapTileService.__new__(MapTileService)
+
+def decode(body: bytes):
+    magic, version, z, x, y, extent, category_count, feature_count = struct.unpack_from(HEADER, body)
+    offset = struct.calcsize(HEADER)
+    categories = []
+    for _ in range(category_count):
+        length = body[offset]
+        categories.append(body[offset + 1:offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+    features = list(struct.iter_unpack(FEATURE, body[offset:]))
+    assert len(features) == feature_count
+    return (magic, version, z, x, y, extent), categories, features
+
+def business(lat, lng, category):
+    return {"_id": ObjectId(), "category": category, "address": {"coordinates": {"lat": lat, "lng": lng}}}
+
+def test_feature_layout_matches_spec():
+    assert FEATURE_DTYPE.itemsize == struct.calcsize(FEATURE) == 20
+
+def test_encode_round_trip():
+    z = CLUSTER_MAX_ZOOM
+    x, y = tile_for(19.4326, -99.1332, z)
+    businesses = [business(19.4326, -99.1332, "Restaurantes"), business(19.4327, -99.1331, "Cafés")]
+
+    body = encoder._encode(z, x, y, businesses)
+    header, categories, features = decode(body)
+
+    assert header == (TILE_MAGIC, TILE_VERSION, z, x, y, TILE_EXTENT)
+    assert categories == ["Restaurantes", "Cafés"]
+    assert [(category, count, oid) for _, _, category, count, oid in features] == [
+        (0, 1, businesses[0]["_id"].binary),
+        (1, 1, businesses[1]["_id"].binary),
+    ]
+    assert all(0 <= px < TILE_EXTENT and 0 <= py < TILE_EXTENT for px, py, *_ in features)
+
+def test_low_zoom_clusters_same_category():
+    z = 3
+    x, y = tile_for(19.4326, -99.1332, z)
+    businesses = [business(19.4326, -99.1332, "Restaurantes"), business(19.4330, -99.1330, "Restaurantes")]
+
+    _, categories, features = decode(encoder._encode(z, x, y, businesses))
+
+    assert categories == ["Restaurantes"]
+    assert [(count, oid) for _, _, _, count, oid in features] == [(2, businesses[0]["_id"].binary)]
+
+def test_more_categories_than_a_byte_holds():
+    z = CLUSTER_MAX_ZOOM
+    x, y = tile_for(19.4326, -99.1332, z)
+    businesses = [business(19.4326, -99.1332, f"Categoría {i}") for i in range(300)]
+
+    _, categories, features = decode(encoder._encode(z, x, y, businesses))
+
+    assert len(categories) == 300
+    assert [categories[category] for _, _, category, _, _ in features] == [f"Categoría {i}" for i in range(300)]
@@ -0,0 +1,114 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from services.query_planner import LISTING_INDEXES, SORTS, QueryPlanner, UnsupportedQuery, index_name
+
+planner = QueryPlanner()
+
+SCOPE_VALUES = {"category": "Restaurantes", "city": "Ciudad de México", "neighborhood": "Roma Norte"}
+
+def test_every_declared_index_serves_a_shape():
+    used = {index_name(planner.index_for(scope, sort)) for scope, sort in planner.allowed_shapes()}
+    assert used == {index_name(keys) for keys in LISTING_INDEXES}
+
+def test_plan_picks_index_with_scope_then_sort():
+    plan = planner.plan(category="Restaurantes", city="Ciudad de México", sort="score")
+    assert plan.index_name == "category_1_address.city_key_1_is_active_1_bayesian_score_-1"
+    assert plan.filter == {"is_active": True, "category": "Restaurantes", "address.city_key": "ciudad-de-mexico"}
+    assert plan.sort == SORTS["score"]
+    assert plan.warnings == []
+
+def test_refinements_are_warned_about():
+    plan = planner.plan(price_range=["$", "$$"], services=["WiFi"], services_mode="any", is_verified=True)
+    assert plan.filter["price_range"] == {"$in": ["$", "$$"]}
+    assert plan.filter["services"] == {"$in": ["WiFi"]}
+    assert [warning.split()[0] for warning in plan.warnings] == ["price_range", "services", "is_verified"]
+
+def test_min_rating_bounds_rating_sort():
+    assert planner.plan(min_rating=4, sort="rating").warnings == []
+    assert planner.plan(min_rating=4, sort="score").warnings[0].startswith("min_rating")
+
+def test_search_is_literal():
+    plan = planner.plan(search="a.*b")
+    assert plan.filter["$or"][0]["name"]["$regex"] == r"a\.\*b"
+
+@pytest.mark.parametrize("kwargs", [
+    {"sort": "popular"},
+    {"services": ["WiFi"], "services_mode": "some"},
+    {"neighborhood": "Roma Norte"},
+    {"city": "Ciudad de México", "sort": "rating"},
+    {"category": "Restaurantes", "city": "Ciudad de México", "sort": "newest"},
+])
+def test_unsupported_shapes_are_rejected(kwargs):
+    with pytest.raises(UnsupportedQuery):
+        planner.plan(**kwargs)
+
+def _stages(plan):
+    stages = [plan["stage"]]
+    for child in plan.get("inputStages", []) + [plan[key] for key in ("inputStage", "queryPlan") if key in plan]:
+        stages.extend(_stages(child))
+    return stages
+
+def _index_names(plan):
+    names = [plan["indexName"]] if "indexName" in plan else []
+    for child in plan.get("inputStages", []) + [plan[key] for key in ("inputStage", "queryPlan") if key in plan]:
+        names.extend(_index_names(child))
+    return names
+
+@pytest.fixture(scope="module")
+def businesses():
+    if not os.environ.get("MONGO_URL"):
+        pytest.skip("MONGO_URL is not set")
+    from pymongo import MongoClient
+
+    client = MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=2000)
+    collection = client[os.environ.get("DB_NAME", "test") + "_query_planner"].businesses
+    collection.drop()
+    for keys in LISTING_INDEXES:
+        collection.create_index(keys)
+    # Decoy indexes the optimizer could prefer if a plan did not pin one
+    collection.create_index([("category", 1), ("is_active", 1)])
+    collection.create_index([("rating_average", -1), ("total_reviews", -1)])
+    collection.insert_many([
+        {
+            "name": f"Negocio {i}",
+            "description": "",
+            "category": ["Restaurantes", "Belleza"][i % 2],
+            "address": {"city_key": "ciudad-de-mexico", "neighborhood_key": ["roma-norte", "condesa"][i % 2]},
+            "price_range": "$$",
+            "services": ["WiFi"],
+            "is_verified": i % 3 == 0,
+            "is_active": True,
+            "rating_average": i % 5,
+            "total_reviews": i,
+            "bayesian_score": i / 10,
+            "created_at": i,
+        }
+        for i in range(50)
+    ])
+    yield collection
+    collection.drop()
+    client.close()
+
+@pytest.mark.parametrize("scope,sort", planner.allowed_shapes())
+def test_allowed_shapes_walk_their_index(businesses, scope, sort):
+    plan = planner.plan(
+        **{name: SCOPE_VALUES[name] for name in scope},
+        sort=sort,
+        price_range=["$$"],
+        services=["WiFi"],
+        is_verified=True,
+        min_rating=1,
+        search="negocio"
+    )
+    explain = businesses.find(plan.filter).sort(plan.sort).hint(plan.index).limit(20).explain()
+    winning = explain["queryPlanner"]["winningPlan"]
+    stages = _stages(winning)
+    assert "COLLSCAN" not in stages
+    assert "SORT" not in stages
+    assert _index_names(winning) == [plan.index_name]